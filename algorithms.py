@@ -7,12 +7,22 @@ deanonymization graph data
 
 import sklearn.cluster
 
-def get_algorithms(num_clusters):
+from analysis.community import LabelPropagation, Louvain
+from analysis.knn import KNNDensity
+from analysis.pic import PowerIterationClustering
+
+def get_algorithms(num_clusters, embedded=True):
+    """Given the number of clusters and whether the algorithms will be run on a spectral
+    embedding (True) or on the raw adjacency rows (False), produces the algorithms to be
+    run, each as (class, args, kwds). Distance thresholds are scaled to the feature space.
+    Algorithms whose class sets graph_input are given the similarity matrix itself
+
+    Returns algorithms (dictionary of name -> (class, tuple, dictionary))
+    """
     return {
         "KMeans": (sklearn.cluster.KMeans, (), {
             'n_clusters' : num_clusters,
-            'n_jobs' : -1,
-            'algorithm' : 'full'
+            'algorithm' : 'lloyd'
         }),
         
         "MiniBatchKMeans": (sklearn.cluster.MiniBatchKMeans, (), {
@@ -32,7 +42,25 @@ def get_algorithms(num_clusters):
         }),
         
         "DBSCAN": (sklearn.cluster.DBSCAN, (), {
-            'eps' : 10.0,
+            'eps' : 0.3 if embedded else 10.0,
             'n_jobs' : -1
+        }),
+
+        "DBSCAN-kNN": (KNNDensity, (sklearn.cluster.DBSCAN,), {
+            'eps' : 0.3 if embedded else 10.0,
+            'n_neighbors' : 15
+        }),
+
+        "OPTICS-kNN": (KNNDensity, (sklearn.cluster.OPTICS,), {
+            'min_samples' : 5,
+            'n_neighbors' : 15
+        }),
+
+        "LabelPropagation": (LabelPropagation, (), {}),
+
+        "Louvain": (Louvain, (), {}),
+
+        "PIC": (PowerIterationClustering, (), {
+            'n_clusters' : num_clusters
         })
     }
\ No newline at end of file
@@ -0,0 +1,126 @@
+"""
+__author__ = Yash Patel
+__name__   = anytime.py
+__description__ = Anytime spectral clustering under a wall-clock budget. The eigensolver is
+rerun with progressively tighter tolerances (each round warm-started from the last), and the
+best partition so far is returned once the budget runs out or the k-means assignments stop
+changing between rounds
+"""
+
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import ArpackNoConvergence, eigsh
+
+from analysis.operators import LaplacianOperator
+from analysis.randomized import eigen_residuals
+from analysis.spectral import kmeans_stage, labels_to_partitions, normalize_rows
+
+TOLERANCES = [1e-1, 1e-2, 1e-3, 1e-4, 1e-6, 0] # 0 is ARPACK's default (machine precision)
+
+def changed_fraction(previous, labels):
+    """Given two clusterings of the same nodes, matches their clusters one-to-one so as to
+    agree on as many nodes as possible (Hungarian algorithm on the confusion matrix)
+
+    Returns Fraction of nodes whose cluster changed under the best matching (float)
+    """
+    confusion = np.zeros((previous.max() + 1, labels.max() + 1), dtype=np.int64)
+    np.add.at(confusion, (previous, labels), 1)
+    rows, cols = linear_sum_assignment(-confusion)
+    return float(1.0 - confusion[rows, cols].sum() / float(len(labels)))
+
+def _round(L, k, tol, v0, maxiter):
+    """Given a shifted Laplacian operator, the number of eigenpairs k, the ARPACK tolerance,
+    the start vector, and the iteration cap, finds the k smallest eigenpairs of the
+    unshifted Laplacian to that tolerance. If ARPACK hits the cap after converging at
+    least k Ritz pairs, those are used rather than failing the round. Graphs too small for
+    ARPACK (k >= n - 1) are solved exactly with a dense eigendecomposition
+
+    Returns (1) eigenvalues (numpy array, increasing); (2) eigenvectors (n x k numpy array)
+    """
+    if k >= L.shape[0] - 1:
+        mu, U = np.linalg.eigh(L.toarray())
+        return L.shift - mu[::-1][:k], U[:, ::-1][:, :k]
+    try:
+        mu, U = eigsh(L, k=k, which='LA', tol=tol, v0=v0, maxiter=maxiter)
+    except ArpackNoConvergence as e:
+        if len(e.eigenvalues) < k:
+            raise
+        mu, U = e.eigenvalues, e.eigenvectors
+    order = np.argsort(mu)[::-1]
+    return L.shift - mu[order], U[:, order]
+
+def anytime_labels(S, k, budget, normalize=False, tolerances=TOLERANCES, stable=0.001,
+    n_init=10, random_state=None):
+    """Given a sparse similarity (adjacency) matrix S, the number of clusters k, a time budget
+    in seconds, whether the Laplacian is normalized, the sequence of eigensolver tolerances,
+    the fraction of changed assignments below which the clustering counts as stable, the
+    number of k-means restarts, and a random seed, runs spectral clustering in rounds of
+    tightening tolerance. Each round is warm-started from the previous eigenvectors, and
+    no round is started if the previous one suggests it would overrun the budget (the
+    first round always runs). Graphs too small for ARPACK take a single exact round
+
+    Returns (1) labels (numpy array of ints); (2) convergence info (dict): the tolerance
+    reached, the fraction of nodes changed in the last round, whether the assignments
+    converged, the elapsed time, and a per-round history
+    """
+    start = time.time()
+    L = LaplacianOperator(csr_matrix(S, dtype=np.float64), normalize=normalize)
+    shifted = L.shifted()
+    n = L.shape[0]
+    rng = np.random.RandomState(random_state)
+    v0 = rng.rand(n)
+    maxiter = 10 * n
+    if k >= n - 1:
+        tolerances = tolerances[-1:]
+
+    labels, history = None, []
+    for tol in tolerances:
+        round_start = time.time()
+        w, U = _round(shifted, k, tol, v0, maxiter)
+        embedding = normalize_rows(U) if normalize else U
+        new_labels, _ = kmeans_stage(embedding, k, n_init=n_init,
+            random_state=rng.randint(np.iinfo(np.int32).max))
+
+        changed = 1.0 if labels is None else changed_fraction(labels, new_labels)
+        labels = new_labels
+        v0 = U.sum(axis=1)
+
+        now = time.time()
+        residual = float(eigen_residuals(L, w, U).max())
+        history.append({ "tol" : tol, "time" : now - round_start,
+            "changed" : changed, "residual" : residual })
+        print("Anytime round (tol {}): {:.2%} of nodes changed, residual {:.3e}".format(
+            tol, changed, residual))
+
+        if changed <= stable:
+            break
+        if (now - start) + (now - round_start) > budget:
+            break
+
+    info = {
+        "tol"       : history[-1]["tol"],
+        "changed"   : history[-1]["changed"],
+        "residual"  : history[-1]["residual"],
+        "converged" : bool(history[-1]["changed"] <= stable),
+        "elapsed"   : time.time() - start,
+        "history"   : history
+    }
+    return labels, info
+
+def anytime_analysis(S, k, budget, normalize=False, tolerances=TOLERANCES, stable=0.001,
+    random_state=None):
+    """Given a sparse similarity (adjacency) matrix S, the number of clusters k, a time budget
+    in seconds, and the parameters of anytime_labels, runs budgeted spectral clustering.
+    Clusters are returned as a list of sets, where the contents of the first set are the
+    nodes that belong to "cluster 1"
+
+    Returns (1) Partitions (list of sets of ints); (2) convergence info (dict)
+    """
+    labels, info = anytime_labels(S, k, budget, normalize=normalize, tolerances=tolerances,
+        stable=stable, random_state=random_state)
+    print("Completed anytime partitioning in {:.3f}s (tol {}, converged: {})".format(
+        info["elapsed"], info["tol"], info["converged"]))
+    return labels_to_partitions(labels, k), info
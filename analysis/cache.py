@@ -0,0 +1,172 @@
+"""
+__author__ = Yash Patel
+__name__   = cache.py
+__description__ = Memoizes eigendecompositions of graph matrices, both in memory and
+on disk, so repeated spectral runs over the same graph skip the eigensolve
+"""
+
+import glob
+import hashlib
+import os
+import tempfile
+from collections import OrderedDict
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+from analysis.operators import LaplacianOperator
+
+CACHE_DIR        = "output/cache"
+MAX_CACHE_BYTES  = 1024 ** 3 # on-disk size cap before least recently used entries are evicted
+MAX_MEMORY_ITEMS = 256       # number of entries kept in memory for the current run
+MIN_DISK_NODES   = 1000      # matrices smaller than this are only memoized in memory
+
+def graph_fingerprint(M):
+    """Given a sparse (or dense) matrix M, computes a hash over its canonical CSR arrays,
+    so that the same graph produces the same fingerprint regardless of how it was built.
+    Laplacian operators are hashed through their adjacency matrix alone, so every consumer
+    of a graph shares its entries (the Laplacian type is the other part of the cache key)
+
+    Returns Fingerprint (hex string)
+    """
+    h = hashlib.sha1()
+    if isinstance(M, LaplacianOperator):
+        M = M.A
+    M = csr_matrix(M, dtype=np.float64)
+    M.sum_duplicates()
+    M.sort_indices()
+
+    h.update(np.array(M.shape, dtype=np.int64).tobytes())
+    h.update(M.indptr.astype(np.int64).tobytes())
+    h.update(M.indices.astype(np.int64).tobytes())
+    h.update(M.data.tobytes())
+    return h.hexdigest()
+
+class EmbeddingCache:
+    """Cache of eigenpairs keyed by (graph fingerprint, Laplacian type, k). Entries are
+    kept in memory for the current run and persisted to cache_dir as .npz files, with
+    the least recently used files evicted once the directory exceeds max_bytes. Since
+    eigenpairs are stored sorted by eigenvalue, a request for k eigenpairs is served by
+    any cached entry with at least k of them
+    """
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES,
+        max_memory_items=MAX_MEMORY_ITEMS, min_disk_nodes=MIN_DISK_NODES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_memory_items = max_memory_items
+        self.min_disk_nodes = min_disk_nodes
+        self.memory = OrderedDict()
+
+    def _path(self, fingerprint, laplacian, k):
+        return os.path.join(self.cache_dir, "{}_{}_{}.npz".format(fingerprint, laplacian, k))
+
+    def _remember(self, key, eigenpairs):
+        self.memory[key] = eigenpairs
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+
+    def get(self, fingerprint, laplacian, k):
+        """Given a graph fingerprint, the Laplacian type, and number of eigenpairs k,
+        looks up the k eigenpairs of smallest eigenvalue, marking the entry as recently used
+
+        Returns (1) eigenvalues (numpy array); (2) eigenvectors (n x k numpy array);
+        or None if no entry with at least k eigenpairs exists
+        """
+        for (cached_fp, cached_lap, cached_k), (w, U) in reversed(self.memory.items()):
+            if cached_fp == fingerprint and cached_lap == laplacian and cached_k >= k:
+                self.memory.move_to_end((cached_fp, cached_lap, cached_k))
+                return w[:k], U[:, :k]
+
+        candidates = []
+        for fn in glob.glob(os.path.join(self.cache_dir, "{}_{}_*.npz".format(
+            fingerprint, laplacian))):
+            cached_k = int(fn.rsplit("_", 1)[1].split(".npz")[0])
+            if cached_k >= k:
+                candidates.append((cached_k, fn))
+        if not candidates:
+            return None
+
+        cached_k, fn = min(candidates)
+        try:
+            with np.load(fn) as entry:
+                w, U = entry["eigenvalues"], entry["eigenvectors"]
+        except (OSError, ValueError, KeyError):
+            return None
+        os.utime(fn) # LRU order is tracked through modification times
+
+        self._remember((fingerprint, laplacian, cached_k), (w, U))
+        return w[:k], U[:, :k]
+
+    def put(self, fingerprint, laplacian, k, eigenvalues, eigenvectors):
+        """Given a graph fingerprint, the Laplacian type, number of eigenpairs k, and the
+        eigenpairs (sorted by eigenvalue), stores them in memory and, for large enough
+        graphs, on disk, evicting least recently used files beyond the size cap
+
+        Returns void
+        """
+        self._remember((fingerprint, laplacian, k), (eigenvalues, eigenvectors))
+        if eigenvectors.shape[0] < self.min_disk_nodes:
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # written under a unique name first, so concurrent processes never share a file
+        with tempfile.NamedTemporaryFile(dir=self.cache_dir, suffix=".tmp",
+            delete=False) as f:
+            np.savez(f, eigenvalues=eigenvalues, eigenvectors=eigenvectors)
+        os.replace(f.name, self._path(fingerprint, laplacian, k))
+        self._evict()
+
+    def _evict(self):
+        entries = []
+        for fn in glob.glob(os.path.join(self.cache_dir, "*.npz")):
+            try:
+                stat = os.stat(fn)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fn))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, fn in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(fn)
+            total -= size
+
+_default_cache = None
+
+def get_cache():
+    """Gets the cache shared by all spectral consumers in this process
+
+    Returns EmbeddingCache
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
+
+def cached_eigenpairs(M, k, laplacian, solve):
+    """Given the matrix M whose spectrum is wanted, the number of eigenpairs k, the
+    Laplacian type (used as part of the cache key), and a function producing the
+    eigenpairs when they are not cached, returns the k eigenpairs of smallest eigenvalue,
+    consulting the shared cache first. solve() must return (eigenvalues, eigenvectors)
+    and need not sort them. Laplacians of distributed adjacency operators are never cached
+
+    Returns (1) eigenvalues (numpy array); (2) eigenvectors (n x k numpy array)
+    """
+    # operators over an adjacency that only supports products (e.g. a DistributedAdjacency)
+    # have no local arrays to fingerprint, so they bypass the cache
+    cacheable = not isinstance(M, LaplacianOperator) or issparse(M.A)
+    if cacheable:
+        cache = get_cache()
+        fingerprint = graph_fingerprint(M)
+        cached = cache.get(fingerprint, laplacian, k)
+        if cached is not None:
+            return cached
+
+    w, U = solve()
+    order = np.argsort(w)
+    w, U = w[order], U[:, order]
+    if cacheable:
+        cache.put(fingerprint, laplacian, k, w, U)
+    return w, U
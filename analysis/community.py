@@ -0,0 +1,174 @@
+"""
+__author__ = Yash Patel
+__name__   = community.py
+__description__ = Graph-native community detection (label propagation and Louvain-style
+modularity optimization) run directly on the sparse similarity matrix. Both expose the
+scikit-learn fit_predict interface so that they can be registered in algorithms.py
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+def _neighbor_weights(S, nodes, labels):
+    """Given a sparse similarity (adjacency) matrix S (CSR), an array of nodes, and a label
+    per node, sums the edge weight from each of the given nodes to each label found among
+    its neighbors (self-loops excluded) in a single vectorized pass over their CSR rows
+
+    Returns (1) position of the node in nodes; (2) neighbor label; (3) total weight
+    (each numpy arrays, one entry per distinct (node, label) pair, sorted by node)
+    """
+    sub = S[nodes]
+    positions = np.repeat(np.arange(len(nodes)), np.diff(sub.indptr))
+    not_loop = sub.indices != nodes[positions]
+    positions = positions[not_loop]
+    neighbor_labels = labels[sub.indices[not_loop]]
+    weights = sub.data[not_loop]
+
+    order = np.lexsort((neighbor_labels, positions))
+    positions, neighbor_labels, weights = \
+        positions[order], neighbor_labels[order], weights[order]
+    if len(positions) == 0:
+        return positions, neighbor_labels, weights
+
+    starts = np.flatnonzero(np.concatenate(([True],
+        (positions[1:] != positions[:-1]) | (neighbor_labels[1:] != neighbor_labels[:-1]))))
+    return positions[starts], neighbor_labels[starts], np.add.reduceat(weights, starts)
+
+def _best_per_position(positions, scores):
+    """Given the node positions and scores of (node, label) pairs sorted by node, picks the
+    highest-scoring pair for each node
+
+    Returns Indices into the pairs of the best pair per node (numpy array of ints)
+    """
+    if len(positions) == 0:
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort((-scores, positions))
+    first = np.concatenate(([True], positions[order][1:] != positions[order][:-1]))
+    return order[first]
+
+def _compact(labels):
+    _, labels = np.unique(labels, return_inverse=True)
+    return labels
+
+class LabelPropagation:
+    """Asynchronous label propagation: nodes are visited in random chunks, and every node
+    in a chunk adopts the label carrying the largest total edge weight among its neighbors,
+    keeping its current label on ties. Updating chunk by chunk (rather than all nodes at
+    once) avoids the label oscillations of fully synchronous propagation
+    """
+    graph_input = True
+
+    def __init__(self, max_iter=100, n_chunks=8, tol=1e-4, random_state=None):
+        self.max_iter = max_iter
+        self.n_chunks = n_chunks
+        self.tol = tol
+        self.random_state = random_state
+
+    def fit_predict(self, S):
+        S = csr_matrix(S, dtype=np.float64)
+        n = S.shape[0]
+        rng = np.random.RandomState(self.random_state)
+        labels = np.arange(n)
+
+        for iteration in range(self.max_iter):
+            changed = 0
+            for chunk in np.array_split(rng.permutation(n), self.n_chunks):
+                positions, neighbor_labels, weights = _neighbor_weights(S, chunk, labels)
+                if len(positions) == 0:
+                    continue
+
+                current = labels[chunk[positions]]
+                scores = weights + 1e-9 * (neighbor_labels == current) \
+                    + 1e-12 * rng.random_sample(len(weights))
+                best = _best_per_position(positions, scores)
+
+                nodes = chunk[positions[best]]
+                changed += np.count_nonzero(labels[nodes] != neighbor_labels[best])
+                labels[nodes] = neighbor_labels[best]
+
+            if changed <= self.tol * n:
+                break
+        print("Label propagation converged after {} iterations".format(iteration + 1))
+        self.labels_ = _compact(labels)
+        return self.labels_
+
+class Louvain:
+    """Louvain-style modularity optimization. Each level moves nodes between communities
+    (chunk by chunk, vectorized within a chunk) whenever that increases modularity, then
+    aggregates every community into a single node (P^T A P) for the next level. Stops when
+    a level moves no nodes
+    """
+    graph_input = True
+
+    def __init__(self, max_levels=10, max_passes=20, n_chunks=8, tol=1e-4,
+        random_state=None):
+        self.max_levels = max_levels
+        self.max_passes = max_passes
+        self.n_chunks = n_chunks
+        self.tol = tol
+        self.random_state = random_state
+
+    def _local_moves(self, A, rng):
+        n = A.shape[0]
+        degrees = np.asarray(A.sum(axis=1)).ravel()
+        total = degrees.sum()
+        communities = np.arange(n)
+        community_degrees = degrees.copy()
+
+        moved_any = False
+        for _ in range(self.max_passes):
+            moved = 0
+            for chunk in np.array_split(rng.permutation(n), self.n_chunks):
+                positions, neighbor_comms, weights = _neighbor_weights(A, chunk, communities)
+                if len(positions) == 0:
+                    continue
+
+                nodes = chunk[positions]
+                own = communities[nodes]
+                k = degrees[nodes]
+                is_own = neighbor_comms == own
+
+                # modularity gain of joining a community, up to a shared positive factor
+                scores = weights - k * community_degrees[neighbor_comms] / total
+                scores[is_own] = weights[is_own] - k[is_own] * \
+                    (community_degrees[own[is_own]] - k[is_own]) / total
+
+                stay = -degrees[chunk] * (community_degrees[communities[chunk]] - degrees[chunk]) / total
+                stay[positions[is_own]] = scores[is_own]
+
+                candidates = ~is_own
+                best = _best_per_position(positions[candidates], scores[candidates])
+                best = np.flatnonzero(candidates)[best]
+                improves = scores[best] > stay[positions[best]] + 1e-12
+                best = best[improves]
+
+                movers, targets = chunk[positions[best]], neighbor_comms[best]
+                np.subtract.at(community_degrees, communities[movers], degrees[movers])
+                np.add.at(community_degrees, targets, degrees[movers])
+                communities[movers] = targets
+                moved += len(movers)
+
+            moved_any = moved_any or moved > 0
+            if moved <= self.tol * n:
+                break
+        return _compact(communities), moved_any
+
+    def fit_predict(self, S):
+        A = csr_matrix(S, dtype=np.float64)
+        rng = np.random.RandomState(self.random_state)
+        labels = np.arange(A.shape[0])
+
+        for level in range(self.max_levels):
+            communities, moved = self._local_moves(A, rng)
+            if not moved:
+                break
+            labels = communities[labels]
+
+            n = A.shape[0]
+            P = csr_matrix((np.ones(n), (np.arange(n), communities)),
+                shape=(n, communities.max() + 1))
+            A = (P.T @ A @ P).tocsr()
+            print("Louvain level {}: {} communities".format(level + 1, A.shape[0]))
+
+        self.labels_ = _compact(labels)
+        return self.labels_
@@ -0,0 +1,116 @@
+"""
+__author__ = Yash Patel
+__name__   = components.py
+__description__ = Splits the graph into its connected components before clustering. Small
+components are taken directly as clusters and large ones are clustered independently
+(in parallel), with the results stitched back together into a single partitioning
+"""
+
+import numpy as np
+from multiprocessing import Pool
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from analysis.operators import LaplacianOperator
+from analysis.spectral import spectral_labels, labels_to_partitions
+
+def label_components(S):
+    """Given a sparse similarity (adjacency) matrix S, labels each node with the
+    connected component it belongs to
+
+    Returns (1) number of components (int); (2) component labels (numpy array of ints);
+    (3) component sizes (numpy array of ints)
+    """
+    num_components, component_labels = connected_components(S, directed=False)
+    component_sizes = np.bincount(component_labels, minlength=num_components)
+    return num_components, component_labels, component_sizes
+
+def _allocate_clusters(sizes, k):
+    """Given the sizes of the large components and the number of clusters k that
+    are to be spread across them, allocates clusters proportionally to component
+    size, with at least one cluster per component and never more clusters than a
+    component can be split into by the eigensolver (size - 1)
+
+    Returns Clusters per component (numpy array of ints)
+    """
+    k = max(k, len(sizes))
+    shares = k * sizes / sizes.sum()
+    allocation = np.maximum(np.floor(shares).astype(int), 1)
+
+    remaining = k - allocation.sum()
+    if remaining > 0:
+        by_remainder = np.argsort(-(shares - np.floor(shares)))
+        allocation[by_remainder[:remaining]] += 1
+    return np.minimum(allocation, sizes - 1)
+
+def _cluster_component(component):
+    """Given a tuple of (component adjacency matrix, number of clusters), runs
+    spectral clustering on the component, with the eigenpairs of its matrix-free
+    Laplacian found by laplacian_eigenpairs (through the cache in spectral_labels).
+    Defined at module level so that it can be dispatched to a process pool
+
+    Returns Labels local to the component (numpy array of ints)
+    """
+    sub_S, k = component
+    if k <= 1:
+        return np.zeros(sub_S.shape[0], dtype=int)
+    return spectral_labels(LaplacianOperator(sub_S), k)
+
+def component_labels(S, k, min_size=100, processes=None):
+    """Given a sparse similarity (adjacency) matrix S, the total number of clusters k,
+    the size below which a component is taken directly as a cluster, and the number of
+    worker processes (None or 1 clusters the large components serially), clusters each
+    connected component independently. Every small component counts towards k, and the
+    remaining clusters are spread across the large components proportionally to size
+
+    Returns Labels with globally unique cluster ids (numpy array of ints)
+    """
+    S = csr_matrix(S)
+    num_components, comp_labels, comp_sizes = label_components(S)
+    print("Found {} connected components".format(num_components))
+
+    is_large = comp_sizes >= min_size
+    large_components = np.flatnonzero(is_large)
+    small_components = np.flatnonzero(~is_large)
+
+    # small components are their own clusters: ids [0, num_small)
+    cluster_of_component = np.full(num_components, -1, dtype=np.int64)
+    cluster_of_component[small_components] = np.arange(len(small_components))
+    labels = cluster_of_component[comp_labels]
+    if len(large_components) == 0:
+        return labels
+
+    # group nodes by component with a single sort rather than a scan per component
+    order = np.argsort(comp_labels, kind="stable")
+    boundaries = np.concatenate(([0], np.cumsum(comp_sizes)))
+    members = [order[boundaries[c]:boundaries[c+1]] for c in large_components]
+
+    large_k = _allocate_clusters(comp_sizes[large_components], k - len(small_components))
+    jobs = [(S[nodes][:, nodes], k_c) for nodes, k_c in zip(members, large_k)]
+    print("Clustering {} large components ({} small components assigned directly)".format(
+        len(jobs), len(small_components)))
+
+    if processes is None or processes == 1 or len(jobs) == 1:
+        local_labels = [_cluster_component(job) for job in jobs]
+    else:
+        with Pool(processes=processes) as pool:
+            local_labels = pool.map(_cluster_component, jobs)
+
+    next_cluster = len(small_components)
+    for nodes, local in zip(members, local_labels):
+        _, local = np.unique(local, return_inverse=True)
+        labels[nodes] = next_cluster + local
+        next_cluster += local.max() + 1
+    return labels
+
+def component_analysis(S, k, min_size=100, processes=None):
+    """Given a sparse similarity (adjacency) matrix S, the total number of clusters k,
+    the size below which a component is taken directly as a cluster, and the number of
+    worker processes, runs connected-component decomposed spectral clustering. Clusters
+    are returned as a list of sets, where the contents of the first set are the nodes
+    that belong to "cluster 1"
+
+    Returns Partitions (list of sets of ints)
+    """
+    labels = component_labels(S, k, min_size=min_size, processes=processes)
+    return labels_to_partitions(labels)
@@ -12,6 +12,7 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 from analysis.constants import colors
+from analysis.metrics import write_metrics
 from analysis.spectral import spectral_analysis, kmeans_analysis
 
 try:
@@ -27,7 +28,15 @@ def convert_compact_to_address(chain, compact):
     address_num = compact - (address_type << 29)
     return chain.address_from_index(address_num, blocksci.address_type(address_type))
 
-def write_results(partitions, index_to_id, fn):
+def write_results(partitions, index_to_id, fn, S=None, cluster_arrays=False):
+    """Given partitions of the node indices, the index_to_id mapping, the output name,
+    optionally the similarity matrix the indices refer to, and whether to save per-cluster
+    arrays, writes the partitions (as addresses) to output/{fn}.txt and output/{fn}.pickle,
+    and their quality metrics to output/{fn}_metrics.json (and output/{fn}_clusters.npz if
+    cluster_arrays is True) if S is given
+
+    Returns void
+    """
     try:
         chain = blocksci.Blockchain("/blocksci/bitcoin")
     except:
@@ -44,6 +53,8 @@ def write_results(partitions, index_to_id, fn):
             f.writelines("{} : {}\n".format(partition_id, node_addresses))
             partition_to_nodes[partition_id] = node_addresses
     pickle.dump(partition_to_nodes, open("output/{}.pickle".format(fn),"wb"))
+    if S is not None:
+        write_metrics(S, partitions, fn, cluster_arrays=cluster_arrays)
 
 def draw_results(G, pos, partitions, fn, weigh_edges=False, outliers=None):
     """Given a graph (G), the node positions (pos), the partitions on the nodes, the destination
@@ -0,0 +1,290 @@
+"""
+__author__ = Yash Patel
+__name__   = distributed.py
+__description__ = Row-partitioned distributed adjacency operator for eigensolves on graphs
+that do not fit in one process. Each worker (a local process, or a process on another host
+reached over a socket) owns a block of CSR rows and the list of columns they touch; per
+product the coordinator sends every worker only those entries of x (its halo) and stacks
+the row blocks of A x that come back. Workers on other hosts are started with
+"python3 -m analysis.distributed -a <host> -p <port> -k <authkey>". Messages are pickled,
+so anyone who can connect with the key can run code on a worker: workers listen on
+localhost by default, need an explicit key, and must only be exposed on a trusted network
+"""
+
+import getopt
+import sys
+import warnings
+from multiprocessing import Pipe, Process
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+from scipy.linalg import eigh, qr, svd
+from scipy.sparse import csr_matrix, load_npz, save_npz
+from scipy.sparse.linalg import LinearOperator
+
+from analysis.operators import LaplacianOperator
+
+def row_boundaries(n, num_blocks):
+    """Given the number of rows and the number of blocks, splits the rows into contiguous
+    blocks of (nearly) equal size
+
+    Returns Block boundaries (numpy array of num_blocks + 1 ints)
+    """
+    return np.linspace(0, n, num_blocks + 1).astype(np.int64)
+
+def save_row_blocks(S, prefix, num_blocks):
+    """Given a sparse similarity (adjacency) matrix S, a filename prefix, and the number of
+    blocks, saves contiguous row blocks of S to {prefix}_{block}.npz, so that workers can
+    each load their own block without the coordinator ever holding the whole matrix
+
+    Returns Block filenames (list of strs)
+    """
+    S = csr_matrix(S, dtype=np.float64)
+    boundaries = row_boundaries(S.shape[0], num_blocks)
+    fns = []
+    for block in range(num_blocks):
+        fn = "{}_{}.npz".format(prefix, block)
+        save_npz(fn, S[boundaries[block]:boundaries[block + 1]])
+        fns.append(fn)
+    return fns
+
+def _worker_loop(conn):
+    """Given a connection to the coordinator, serves its requests until told to stop:
+    ("load", block) with a CSR row block or the filename of one, answered with the columns
+    the block touches and its row sums, ("matmat", X_halo) answered with the block times X,
+    and ("close",)
+
+    Returns void
+    """
+    block = None
+    while True:
+        message = conn.recv()
+        if message[0] == "load":
+            block = message[1]
+            if isinstance(block, str):
+                block = load_npz(block)
+            block = csr_matrix(block, dtype=np.float64)
+            columns = np.unique(block.indices)
+            block = csr_matrix((block.data, np.searchsorted(columns, block.indices),
+                block.indptr), shape=(block.shape[0], len(columns)))
+            conn.send((columns, np.asarray(block.sum(axis=1)).ravel()))
+        elif message[0] == "matmat":
+            conn.send(block @ message[1])
+        else:
+            break
+    conn.close()
+
+def serve_worker(host, port, authkey):
+    """Given the host and port to listen on and the shared authentication key (required,
+    since the coordinator's messages are unpickled), waits for a coordinator to connect and
+    serves it as one worker
+
+    Returns void
+    """
+    if not authkey:
+        raise ValueError("A distributed worker needs an authentication key")
+    with Listener((host, port), authkey=authkey) as listener:
+        print("Distributed worker listening on {}:{}".format(host, port))
+        with listener.accept() as conn:
+            _worker_loop(conn)
+
+class DistributedAdjacency(LinearOperator):
+    """Adjacency matrix A split by rows across worker processes. blocks lists each worker's
+    rows, as CSR blocks or filenames from save_row_blocks, in row order. Without addresses,
+    one local process is started per block; otherwise each block is sent to the worker at
+    the matching (host, port) address, started with serve_worker with the same authkey
+    (required for remote workers). Products with a vector or a block of vectors cost one
+    round trip to every worker, carrying only the halo entries
+    """
+    def __init__(self, blocks, addresses=None, authkey=None):
+        if addresses is not None and not authkey:
+            raise ValueError("Remote workers need the authentication key they were started with")
+        self.processes = []
+        if addresses is None:
+            self.connections = []
+            for _ in blocks:
+                conn, child = Pipe()
+                process = Process(target=_worker_loop, args=(child,), daemon=True)
+                process.start()
+                child.close()
+                self.connections.append(conn)
+                self.processes.append(process)
+        else:
+            self.connections = [Client(tuple(address), authkey=authkey)
+                for address in addresses]
+
+        for conn, block in zip(self.connections, blocks):
+            conn.send(("load", block))
+        self.columns, row_sums = zip(*[conn.recv() for conn in self.connections])
+        self.degrees = np.concatenate(row_sums)
+        n = len(self.degrees)
+        super().__init__(np.float64, (n, n))
+
+    @classmethod
+    def from_matrix(cls, S, num_workers=4):
+        """Given a sparse similarity (adjacency) matrix S and the number of local worker
+        processes, splits S into contiguous row blocks, one per worker
+
+        Returns Distributed adjacency (DistributedAdjacency)
+        """
+        S = csr_matrix(S, dtype=np.float64)
+        boundaries = row_boundaries(S.shape[0], num_workers)
+        return cls([S[boundaries[block]:boundaries[block + 1]] for block in range(num_workers)])
+
+    def _matmat(self, X):
+        for conn, columns in zip(self.connections, self.columns):
+            conn.send(("matmat", X[columns]))
+        return np.vstack([conn.recv() for conn in self.connections])
+
+    def _matvec(self, x):
+        return self._matmat(np.reshape(x, (-1, 1))).ravel()
+
+    def _adjoint(self):
+        return self
+
+    def laplacian(self, normalize=False):
+        """Given whether the Laplacian is normalized, builds the Laplacian operator of the
+        distributed adjacency, with the degrees the workers reported
+
+        Returns Laplacian (LaplacianOperator)
+        """
+        return LaplacianOperator(self, normalize=normalize, degrees=self.degrees)
+
+    def close(self):
+        """Stops the workers and closes their connections
+
+        Returns void
+        """
+        for conn in self.connections:
+            try:
+                conn.send(("close",))
+                conn.close()
+            except (OSError, EOFError):
+                pass
+        for process in self.processes:
+            process.join()
+        self.connections, self.processes = [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _next_block(basis, W, threshold, rng):
+    """Given the Krylov basis so far (orthonormal columns), the image of its last block, the
+    norm below which a direction counts as deflated, and a random state, orthonormalizes
+    the image against the basis (twice, for full reorthogonalization). Directions that
+    vanish (the image of a converged eigenvector lies in the basis already) are replaced
+    with random vectors orthogonal to the basis, so the block keeps its width and the
+    expansion continues along the other directions
+
+    Returns Next block of the basis (numpy array, same shape as W)
+    """
+    for _ in range(2):
+        W = W - basis @ (basis.T @ W)
+    W, R = qr(W, mode="economic")
+    deflated = np.abs(np.diag(R)) < threshold
+    if not deflated.any():
+        return W
+
+    W[:, deflated] = rng.randn(W.shape[0], int(deflated.sum()))
+    for _ in range(2):
+        W = W - basis @ (basis.T @ W)
+    W, _ = qr(W, mode="economic")
+    return W
+
+def block_lanczos(L, k, block_size=None, num_blocks=20, max_restarts=50, tol=1e-8,
+    random_state=None):
+    """Given a Laplacian operator L, the number of eigenpairs k, the block size (default k),
+    the number of blocks per Krylov basis, the maximum number of restarts, the residual
+    tolerance (relative to the Gershgorin bound), and a random seed, finds the k smallest
+    eigenpairs of L by thick-restarted block Lanczos on the shifted Laplacian, with full
+    reorthogonalization. Every step multiplies a whole block at once, so a distributed
+    operator exchanges its halos once per block rather than once per vector. Each restart
+    keeps the best half of the Ritz vectors (with their images, so converged ones are
+    locked in at no extra products) and expands from the leading block_size directions of
+    their residuals, which is the block the Krylov space would have continued from.
+    Directions that deflate (e.g. the image of a converged eigenvector) are replaced with
+    random ones rather than ending the expansion. A RuntimeWarning is raised if
+    max_restarts runs out before convergence
+
+    Returns (1) eigenvalues (numpy array, increasing); (2) eigenvectors (n x k numpy array)
+    """
+    n = L.shape[0]
+    block_size = k if block_size is None else max(block_size, k)
+    num_blocks = min(num_blocks, n // block_size)
+    if num_blocks < 2:
+        w, U = np.linalg.eigh(L.toarray())
+        return w[:k], U[:, :k]
+
+    shifted = L.shifted()
+    threshold = 1e-10 * shifted.shift
+    rng = np.random.RandomState(random_state)
+    V, _ = qr(rng.randn(n, block_size), mode="economic")
+    Q, AQ = [V], [shifted @ V]
+    W = AQ[0]
+    keep = max(block_size, (num_blocks * block_size) // 2)
+    for restart in range(max_restarts):
+        while sum(block.shape[1] for block in Q) + block_size <= num_blocks * block_size:
+            Q.append(_next_block(np.hstack(Q), W, threshold, rng))
+            W = shifted @ Q[-1]
+            AQ.append(W)
+
+        basis, images = np.hstack(Q), np.hstack(AQ)
+        T = basis.T @ images
+        size = min(keep, T.shape[0])
+        mu, Y = eigh((T + T.T) / 2, subset_by_index=[T.shape[0] - size, T.shape[0] - 1])
+        mu, Y = mu[::-1], Y[:, ::-1]
+        V, AV = basis @ Y, images @ Y
+        R = AV - V * mu
+        residuals = np.linalg.norm(R[:, :k], axis=0)
+        if residuals.max() <= tol * shifted.shift:
+            break
+
+        # the residuals of the kept Ritz vectors span (up to rounding) a single block
+        U, sigma, _ = svd(R, full_matrices=False)
+        W = U[:, :block_size] * sigma[:block_size]
+        Q, AQ = [V], [AV]
+    else:
+        warnings.warn("block Lanczos did not converge in {} restarts (residual {:.3e}, "
+            "tolerance {:.3e})".format(max_restarts, residuals.max(),
+            tol * shifted.shift), RuntimeWarning)
+    return shifted.shift - mu[:k], V[:, :k]
+
+def _cmd_worker(argv):
+    """Parses arguments as specified by argv and returns as a dictionary. Entries
+    are parsed as specified in the help menu (visible by running
+    "python3 -m analysis.distributed -h")
+
+    Returns parameters dictionary
+    """
+    params = {
+        "host"    : "127.0.0.1",
+        "port"    : 8600,
+        "authkey" : None
+    }
+
+    USAGE_STRING = """analysis/distributed.py
+            -a <host>        [(str) interface to listen on for the coordinator (default localhost; trusted networks only)]
+            -k <authkey>     [(str) key shared with the coordinator (required)]
+            -p <port>        [(int) TCP port to listen on]"""
+
+    opts, args = getopt.getopt(argv,"ha:k:p:")
+    for opt, arg in opts:
+        if opt in ('-h'):
+            print(USAGE_STRING)
+            sys.exit()
+
+        elif opt in ("-a"): params["host"]    = arg
+        elif opt in ("-k"): params["authkey"] = arg
+        elif opt in ("-p"): params["port"]    = int(arg)
+
+    if not params["authkey"]:
+        print("An authentication key is required (-k)\n" + USAGE_STRING)
+        sys.exit(2)
+    return params
+
+if __name__ == "__main__":
+    params = _cmd_worker(sys.argv[1:])
+    serve_worker(params["host"], params["port"], params["authkey"].encode())
@@ -0,0 +1,49 @@
+"""
+__author__ = Yash Patel
+__name__   = embedding.py
+__description__ = Produces low-dimensional spectral embeddings of the similarity matrix
+that are used as feature matrices for the clustering algorithms
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import eigsh
+
+from analysis.cache import cached_eigenpairs
+from analysis.operators import LaplacianOperator
+from analysis.spectral import normalize_rows
+
+def _normalized_eigenpairs(S, d, v0=None):
+    """Given a sparse similarity (adjacency) matrix S, the number of eigenpairs d, and
+    optionally a start vector for ARPACK, finds the d eigenpairs of smallest eigenvalue of
+    the normalized Laplacian I - D^{-1/2} A D^{-1/2} from the largest eigenpairs of I - L,
+    which is D^{-1/2} A D^{-1/2} except on isolated nodes (zero rows of L, as for every
+    other consumer of the cached normalized eigenpairs)
+
+    Returns (1) eigenvalues (numpy array); (2) eigenvectors (n x d numpy array)
+    """
+    n = S.shape[0]
+    M = LaplacianOperator(S, normalize=True).shifted(1.0)
+
+    if d >= n - 1:
+        w, U = np.linalg.eigh(M @ np.eye(n))
+        w, U = w[::-1][:d], U[:, ::-1][:, :d]
+    else:
+        w, U = eigsh(M, k=d, which='LA', v0=v0)
+    return 1.0 - w, U
+
+def spectral_embedding(S, d, normalize=True):
+    """Given a sparse similarity (adjacency) matrix S and embedding dimension d, embeds
+    each node using the d eigenvectors of the smallest eigenvalues of the normalized
+    Laplacian. These are found as the largest eigenvectors of D^{-1/2} A D^{-1/2}, which
+    converges far faster in ARPACK than asking for the smallest eigenvalues directly.
+    The eigenpairs are looked up in the embedding cache first. If normalize is True,
+    the rows of the embedding are scaled to unit length (NJW)
+
+    Returns Embedding (n x d numpy array)
+    """
+    S = csr_matrix(S, dtype=np.float64)
+    _, U = cached_eigenpairs(S, d, "normalized", lambda : _normalized_eigenpairs(S, d))
+    if normalize:
+        U = normalize_rows(U)
+    return U
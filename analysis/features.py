@@ -0,0 +1,125 @@
+"""
+__author__ = Yash Patel
+__name__   = features.py
+__description__ = Behavioral features of every address, built from the heuristic byte of the
+raw edge records (which the similarity matrix drops) and from the similarity matrix itself:
+edge counts per heuristic value, degree, weighted degree, and summaries of the neighbors'
+degrees. Everything is accumulated in vectorized passes over the parsed columns (np.bincount,
+ufunc.at, and sparse sums of duplicate entries), and the matrix is cached next to the graph
+pickles
+"""
+
+import os
+import pickle
+
+import numpy as np
+from scipy.sparse import csr_matrix, hstack
+
+from blockchain.read import AddressIndex, get_data_fn, iter_edge_batches
+
+def heuristic_counts(fn, n, batch_records=1000000):
+    """Given an input filename of raw edge records, the number of addresses, and the number
+    of records per batch, counts the edges incident to every address under each heuristic
+    value, in one pass over the file. Addresses are numbered in order of first appearance,
+    as in get_data. Each batch is reduced to its distinct (address, heuristic) pairs, and
+    the sparse matrix is built once at the end
+
+    Returns (1) counts (n x num_values scipy-sparse CSR); (2) heuristic values (list of ints)
+    """
+    address_index = AddressIndex()
+    keys, key_counts = [], []
+    for address1, address2, heuristic in iter_edge_batches(fn, batch_records):
+        index1, index2 = address_index.map(address1, address2)
+        columns = heuristic.astype(np.int64) + 128
+        loops = index1 == index2
+        rows = np.concatenate((index1, index2[~loops]))
+        columns = np.concatenate((columns, columns[~loops]))
+        # each batch is reduced to its distinct (address, heuristic) pairs right away
+        batch_keys, batch_counts = np.unique(rows * 256 + columns, return_counts=True)
+        keys.append(batch_keys)
+        key_counts.append(batch_counts)
+
+    # the matrix is built once, summing pairs repeated across batches
+    keys = np.concatenate(keys) if keys else np.zeros(0, dtype=np.int64)
+    key_counts = np.concatenate(key_counts) if key_counts else np.zeros(0, dtype=np.int64)
+    counts = csr_matrix((key_counts.astype(np.float64), (keys // 256, keys % 256)),
+        shape=(n, 256))
+    counts.sum_duplicates()
+
+    values = np.flatnonzero(np.diff(counts.tocsc().indptr))
+    return counts[:, values].tocsr(), (values - 128).tolist()
+
+def behavioral_features(S, H=None, values=None):
+    """Given a sparse similarity (adjacency) matrix S and optionally the per-heuristic edge
+    counts of its addresses (with the heuristic values), builds the feature matrix: the
+    heuristic counts, then the number of counterparties, the weighted degree, and the mean
+    and max weighted degree of the counterparties
+
+    Returns (1) features (n x num_features scipy-sparse CSR); (2) feature names (list of strs)
+    """
+    S = csr_matrix(S, dtype=np.float64)
+    n = S.shape[0]
+    rows = np.repeat(np.arange(n), np.diff(S.indptr))
+    off_diagonal = rows != S.indices
+
+    counterparties = np.bincount(rows[off_diagonal], minlength=n).astype(np.float64)
+    weighted = np.bincount(rows, weights=S.data, minlength=n)
+
+    neighbor_degrees = weighted[S.indices[off_diagonal]]
+    neighbor_mean = np.divide(np.bincount(rows[off_diagonal], weights=neighbor_degrees,
+        minlength=n), counterparties, out=np.zeros(n), where=counterparties > 0)
+    neighbor_max = np.zeros(n)
+    np.maximum.at(neighbor_max, rows[off_diagonal], neighbor_degrees)
+
+    structural = csr_matrix(np.column_stack((counterparties, weighted,
+        neighbor_mean, neighbor_max)))
+    names = ["counterparties", "weighted_degree", "neighbor_mean_degree", "neighbor_max_degree"]
+    if H is None:
+        return structural, names
+    return (hstack((csr_matrix(H, dtype=np.float64), structural)).tocsr(),
+        ["heuristic_{}".format(value) for value in values] + names)
+
+def scale_features(F):
+    """Given a non-negative feature matrix, compresses heavy tails with log(1 + x) and scales
+    every column to a maximum of 1, keeping it sparse, so the features are on the same
+    scale as a row-normalized spectral embedding
+
+    Returns Scaled features (scipy-sparse CSR)
+    """
+    F = csr_matrix(F, dtype=np.float64, copy=True)
+    F.data = np.log1p(F.data)
+    column_max = np.asarray(F.max(axis=0).todense()).ravel()
+    column_max[column_max == 0] = 1.0
+    F.data /= column_max[F.indices]
+    return F
+
+def contract_rows(F, labels):
+    """Given a feature matrix and a label per row, sums the rows of every labelled group
+    (as contract_similarity does for the similarity matrix)
+
+    Returns Contracted features (scipy-sparse CSR)
+    """
+    n = F.shape[0]
+    P = csr_matrix((np.ones(n), (labels, np.arange(n))), shape=(labels.max() + 1, n))
+    return (P @ csr_matrix(F)).tocsr()
+
+def get_features(S, percent_bytes):
+    """Given the sparse similarity (adjacency) matrix S of a data fraction and the fraction
+    of bytes it was built from, loads its behavioral features from the cache next to the
+    graph pickles, or builds and caches them (with the heuristic counts, if the raw data
+    file is available)
+
+    Returns (1) features (scipy-sparse CSR); (2) feature names (list of strs)
+    """
+    fn = get_data_fn(percent_bytes)
+    pickle_features_fn = "blockchain/features_{0:f}.pickle".format(percent_bytes)
+    if os.path.exists(pickle_features_fn):
+        return pickle.load(open(pickle_features_fn, "rb"))
+
+    print("Building behavioral features...")
+    H, values = None, None
+    if os.path.exists(fn):
+        H, values = heuristic_counts(fn, S.shape[0])
+    features = behavioral_features(S, H, values)
+    pickle.dump(features, open(pickle_features_fn, "wb"))
+    return features
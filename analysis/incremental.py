@@ -0,0 +1,308 @@
+"""
+__author__ = Yash Patel
+__name__   = incremental.py
+__description__ = Incremental spectral clustering for edges that keep arriving. The smallest
+eigenpairs of the combinatorial Laplacian are updated by Rayleigh-Ritz on span(U, E_T), with
+T the nodes touched by a batch of edge insertions or weight changes, so an update costs time
+proportional to the change rather than the graph. Large batches fall back to LOBPCG warm
+started from the current eigenvectors, and only nodes whose embedding moved are reassigned
+"""
+
+import numpy as np
+from scipy.linalg import eigh
+from scipy.sparse import coo_matrix, csr_matrix, lil_matrix
+from scipy.sparse.linalg import lobpcg
+
+from analysis.operators import LaplacianOperator, laplacian_eigenpairs
+from analysis.spectral import kmeans_stage
+
+ORTHO_TOL = 1e-10 # Gram eigenvalue below which a touched direction counts as already in span(U)
+MAX_COND  = 1e8   # condition number of the correction frame beyond which it is applied
+
+def _nearest(X, centroids):
+    """Given embedded rows and the centroids, finds the nearest centroid of every row
+
+    Returns Labels (numpy array of ints)
+    """
+    distances = (X ** 2).sum(axis=1)[:, np.newaxis] - 2 * X @ centroids.T + \
+        (centroids ** 2).sum(axis=1)[np.newaxis, :]
+    return np.argmin(distances, axis=1)
+
+class IncrementalSpectral:
+    """Spectral clustering (k smallest eigenvectors of L = D - A, then k-means) that is kept
+    up to date under edge insertions and weight changes. The eigenvectors U and L U are
+    stored implicitly as U0 R + C Q and W0 R + C_W Q: a dense base shared by every node, a
+    k x k rotation, and correction rows for the nodes changes have reached so far, kept in
+    their own frame with a lazily applied k x k rotation Q. An update only touches the two
+    rotations and the rows of the nodes it reaches (new rows are mapped into the frame by
+    Q^-1, and the frame is only applied to the rows if Q becomes ill-conditioned), and the
+    base is rebuilt (consolidated) once the corrections cover more than a consolidate
+    fraction of the nodes
+    """
+    def __init__(self, k, move_tol=1e-3, max_subspace=500, consolidate=0.1,
+        lobpcg_iter=20, random_state=None):
+        self.k            = k
+        self.move_tol     = move_tol
+        self.max_subspace = max_subspace
+        self.consolidate  = consolidate
+        self.lobpcg_iter  = lobpcg_iter
+        self.rng          = np.random.RandomState(random_state)
+
+    def fit(self, S):
+        """Given a sparse similarity (adjacency) matrix S, solves for the k smallest
+        eigenpairs of its Laplacian and clusters the embedding
+
+        Returns self (IncrementalSpectral)
+        """
+        self.A = lil_matrix(csr_matrix(S, dtype=np.float64))
+        self.n = self.A.shape[0]
+        self.degrees = np.asarray(self.A.sum(axis=1)).ravel()
+
+        L = LaplacianOperator(self.A.tocsr())
+        w, U = laplacian_eigenpairs(L, self.k)
+        self._reset(w, U, L @ U)
+
+        self.labels_, self.centroids = kmeans_stage(U, self.k,
+            random_state=self.rng.randint(np.iinfo(np.int32).max))
+        return self
+
+    def _reset(self, w, U, W):
+        """Given eigenvalues, eigenvectors and L U, makes them the dense base with an identity
+        rotation and no correction rows
+
+        Returns void
+        """
+        self.w  = w
+        self.U0 = U
+        self.W0 = W
+        self.R  = np.eye(self.k)
+        self.Q  = np.eye(self.k)
+        self.Q_inv = np.eye(self.k)
+        # correction buffers grow geometrically; only the first num_corrections rows are used
+        self.num_corrections = 0
+        self.correction_nodes = np.zeros(0, dtype=np.int64)
+        self.CU = np.zeros((0, self.k))
+        self.CW = np.zeros((0, self.k))
+        self.position = np.full(self.n, -1, dtype=np.int64)
+
+    def _rows(self, nodes):
+        """Given an array of nodes, finds their rows of U and of L U
+
+        Returns (1) rows of U; (2) rows of L U (len(nodes) x k numpy arrays)
+        """
+        U = self.U0[nodes] @ self.R
+        W = self.W0[nodes] @ self.R
+        corrected = self.position[nodes] >= 0
+        U[corrected] += self.CU[self.position[nodes[corrected]]] @ self.Q
+        W[corrected] += self.CW[self.position[nodes[corrected]]] @ self.Q
+        return U, W
+
+    def _materialize(self, base, corrections):
+        """Given a dense base (U0 or W0) and the matching correction rows, builds the full
+        current matrix (U or L U)
+
+        Returns Matrix (n x k numpy array)
+        """
+        M = base @ self.R
+        m = self.num_corrections
+        M[self.correction_nodes[:m]] += corrections[:m] @ self.Q
+        return M
+
+    def eigenpairs(self):
+        """Materializes the current eigenpairs
+
+        Returns (1) eigenvalues (numpy array); (2) eigenvectors (n x k numpy array)
+        """
+        return self.w, self._materialize(self.U0, self.CU)
+
+    def _grow(self, n):
+        """Given a new number of nodes, extends the graph and the stored eigenvectors with
+        isolated nodes (whose eigenvector rows start out at zero)
+
+        Returns void
+        """
+        if n <= self.n:
+            return
+        extra = n - self.n
+        self.A.resize((n, n))
+        self.degrees  = np.concatenate((self.degrees, np.zeros(extra)))
+        self.U0       = np.vstack((self.U0, np.zeros((extra, self.k))))
+        self.W0       = np.vstack((self.W0, np.zeros((extra, self.k))))
+        self.position = np.concatenate((self.position, np.full(extra, -1, dtype=np.int64)))
+        self.labels_  = np.concatenate((self.labels_, np.full(extra, -1, dtype=np.int64)))
+        self.n = n
+
+    def _apply_edges(self, rows, cols, weights):
+        """Given a batch of edge weight changes, applies them to the adjacency matrix and the
+        degrees, and builds the change in the Laplacian restricted to the touched nodes
+
+        Returns (1) touched nodes (numpy array of ints); (2) change of L on the touched
+        nodes (len(touched) x len(touched) numpy array)
+        """
+        touched = np.unique(np.concatenate((rows, cols)))
+        local_rows = np.searchsorted(touched, rows)
+        local_cols = np.searchsorted(touched, cols)
+
+        off = rows != cols
+        delta_A = coo_matrix((np.concatenate((weights, weights[off])),
+            (np.concatenate((local_rows, local_cols[off])),
+            np.concatenate((local_cols, local_rows[off])))),
+            shape=(len(touched), len(touched))).toarray()
+        delta_L = np.diag(delta_A.sum(axis=1)) - delta_A
+
+        for row, col, weight in zip(rows, cols, weights):
+            self.A[row, col] += weight
+            if row != col:
+                self.A[col, row] += weight
+        self.degrees[touched] += delta_A.sum(axis=1)
+        return touched, delta_L
+
+    def _add_corrections(self, nodes, U_rows, W_rows):
+        """Given nodes and rows (in the current frame) to be added to their U and L U
+        corrections, registers any nodes without correction rows yet, doubling the buffers
+        when they run out of capacity, and adds the rows mapped into the correction frame
+
+        Returns void
+        """
+        new = nodes[self.position[nodes] < 0]
+        if len(new) > 0:
+            m = self.num_corrections
+            if m + len(new) > len(self.correction_nodes):
+                capacity = max(2 * len(self.correction_nodes), m + len(new), 16)
+                correction_nodes = np.zeros(capacity, dtype=np.int64)
+                correction_nodes[:m] = self.correction_nodes[:m]
+                CU, CW = np.zeros((capacity, self.k)), np.zeros((capacity, self.k))
+                CU[:m], CW[:m] = self.CU[:m], self.CW[:m]
+                self.correction_nodes, self.CU, self.CW = correction_nodes, CU, CW
+            self.position[new] = m + np.arange(len(new))
+            self.correction_nodes[m:m + len(new)] = new
+            self.num_corrections = m + len(new)
+        np.add.at(self.CU, self.position[nodes], U_rows @ self.Q_inv)
+        np.add.at(self.CW, self.position[nodes], W_rows @ self.Q_inv)
+
+    def _rotate(self, Y):
+        """Given the k x k map of the old U into the new one, applies it to the base rotation
+        and lazily to the correction frame. If the new frame is ill-conditioned (an
+        eigenvector left span(U) entirely), it is applied to the correction rows instead,
+        which costs O(corrections * k^2) but only happens then
+
+        Returns void
+        """
+        self.R = self.R @ Y
+        Q = self.Q @ Y
+        if np.linalg.cond(Q) < MAX_COND:
+            self.Q, self.Q_inv = Q, np.linalg.inv(Q)
+            return
+        m = self.num_corrections
+        self.CU[:m] = self.CU[:m] @ Q
+        self.CW[:m] = self.CW[:m] @ Q
+        self.Q, self.Q_inv = np.eye(self.k), np.eye(self.k)
+
+    def _rayleigh_ritz(self, touched, delta_L):
+        """Given the touched nodes and the change of L on them (already applied to the
+        graph), replaces the eigenpairs by the Ritz pairs of the new Laplacian on
+        span(U, E_T), over an orthonormal basis of that span. All blocks of the projected
+        problem come from the rows of U and L U at T, the known projection U^T L U = diag(w),
+        and the new Laplacian on T and its neighbors, so nothing proportional to the graph is
+        touched
+
+        Returns (1) k x k map of the old U into the new one; (2) change of the touched rows
+        beyond that map (len(touched) x k numpy array)
+        """
+        k, t = self.k, len(touched)
+        U_T, W_T = self._rows(touched)
+
+        A_T = self.A[touched].tocsr()
+        L_TT = np.diag(self.degrees[touched]) - A_T[:, touched].toarray()
+        LU_T = W_T + delta_L @ U_T
+
+        H = np.zeros((k + t, k + t))
+        H[:k, :k] = np.diag(self.w) + U_T.T @ delta_L @ U_T
+        H[k:, :k] = LU_T
+        H[:k, k:] = LU_T.T
+        H[k:, k:] = L_TT
+
+        # E_T is orthogonalized against U (E_T - U U_T^T, with Gram I - U_T U_T^T) and the
+        # directions already in span(U) are dropped, e.g. when U holds the indicator of a
+        # component whose nodes are all touched, so the projected problem stays definite
+        gram_w, gram_V = eigh(np.eye(t) - U_T @ U_T.T)
+        kept = gram_w > ORTHO_TOL
+        Z = gram_V[:, kept] / np.sqrt(gram_w[kept])
+        B = np.zeros((k + t, k + Z.shape[1]))
+        B[:k, :k] = np.eye(k)
+        B[:k, k:] = -U_T.T @ Z
+        B[k:, k:] = Z
+
+        H_B = B.T @ H @ B
+        w, Y = eigh((H_B + H_B.T) / 2, subset_by_index=[0, k - 1])
+        Y = B @ Y
+        Y_top, Y_bottom = Y[:k], Y[k:]
+
+        # L' E_T is supported on the touched nodes and their neighbors
+        L_T = (coo_matrix((self.degrees[touched], (np.arange(t), touched)),
+            shape=A_T.shape) - A_T).tocsr()
+        support = np.unique(L_T.indices)
+        LE_Y = L_T[:, support].T @ Y_bottom
+
+        self._rotate(Y_top)
+        self._add_corrections(touched, Y_bottom, delta_L @ U_T @ Y_top)
+        self._add_corrections(support, np.zeros((len(support), k)), LE_Y)
+        self.w = w
+        return Y_top, Y_bottom
+
+    def _refresh(self):
+        """Re-solves the eigenpairs of the current Laplacian with LOBPCG, warm started from
+        the current eigenvectors, and rebuilds the dense base
+
+        Returns (1) k x k map of the old U into the new one; (2) change of every row beyond
+        that map (n x k numpy array)
+        """
+        L = LaplacianOperator(self.A.tocsr())
+        _, U_old = self.eigenpairs()
+        if self.n < 5 * self.k:
+            w, U = laplacian_eigenpairs(L, self.k)
+        else:
+            w, U = lobpcg(L, U_old, largest=False, maxiter=self.lobpcg_iter)
+            order = np.argsort(w)
+            w, U = w[order], U[:, order]
+        self._reset(w, U, L @ U)
+
+        rotation = U_old.T @ U
+        return rotation, U - U_old @ rotation
+
+    def update(self, rows, cols, weights=None):
+        """Given a batch of edges (rows, cols, and optionally weight changes, by default 1),
+        applies them to the graph and updates the eigenpairs: by Rayleigh-Ritz on the touched
+        nodes if there are at most max_subspace of them, else by a warm-started LOBPCG
+        solve. The centroids follow the eigenvectors, and only nodes whose embedding row
+        moved by more than move_tol (or that have no cluster yet) are reassigned
+
+        Returns Reassigned nodes (numpy array of ints)
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        weights = np.ones(len(rows)) if weights is None else np.asarray(weights, dtype=np.float64)
+        if len(rows) == 0:
+            return np.zeros(0, dtype=np.int64)
+
+        self._grow(int(max(rows.max(), cols.max())) + 1)
+        touched, delta_L = self._apply_edges(rows, cols, weights)
+
+        if len(touched) > self.max_subspace:
+            rotation, moved_by = self._refresh()
+            candidates = np.arange(self.n)
+        else:
+            rotation, moved_by = self._rayleigh_ritz(touched, delta_L)
+            candidates = touched
+
+        self.centroids = self.centroids @ rotation
+        moved = candidates[(np.linalg.norm(moved_by, axis=1) > self.move_tol) |
+            (self.labels_[candidates] < 0)]
+        if len(moved) > 0:
+            U_moved, _ = self._rows(moved)
+            self.labels_[moved] = _nearest(U_moved, self.centroids)
+
+        if self.num_corrections > self.consolidate * self.n:
+            w, U = self.eigenpairs()
+            self._reset(w, U, self._materialize(self.W0, self.CW))
+        return moved
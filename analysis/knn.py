@@ -0,0 +1,159 @@
+"""
+__author__ = Yash Patel
+__name__   = knn.py
+__description__ = Approximate k-nearest-neighbor graph construction over node embeddings
+(random-projection trees refined by NN-descent), handed to the density-based clustering
+algorithms as sparse precomputed distances
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix, issparse
+
+def _rp_tree_leaves(X, leaf_size, rng):
+    """Given points X (n x d), the maximum leaf size, and a random state, builds a random
+    projection tree by repeatedly splitting each group at the median of its projection on
+    a random direction, until every group has at most leaf_size points
+
+    Returns Leaves (list of numpy arrays of point indices)
+    """
+    leaves = []
+    stack = [np.arange(X.shape[0])]
+    while stack:
+        group = stack.pop()
+        if len(group) <= leaf_size:
+            leaves.append(group)
+            continue
+
+        direction = rng.standard_normal(X.shape[1])
+        order = np.argsort(X[group] @ direction)
+        half = len(group) // 2
+        stack.append(group[order[:half]])
+        stack.append(group[order[half:]])
+    return leaves
+
+def _keep_closest(points, neighbors, distances, candidates, candidate_distances, k):
+    """Given the points being updated, their current neighbor indices and distances
+    (m x k, -1/inf where missing), candidate neighbors for each of them (m x c, -1 where
+    missing) with their distances, and k, keeps the k closest distinct neighbors of each
+    point among its current neighbors and its candidates
+
+    Returns (1) neighbor indices (m x k); (2) neighbor distances (m x k)
+    """
+    merged = np.concatenate((neighbors, candidates), axis=1)
+    merged_distances = np.concatenate((distances, candidate_distances), axis=1)
+
+    # sort by neighbor index so that repeats of a neighbor can be masked out
+    order = np.argsort(merged, axis=1, kind="stable")
+    merged = np.take_along_axis(merged, order, axis=1)
+    merged_distances = np.take_along_axis(merged_distances, order, axis=1)
+    repeated = np.zeros_like(merged, dtype=bool)
+    repeated[:, 1:] = merged[:, 1:] == merged[:, :-1]
+    invalid = repeated | (merged < 0) | (merged == points[:, np.newaxis])
+    merged_distances[invalid] = np.inf
+
+    closest = np.argsort(merged_distances, axis=1)[:, :k]
+    neighbors = np.take_along_axis(merged, closest, axis=1)
+    distances = np.take_along_axis(merged_distances, closest, axis=1)
+    neighbors[np.isinf(distances)] = -1
+    return neighbors, distances
+
+def _candidate_distances(X, squared_norms, points, candidates):
+    """Given points X (dense or CSR) with their squared norms, the points being updated,
+    and candidate neighbors for each of them (m x c, -1 where missing), finds the distance
+    to every candidate through ||x||^2 + ||y||^2 - 2 x.y
+
+    Returns Distances (m x c numpy array, inf where the candidate is missing)
+    """
+    safe = np.where(candidates >= 0, candidates, 0)
+    if issparse(X):
+        pairs = X[safe.ravel()].multiply(X[np.repeat(points, safe.shape[1])])
+        dots = np.asarray(pairs.sum(axis=1)).reshape(safe.shape)
+    else:
+        dots = np.einsum("mcd,md->mc", X[safe], X[points])
+    squared = squared_norms[safe] + squared_norms[points][:, np.newaxis] - 2 * dots
+    candidate_distances = np.sqrt(np.maximum(squared, 0))
+    candidate_distances[candidates < 0] = np.inf
+    return candidate_distances
+
+def knn_graph(X, n_neighbors=15, n_trees=4, leaf_size=None, n_iter=3, chunk_size=10000,
+    random_state=None):
+    """Given points X (n x d, dense or scipy-sparse), the number of neighbors k, the number
+    of random projection trees, the tree leaf size (defaults to 2k), the number of
+    NN-descent rounds, the number of points refined at once, and a random seed, builds an
+    approximate k-nearest-neighbor graph. Candidates come from brute force within each
+    tree leaf, and are refined with NN-descent (a neighbor's neighbors are likely to be
+    neighbors), for roughly O(n * k * log n) work overall instead of O(n^2). Sparse points
+    are kept as CSR rows, so each distance costs O(nnz) and X is never densified
+
+    Returns Distances to the k nearest neighbors (n x n scipy-sparse CSR)
+    """
+    if issparse(X):
+        X = csr_matrix(X, dtype=np.float64)
+        squared_norms = np.asarray(X.multiply(X).sum(axis=1)).ravel()
+    else:
+        X = np.asarray(X, dtype=np.float64)
+        squared_norms = np.einsum("nd,nd->n", X, X)
+    n = X.shape[0]
+    k = min(n_neighbors, n - 1)
+    leaf_size = max(leaf_size or 2 * k, k + 1)
+    rng = np.random.RandomState(random_state)
+
+    neighbors = np.full((n, k), -1, dtype=np.int64)
+    distances = np.full((n, k), np.inf)
+
+    def refine(candidates_of):
+        improved = 0
+        for start in range(0, n, chunk_size):
+            chunk = np.arange(start, min(start + chunk_size, n))
+            candidates = candidates_of(chunk)
+            candidate_distances = _candidate_distances(X, squared_norms, chunk, candidates)
+            new_neighbors, new_distances = _keep_closest(chunk, neighbors[chunk],
+                distances[chunk], candidates, candidate_distances, k)
+            improved += np.count_nonzero((new_distances < distances[chunk]).any(axis=1))
+            neighbors[chunk], distances[chunk] = new_neighbors, new_distances
+        return improved
+
+    for _ in range(n_trees):
+        # every point takes the other members of its leaf as candidates
+        leaves = _rp_tree_leaves(X, leaf_size, rng)
+        padded = np.full((len(leaves), leaf_size), -1, dtype=np.int64)
+        leaf_of = np.empty(n, dtype=np.int64)
+        for i, leaf in enumerate(leaves):
+            padded[i, :len(leaf)] = leaf
+            leaf_of[leaf] = i
+        refine(lambda chunk : padded[leaf_of[chunk]])
+
+    def neighbors_of_neighbors(chunk):
+        current = neighbors[chunk]
+        candidates = neighbors[np.where(current >= 0, current, 0)].reshape(len(chunk), -1)
+        candidates[np.repeat(current < 0, k, axis=1)] = -1
+        return candidates
+
+    for _ in range(n_iter):
+        if refine(neighbors_of_neighbors) == 0:
+            break
+
+    rows = np.repeat(np.arange(n), k)
+    found = neighbors.ravel() >= 0
+    return csr_matrix((distances.ravel()[found], (rows[found], neighbors.ravel()[found])),
+        shape=(n, n))
+
+class KNNDensity:
+    """Wraps a density-based clustering algorithm (i.e. DBSCAN or OPTICS) so that it is
+    run on an approximate k-nearest-neighbor graph of the features, passed as sparse
+    precomputed distances, rather than computing neighborhoods on the features directly
+    """
+    def __init__(self, estimator, n_neighbors=15, n_trees=4, n_iter=3, random_state=None,
+        **kwds):
+        self.estimator = estimator
+        self.n_neighbors = n_neighbors
+        self.n_trees = n_trees
+        self.n_iter = n_iter
+        self.random_state = random_state
+        self.kwds = kwds
+
+    def fit_predict(self, X):
+        G = knn_graph(X, n_neighbors=self.n_neighbors, n_trees=self.n_trees,
+            n_iter=self.n_iter, random_state=self.random_state)
+        self.labels_ = self.estimator(metric="precomputed", **self.kwds).fit_predict(G)
+        return self.labels_
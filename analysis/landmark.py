@@ -0,0 +1,151 @@
+"""
+__author__ = Yash Patel
+__name__   = landmark.py
+__description__ = Landmark-based approximate spectral clustering (Chen & Cai, AAAI 2011)
+for graphs too large for an exact eigendecomposition. Every node is described by its
+affinity to p << n landmark nodes, so both time and memory are O(n * p) at most
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags, identity
+from sklearn.cluster import kmeans_plusplus
+
+from analysis.components import label_components
+from analysis.spectral import kmeans_stage, labels_to_partitions, normalize_rows
+
+def _allocate_landmarks(sizes, p):
+    """Given the sizes of the connected components and the number of landmarks p, spreads
+    the landmarks across the components proportionally to size (largest remainders first),
+    never giving a component more landmarks than it has nodes. Components too small for
+    a share get none, as a landmark cannot reach beyond its own component anyway
+
+    Returns Landmarks per component (numpy array of ints)
+    """
+    shares = p * sizes / sizes.sum()
+    allocation = np.floor(shares).astype(int)
+
+    remaining = p - allocation.sum()
+    if remaining > 0:
+        by_remainder = np.argsort(-(shares - allocation), kind="stable")
+        allocation[by_remainder[:remaining]] += 1
+    return np.minimum(allocation, sizes)
+
+def _select_landmarks(S, p, method, sketch_dim, rng):
+    """Given a sparse similarity (adjacency) matrix S, the number of landmarks p, the
+    selection method ('random' or 'kmeans++'), the sketch dimension, and a random state,
+    selects the landmark nodes, separately within every connected component and in
+    proportion to its size. The k-means++ selection is run on a cheap random projection
+    of the adjacency rows (S @ R) rather than on the rows themselves
+
+    Returns Landmark node indices (numpy array of ints)
+    """
+    if method not in ("random", "kmeans++"):
+        raise ValueError("Unknown landmark selection method: {}".format(method))
+
+    n = S.shape[0]
+    num_components, comp_labels, comp_sizes = label_components(S)
+    allocation = _allocate_landmarks(comp_sizes, p)
+    if method == "kmeans++":
+        R = rng.choice([-1.0, 1.0], size=(n, sketch_dim))
+        sketch = S @ R
+
+    order = np.argsort(comp_labels, kind="stable")
+    boundaries = np.concatenate(([0], np.cumsum(comp_sizes)))
+    landmarks = []
+    for c in np.flatnonzero(allocation):
+        members = order[boundaries[c]:boundaries[c+1]]
+        if allocation[c] == len(members):
+            landmarks.append(members)
+        elif method == "random":
+            landmarks.append(rng.choice(members, allocation[c], replace=False))
+        else:
+            _, chosen = kmeans_plusplus(sketch[members], n_clusters=allocation[c],
+                random_state=rng.randint(np.iinfo(np.int32).max))
+            landmarks.append(members[chosen])
+    return np.concatenate(landmarks)
+
+def _keep_top(Z, r):
+    """Given a sparse matrix Z and a count r, keeps only the r largest entries of each row
+
+    Returns Sparse matrix (scipy-sparse CSR)
+    """
+    Z = Z.tocoo()
+    order = np.lexsort((-Z.data, Z.row))
+    rows, cols, data = Z.row[order], Z.col[order], Z.data[order]
+
+    row_starts = np.searchsorted(rows, rows, side="left")
+    keep = (np.arange(len(rows)) - row_starts) < r
+    return csr_matrix((data[keep], (rows[keep], cols[keep])), shape=Z.shape)
+
+def landmark_affinity(S, landmarks, steps=3, r=5):
+    """Given a sparse similarity (adjacency) matrix S, the landmark nodes, the number of
+    random-walk steps, and the number of landmarks each node keeps, builds a sparse n x p
+    affinity matrix from graph proximity: the landmark indicators are diffused along a lazy
+    random walk for the given number of steps, keeping the r strongest landmarks per node
+    after every step. Nodes no landmark reaches within the given steps are left with
+    empty rows
+
+    Returns Affinity (n x p scipy-sparse CSR)
+    """
+    n, p = S.shape[0], len(landmarks)
+    degrees = np.asarray(S.sum(axis=1)).ravel() + 1.0
+    P = diags(1.0 / degrees) @ (S + identity(n, format="csr"))
+
+    Z = csr_matrix((np.ones(p), (landmarks, np.arange(p))), shape=(n, p))
+    for _ in range(steps):
+        Z = _keep_top(P @ Z, r)
+    return Z
+
+def landmark_embedding(Z, k):
+    """Given the n x p landmark affinity Z and the embedding dimension k, finds the top k
+    left singular vectors of the row- and column-normalized affinity. As p is small,
+    these come from the p x p eigenproblem on Z^T Z rather than from an n x n one
+
+    Returns Embedding (n x k numpy array)
+    """
+    row_sums = np.asarray(Z.sum(axis=1)).ravel()
+    row_sums[row_sums == 0] = 1.0
+    Z = diags(1.0 / row_sums) @ Z
+
+    col_sums = np.asarray(Z.sum(axis=0)).ravel()
+    col_sums[col_sums == 0] = 1.0
+    Z = Z @ diags(1.0 / np.sqrt(col_sums))
+
+    w, V = np.linalg.eigh((Z.T @ Z).toarray())
+    top = np.argsort(w)[::-1][:k]
+    singular_values = np.sqrt(np.maximum(w[top], 1e-12))
+    return (Z @ V[:, top]) / singular_values
+
+def landmark_spectral(S, k, p=1000, method="kmeans++", steps=3, r=5, sketch_dim=32,
+    normalize=True, random_state=None):
+    """Given a sparse similarity (adjacency) matrix S, the number of clusters k, the number
+    of landmarks p (trading accuracy for speed), the landmark selection method ('random'
+    or 'kmeans++'), the random-walk steps and landmarks kept per node for the affinity,
+    the sketch dimension for k-means++ selection, whether embedding rows are normalized
+    (NJW), and a random seed, runs landmark-based approximate spectral clustering. Nodes
+    that no landmark reaches have no embedding and are left out of every cluster rather
+    than lumped into one. Clusters are returned as a list of sets, where the contents of
+    the first set are the nodes that belong to "cluster 1"
+
+    Returns Partitions (list of sets of ints)
+    """
+    S = csr_matrix(S, dtype=np.float64)
+    rng = np.random.RandomState(random_state)
+    p = min(p, S.shape[0])
+
+    print("Selecting {} landmarks ({})...".format(p, method))
+    landmarks = _select_landmarks(S, p, method, sketch_dim, rng)
+    Z = landmark_affinity(S, landmarks, steps=steps, r=r)
+    reached = np.flatnonzero(Z.getnnz(axis=1) > 0)
+    if len(reached) < S.shape[0]:
+        print("{} nodes are not reached by any landmark and are left unclustered".format(
+            S.shape[0] - len(reached)))
+
+    U = landmark_embedding(Z[reached], k)
+    if normalize:
+        U = normalize_rows(U)
+
+    labels = np.full(S.shape[0], -1, dtype=np.int64)
+    labels[reached], _ = kmeans_stage(U, k, random_state=rng.randint(np.iinfo(np.int32).max))
+    print("Completed landmark partitioning")
+    return labels_to_partitions(labels, k)
@@ -0,0 +1,142 @@
+"""
+__author__ = Yash Patel
+__name__   = local.py
+__description__ = Local clustering around a single seed address: approximate personalized
+PageRank by the Andersen-Chung-Lang push algorithm, followed by a sweep cut by conductance.
+Only the neighborhood the push reaches is ever touched, so the work depends on the
+tolerance and the size of the cluster found rather than on the size of the graph
+"""
+
+from collections import deque
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+def _neighbors(S, u):
+    """Given a sparse similarity (adjacency) matrix S (CSR) and a node, finds its neighbors
+    and the weights of the edges to them
+
+    Returns (1) neighbors (numpy array of ints); (2) weights (numpy array of floats)
+    """
+    start, stop = S.indptr[u], S.indptr[u + 1]
+    return S.indices[start:stop], S.data[start:stop]
+
+def _fill_degrees(S, nodes, degrees):
+    """Given a sparse similarity (adjacency) matrix S (CSR), nodes, and the array of degrees
+    found so far (NaN where not yet needed), sums the CSR slices of the nodes whose degree
+    is still missing, all at once
+
+    Returns void
+    """
+    missing = nodes[np.isnan(degrees[nodes])]
+    if len(missing) == 0:
+        return
+    missing = np.unique(missing)
+    starts, counts = S.indptr[missing], np.diff(S.indptr)[missing]
+    slots = np.repeat(starts - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+    degrees[missing] = np.bincount(np.repeat(np.arange(len(missing)), counts),
+        weights=S.data[slots], minlength=len(missing))
+
+def approximate_ppr(S, seed, alpha=0.01, eps=1e-4):
+    """Given a sparse similarity (adjacency) matrix S (CSR), a seed node, the teleport
+    probability alpha, and the tolerance eps, approximates the personalized PageRank vector
+    of the seed with the push algorithm of Andersen, Chung & Lang (FOCS 2006) on the lazy
+    random walk. Nodes are pushed while their residual is at least eps times their degree,
+    so the total work is O(1 / (eps * alpha)) regardless of the size of the graph. Each push
+    spreads over the node's CSR slice at once (np.add.at on the residual array), and degrees
+    are only summed for the nodes the push reaches
+
+    Returns (1) PageRank mass per reached node (dict); (2) degree per reached node (dict)
+    """
+    n = S.shape[0]
+    p, r = np.zeros(n), np.zeros(n)
+    degrees = np.full(n, np.nan)
+    _fill_degrees(S, np.array([seed]), degrees)
+
+    r[seed] = 1.0
+    pushed = {}
+    queue = deque([seed])
+    while queue:
+        u = queue.popleft()
+        d_u = degrees[u]
+        if d_u == 0 or r[u] < eps * d_u:
+            continue
+
+        residual = r[u]
+        p[u] += alpha * residual
+        pushed[u] = None # insertion-ordered set
+        r[u] = (1 - alpha) * residual / 2
+        if r[u] >= eps * d_u:
+            queue.append(u)
+
+        neighbors, weights = _neighbors(S, u)
+        _fill_degrees(S, neighbors, degrees)
+        before = r[neighbors]
+        np.add.at(r, neighbors, (1 - alpha) * residual / (2 * d_u) * weights)
+        thresholds = eps * degrees[neighbors]
+        queue.extend(neighbors[(before < thresholds) & (thresholds <= r[neighbors])].tolist())
+    return { u : float(p[u]) for u in pushed }, { u : float(degrees[u]) for u in pushed }
+
+def sweep_cut(S, p, degrees, total_volume=None):
+    """Given a sparse similarity (adjacency) matrix S (CSR), approximate PageRank masses and
+    the degrees of the reached nodes, and the volume of the whole graph (None treats every
+    prefix as the smaller side of its cut, which holds for local clusters), sweeps the nodes
+    in decreasing order of degree-normalized PageRank, tracking the conductance of every
+    prefix incrementally, and keeps the prefix of lowest conductance
+
+    Returns (1) cluster (list of node indices, in sweep order); (2) its conductance (float)
+    """
+    order = sorted(p.keys(), key=lambda u : p[u] / degrees[u], reverse=True)
+    in_prefix = set()
+    cut, volume = 0.0, 0.0
+    best_conductance, best_size = 1.0, 1
+
+    for size, u in enumerate(order, 1):
+        neighbors, weights = _neighbors(S, u)
+        inside = sum(weight for v, weight in zip(neighbors.tolist(), weights.tolist())
+            if v in in_prefix)
+        self_loops = weights[neighbors == u].sum()
+        in_prefix.add(u)
+        volume += degrees[u]
+        cut += degrees[u] - 2 * inside - self_loops
+
+        smaller_side = volume if total_volume is None else min(volume, total_volume - volume)
+        if smaller_side <= 0:
+            break
+        conductance = cut / smaller_side
+        if conductance < best_conductance:
+            best_conductance, best_size = conductance, size
+    return order[:best_size], best_conductance
+
+def local_cluster(S, seed, alpha=0.01, eps=1e-4, total_volume=None):
+    """Given a sparse similarity (adjacency) matrix S, a seed node index, the teleport
+    probability and push tolerance, and optionally the volume of the whole graph, finds
+    a low-conductance cluster containing the seed. S should already be CSR to avoid a
+    conversion proportional to the graph
+
+    Returns (1) cluster (set of node indices); (2) its conductance (float)
+    """
+    if not isinstance(S, csr_matrix):
+        S = csr_matrix(S, dtype=np.float64)
+    p, degrees = approximate_ppr(S, seed, alpha=alpha, eps=eps)
+    if len(p) == 0:
+        return { seed }, 1.0
+
+    cluster, conductance = sweep_cut(S, p, degrees, total_volume=total_volume)
+    cluster = set(cluster)
+    cluster.add(seed)
+    return cluster, conductance
+
+def local_analysis(S, address, id_to_index, index_to_id, alpha=0.01, eps=1e-4,
+    total_volume=None):
+    """Given a sparse similarity (adjacency) matrix S (CSR), a seed address ID, the mappings
+    between address IDs and indices, and the parameters of local_cluster, finds the
+    low-conductance cluster of addresses around the seed address
+
+    Returns (1) cluster (set of address IDs); (2) its conductance (float)
+    """
+    cluster, conductance = local_cluster(S, id_to_index[address], alpha=alpha, eps=eps,
+        total_volume=total_volume)
+    print("Local cluster of {}: {} addresses, conductance {:.4f}".format(
+        address, len(cluster), conductance))
+    return { index_to_id[index] for index in cluster }, conductance
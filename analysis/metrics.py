@@ -0,0 +1,144 @@
+"""
+__author__ = Yash Patel
+__name__   = metrics.py
+__description__ = Unsupervised quality metrics of a partition of the similarity matrix, for
+real data where there is no ground truth: modularity, per-cluster conductance, normalized
+cut, coverage, and the cluster size distribution. Every metric follows from the intra-cluster
+weight and the volume of each cluster, which are accumulated over the CSR entries with one
+vectorized pass, so the cost is O(edges)
+"""
+
+import json
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+QUANTILES    = [0.0, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0]
+TOP_CLUSTERS = 20 # largest clusters listed individually in the metrics
+
+def partitions_to_labels(partitions, n):
+    """Given partitions (list of sets of node indices) and the number of nodes, converts
+    the partitions into one label per node (-1 for nodes in no partition)
+
+    Returns Labels (numpy array of ints)
+    """
+    labels = np.full(n, -1, dtype=np.int64)
+    for label, partition in enumerate(partitions):
+        labels[list(partition)] = label
+    return labels
+
+def cluster_stats(S, labels):
+    """Given a sparse similarity (adjacency) matrix S and a label per node (-1 for nodes left
+    unclustered, which count as singletons), accumulates the per-group weights in one pass
+    over the CSR entries: the clusters come first, then one singleton group per
+    unclustered node
+
+    Returns Statistics (dict of numpy arrays: size, volume, internal weight, cut, and
+    conductance of every cluster, plus the volume and internal weight of every group)
+    and the total edge weight (float)
+    """
+    S = csr_matrix(S, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.int64)
+    n = S.shape[0]
+    k = int(labels.max()) + 1 if n > 0 else 0
+
+    # unclustered nodes become singletons after the real clusters
+    groups = labels.copy()
+    unclustered = groups < 0
+    groups[unclustered] = k + np.arange(unclustered.sum())
+    num_groups = k + int(unclustered.sum())
+
+    rows = np.repeat(np.arange(n), np.diff(S.indptr))
+    inside = groups[rows] == groups[S.indices]
+    total = S.data.sum()
+    degrees = np.bincount(rows, weights=S.data, minlength=n)
+    volumes = np.bincount(groups, weights=degrees, minlength=num_groups)
+    internal = np.bincount(groups[rows[inside]], weights=S.data[inside], minlength=num_groups)
+    cuts = volumes - internal
+
+    other_side = np.maximum(np.minimum(volumes[:k], total - volumes[:k]), 0)
+    stats = {
+        "size"            : np.bincount(labels[~unclustered], minlength=k),
+        "volume"          : volumes[:k],
+        "internal"        : internal[:k],
+        "cut"             : cuts[:k],
+        "conductance"     : np.divide(cuts[:k], other_side, out=np.ones(k), where=other_side > 0),
+        "group_volumes"   : volumes,
+        "group_internal"  : internal
+    }
+    return stats, float(total)
+
+def partition_metrics(S, labels, top=TOP_CLUSTERS):
+    """Given a sparse similarity (adjacency) matrix S, a label per node (-1 for nodes left
+    unclustered, which count as singletons), and the number of largest clusters to list,
+    computes the partition quality: modularity, coverage (fraction of edge weight inside
+    clusters), normalized cut (sum over clusters of cut / volume), and summaries of the
+    conductance (cut / smaller side's volume) and size of the clusters: quantiles, and the
+    size and conductance of the largest clusters. The full per-cluster arrays are left to
+    cluster_stats, so the metrics stay small however many clusters there are
+
+    Returns Metrics (dict)
+    """
+    stats, total = cluster_stats(S, labels)
+    return _summarize(stats, total, top)
+
+def _summarize(stats, total, top):
+    """Given the statistics and total edge weight from cluster_stats and the number of
+    largest clusters to list, computes the metrics described in partition_metrics
+
+    Returns Metrics (dict)
+    """
+    sizes, conductance, volumes = stats["size"], stats["conductance"], stats["volume"]
+    nonempty = sizes > 0
+    unclustered = len(stats["group_volumes"]) - len(sizes)
+
+    if total == 0:
+        return { "clusters" : int(nonempty.sum()), "unclustered" : unclustered }
+    largest = np.argsort(-sizes, kind="stable")[:min(top, int(nonempty.sum()))]
+    return {
+        "clusters"           : int(nonempty.sum()),
+        "unclustered"        : unclustered,
+        "modularity"         : float((stats["group_internal"] / total).sum() -
+            ((stats["group_volumes"] / total) ** 2).sum()),
+        "coverage"           : float(stats["group_internal"].sum() / total),
+        "normalized_cut"     : float(np.divide(stats["cut"], volumes,
+            out=np.zeros(len(volumes)), where=volumes > 0).sum()),
+        "conductance"        : {
+            "mean"            : float(conductance[nonempty].mean()) if nonempty.any() else None,
+            "volume_weighted" : float((conductance * volumes).sum() /
+                volumes.sum()) if volumes.sum() > 0 else None,
+            "quantiles"       : QUANTILES,
+            "values"          : np.quantile(conductance[nonempty], QUANTILES).tolist()
+                if nonempty.any() else None
+        },
+        "sizes"              : {
+            "quantiles"   : QUANTILES,
+            "values"      : np.quantile(sizes[nonempty], QUANTILES).tolist()
+                if nonempty.any() else None,
+            "singletons"  : int((sizes == 1).sum()),
+            "largest"     : int(sizes.max()) if len(sizes) > 0 else 0
+        },
+        "largest_clusters"   : [{ "cluster" : int(cluster), "size" : int(sizes[cluster]),
+            "conductance" : float(conductance[cluster]) } for cluster in largest]
+    }
+
+def write_metrics(S, partitions, fn, cluster_arrays=False):
+    """Given a sparse similarity (adjacency) matrix S, partitions of its nodes, the output
+    name (as given to write_results), and whether to also save the per-cluster arrays,
+    computes the partition metrics and writes them to output/{fn}_metrics.json, and the
+    size, volume, internal weight, cut, and conductance of every cluster to
+    output/{fn}_clusters.npz if cluster_arrays is True
+
+    Returns Metrics (dict)
+    """
+    labels = partitions_to_labels(partitions, S.shape[0])
+    stats, total = cluster_stats(S, labels)
+    metrics = _summarize(stats, total, TOP_CLUSTERS)
+    with open("output/{}_metrics.json".format(fn), "w") as f:
+        json.dump(metrics, f, indent=4)
+    if cluster_arrays:
+        np.savez("output/{}_clusters.npz".format(fn), **{ name : stats[name] for name in
+            ("size", "volume", "internal", "cut", "conductance") })
+    print("{}: modularity {}, coverage {}, {} clusters".format(fn,
+        metrics.get("modularity"), metrics.get("coverage"), metrics["clusters"]))
+    return metrics
@@ -0,0 +1,135 @@
+"""
+__author__ = Yash Patel
+__name__   = operators.py
+__description__ = Matrix-free graph Laplacians for the eigensolvers. D, D^{-1/2} and A are
+applied on the fly from the adjacency CSR and a degree vector, so no second sparse matrix
+(or float copy of one) is ever built for a solve
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import LinearOperator, eigsh
+
+def _adjacency(A):
+    """Given a sparse (or dense) adjacency matrix, converts it to float64 CSR, without
+    copying if it already is one
+
+    Returns Adjacency matrix (scipy-sparse CSR)
+    """
+    if isinstance(A, csr_matrix) and A.dtype == np.float64:
+        return A
+    return csr_matrix(A, dtype=np.float64)
+
+class LaplacianOperator(LinearOperator):
+    """Graph Laplacian applied from the adjacency matrix A and its degree vector: either the
+    combinatorial D - A or the normalized I - D^{-1/2} A D^{-1/2} (with isolated nodes given
+    a zero row, as NetworkX does). If shift is given, the operator is the shifted Laplacian
+    shift * I - L instead, whose largest eigenpairs are the smallest ones of L whenever the
+    shift is at least bound(). A may also be an adjacency operator that only supports
+    products (e.g. a DistributedAdjacency), in which case its degrees must be given
+    """
+    def __init__(self, A, normalize=False, shift=None, degrees=None):
+        self.A = A if isinstance(A, LinearOperator) else _adjacency(A)
+        self.normalize = normalize
+        self.shift = shift
+
+        if degrees is None:
+            degrees = np.asarray(self.A.sum(axis=1)).ravel()
+        self.degrees = degrees
+        if normalize:
+            connected = self.degrees > 0
+            self.inv_sqrt = np.zeros(len(self.degrees))
+            self.inv_sqrt[connected] = 1.0 / np.sqrt(self.degrees[connected])
+            self.diag = connected.astype(np.float64)
+        else:
+            self.diag = self.degrees
+        super().__init__(np.float64, self.A.shape)
+
+    def _apply(self, X, scale):
+        """Given a vector or block of vectors X and how D^{-1/2} is broadcast over it,
+        applies the (possibly shifted) Laplacian
+
+        Returns L X (numpy array, same shape as X)
+        """
+        if self.normalize:
+            LX = self.diag[scale] * X - self.inv_sqrt[scale] * (self.A @ (self.inv_sqrt[scale] * X))
+        else:
+            LX = self.diag[scale] * X - self.A @ X
+        if self.shift is not None:
+            return self.shift * X - LX
+        return LX
+
+    def _matvec(self, x):
+        return self._apply(np.ravel(x), slice(None))
+
+    def _matmat(self, X):
+        return self._apply(X, (slice(None), np.newaxis))
+
+    def _adjoint(self):
+        return self
+
+    def bound(self):
+        """Finds a Gershgorin bound on the largest eigenvalue of the (unshifted) Laplacian
+
+        Returns Bound (float)
+        """
+        if self.normalize:
+            return 2.0
+        return 2.0 * float(self.degrees.max()) if len(self.degrees) > 0 else 0.0
+
+    def shifted(self, shift=None):
+        """Given a shift (by default the Gershgorin bound), builds the shifted Laplacian
+        shift * I - L sharing this operator's adjacency and degree vectors
+
+        Returns Shifted Laplacian (LaplacianOperator)
+        """
+        operator = LaplacianOperator.__new__(LaplacianOperator)
+        operator.__dict__.update(self.__dict__)
+        operator.shift = self.bound() if shift is None else shift
+        return operator
+
+    def diagonal(self):
+        """Finds the diagonal of the operator
+
+        Returns Diagonal (numpy array)
+        """
+        if self.shift is not None:
+            return self.shift - self.diag
+        return self.diag.copy()
+
+    def toarray(self):
+        """Builds the operator as a dense matrix (only meant for small graphs)
+
+        Returns Dense matrix (n x n numpy array)
+        """
+        return self @ np.eye(self.shape[0])
+
+def normalized_adjacency(A):
+    """Given a sparse adjacency matrix A, builds D^{-1/2} A D^{-1/2} as an operator (with
+    isolated nodes mapped to zero rows)
+
+    Returns Normalized adjacency (scipy LinearOperator)
+    """
+    L = LaplacianOperator(A, normalize=True)
+    return LinearOperator(L.shape, dtype=np.float64,
+        matvec=lambda x : L.inv_sqrt * (L.A @ (L.inv_sqrt * np.ravel(x))),
+        matmat=lambda X : L.inv_sqrt[:, np.newaxis] * (L.A @ (L.inv_sqrt[:, np.newaxis] * X)),
+        rmatvec=lambda x : L.inv_sqrt * (L.A @ (L.inv_sqrt * np.ravel(x))))
+
+def laplacian_eigenpairs(L, k, v0=None):
+    """Given a Laplacian operator L, the number of eigenpairs k, and optionally a start vector,
+    finds the k eigenpairs of smallest eigenvalue as the largest eigenpairs of the shifted
+    Laplacian, which ARPACK only needs matrix-vector products for. Graphs too small for
+    ARPACK (k >= n - 1) are solved densely
+
+    Returns (1) eigenvalues (numpy array, increasing); (2) eigenvectors (n x k numpy array)
+    """
+    n = L.shape[0]
+    if k >= n - 1:
+        w, U = np.linalg.eigh(L.toarray())
+        return w[:k], U[:, :k]
+
+    shifted = L.shifted()
+    mu, U = eigsh(shifted, k=k, which='LA', v0=v0)
+    order = np.argsort(mu)[::-1]
+    return shifted.shift - mu[order], U[:, order]
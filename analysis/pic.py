@@ -0,0 +1,119 @@
+"""
+__author__ = Yash Patel
+__name__   = pic.py
+__description__ = Power iteration clustering (Lin & Cohen, ICML 2010). Truncated power
+iteration on the row-normalized affinity D^{-1} A gives a low-dimensional embedding that
+separates clusters long before it converges, at one sparse product per iteration and
+without any eigensolve
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix, diags
+
+from analysis.spectral import kmeans_stage, labels_to_partitions
+
+def _start_vectors(degrees, num_vectors, rng):
+    """Given the node degrees, the number of start vectors, and a random state, builds the
+    start vectors: the degree vector first, followed by random positive vectors, all
+    scaled to unit L1 norm
+
+    Returns Start vectors (n x num_vectors numpy array)
+    """
+    V = rng.rand(len(degrees), num_vectors)
+    V[:, 0] = degrees
+    return V / V.sum(axis=0)
+
+def pic_embedding(S, num_vectors=4, max_iter=100, tol=1e-5, random_state=None):
+    """Given a sparse similarity (adjacency) matrix S, the number of start vectors, the
+    maximum number of iterations, the acceleration tolerance (scaled by 1 / n), and a random
+    seed, runs truncated power iteration on D^{-1} A for all start vectors at once, as one
+    sparse product with an n x num_vectors block per iteration. Each vector is frozen once
+    its acceleration (the largest change in its per-iteration step) falls below tol / n,
+    the point at which it has separated the clusters but not yet collapsed onto a constant
+
+    Returns (1) embedding (n x num_vectors numpy array, columns standardized);
+    (2) iterations run (int)
+    """
+    S = csr_matrix(S, dtype=np.float64)
+    n = S.shape[0]
+    rng = np.random.RandomState(random_state)
+
+    degrees = np.asarray(S.sum(axis=1)).ravel()
+    inv_degrees = np.zeros(n)
+    inv_degrees[degrees > 0] = 1.0 / degrees[degrees > 0]
+    W = diags(inv_degrees) @ S
+
+    V = _start_vectors(degrees, num_vectors, rng)
+    velocity = np.zeros_like(V)
+    active = np.arange(num_vectors)
+    threshold = tol / n
+
+    for iteration in range(1, max_iter + 1):
+        product = W @ V[:, active]
+        product /= np.maximum(np.abs(product).sum(axis=0), np.finfo(np.float64).tiny)
+
+        step = product - V[:, active]
+        acceleration = np.abs(step - velocity[:, active]).max(axis=0)
+        V[:, active] = product
+        velocity[:, active] = step
+
+        if iteration > 1:
+            active = active[acceleration >= threshold]
+        if len(active) == 0:
+            break
+    print("Power iteration stopped after {} iterations".format(iteration))
+
+    V = V - V.mean(axis=0)
+    scale = V.std(axis=0)
+    V[:, scale > 0] /= scale[scale > 0]
+    return V, iteration
+
+def pic_labels(S, k, num_vectors=None, max_iter=100, tol=1e-5, n_init=10,
+    processes=None, random_state=None):
+    """Given a sparse similarity (adjacency) matrix S, the number of clusters k, the number
+    of start vectors (None uses k), the iteration limit and acceleration tolerance, the
+    number of k-means restarts and worker processes, and a random seed, clusters the power
+    iteration embedding with the shared k-means stage
+
+    Returns Labels (numpy array of ints)
+    """
+    rng = np.random.RandomState(random_state)
+    V, _ = pic_embedding(S, num_vectors=num_vectors or k, max_iter=max_iter, tol=tol,
+        random_state=rng.randint(np.iinfo(np.int32).max))
+    labels, _ = kmeans_stage(V, k, n_init=n_init, processes=processes,
+        random_state=rng.randint(np.iinfo(np.int32).max))
+    return labels
+
+def pic_analysis(S, k, num_vectors=None, max_iter=100, tol=1e-5, random_state=None):
+    """Given a sparse similarity (adjacency) matrix S, the number of clusters k, the number of
+    start vectors, the iteration limit and acceleration tolerance, and a random seed, runs
+    power iteration clustering. Clusters are returned as a list of sets, where the contents
+    of the first set are the nodes that belong to "cluster 1"
+
+    Returns Partitions (list of sets of ints)
+    """
+    labels = pic_labels(S, k, num_vectors=num_vectors, max_iter=max_iter, tol=tol,
+        random_state=random_state)
+    print("Completed power iteration partitioning")
+    return labels_to_partitions(labels, k)
+
+class PowerIterationClustering:
+    """Power iteration clustering with the scikit-learn fit_predict interface, run directly
+    on the similarity matrix (graph_input) so it can be registered in algorithms.py
+    """
+    graph_input = True
+
+    def __init__(self, n_clusters=8, num_vectors=None, max_iter=100, tol=1e-5,
+        n_init=10, random_state=None):
+        self.n_clusters   = n_clusters
+        self.num_vectors  = num_vectors
+        self.max_iter     = max_iter
+        self.tol          = tol
+        self.n_init       = n_init
+        self.random_state = random_state
+
+    def fit_predict(self, S):
+        self.labels_ = pic_labels(S, self.n_clusters, num_vectors=self.num_vectors,
+            max_iter=self.max_iter, tol=self.tol, n_init=self.n_init,
+            random_state=self.random_state)
+        return self.labels_
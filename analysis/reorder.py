@@ -0,0 +1,165 @@
+"""
+__author__ = Yash Patel
+__name__   = reorder.py
+__description__ = Cache-friendly reordering of the similarity matrix. Addresses are numbered
+by first appearance in the transaction data, which scatters neighbors across memory; these
+orderings permute the CSR so that neighbors sit close together, and keep the permutation so
+results map back to the original address IDs
+"""
+
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import breadth_first_order, connected_components, \
+    reverse_cuthill_mckee
+
+from analysis.community import Louvain
+from analysis.embedding import _normalized_eigenpairs
+
+ORDERINGS = ["none", "rcm", "degree", "bfs", "community"]
+
+def _degrees(S):
+    """Given a sparse similarity (adjacency) matrix S (CSR), counts the neighbors of each node
+
+    Returns Degrees (numpy array of ints)
+    """
+    return np.diff(S.indptr)
+
+def _bfs_order(S):
+    """Given a sparse similarity (adjacency) matrix S (CSR), orders the nodes by a breadth-first
+    search started from the highest-degree node of every connected component. Components are
+    joined through a virtual root connected to each of their hubs, so a single BFS call covers
+    the whole graph no matter how many components there are
+
+    Returns Permutation (numpy array of ints)
+    """
+    n = S.shape[0]
+    num_components, components = connected_components(S, directed=False)
+    degrees = _degrees(S)
+
+    # hub of each component: last node in (component, degree) order
+    order = np.lexsort((degrees, components))
+    last_of_component = np.r_[components[order][1:] != components[order][:-1], True]
+    hubs = order[last_of_component]
+
+    root_edges = csr_matrix((np.ones(num_components), (np.full(num_components, n), hubs)),
+        shape=(n + 1, n + 1))
+    augmented = csr_matrix((S.data, S.indices, np.r_[S.indptr, S.indptr[-1]]),
+        shape=(n + 1, n + 1)) + root_edges
+    order = breadth_first_order(augmented, n, directed=False, return_predecessors=False)
+    return order[1:]
+
+def _community_order(S, random_state):
+    """Given a sparse similarity (adjacency) matrix S (CSR), groups nodes by their Louvain
+    community, keeping breadth-first order within each community
+
+    Returns Permutation (numpy array of ints)
+    """
+    labels = Louvain(random_state=random_state).fit_predict(S)
+    bfs_rank = np.empty(S.shape[0], dtype=np.int64)
+    bfs_rank[_bfs_order(S)] = np.arange(S.shape[0])
+    return np.lexsort((bfs_rank, labels))
+
+def reorder_permutation(S, method="rcm", random_state=None):
+    """Given a sparse similarity (adjacency) matrix S and an ordering method ('none', 'rcm'
+    for reverse Cuthill-McKee, 'degree' for decreasing degree, 'bfs', or 'community'), finds
+    the node permutation: new index i holds the node that had index perm[i]
+
+    Returns Permutation (numpy array of ints)
+    """
+    S = csr_matrix(S)
+    if method == "none":
+        return np.arange(S.shape[0])
+    elif method == "rcm":
+        return reverse_cuthill_mckee(S, symmetric_mode=True).astype(np.int64)
+    elif method == "degree":
+        return np.argsort(-_degrees(S), kind="stable")
+    elif method == "bfs":
+        return _bfs_order(S)
+    elif method == "community":
+        return _community_order(S, random_state)
+    raise ValueError("Unknown ordering: {}".format(method))
+
+def permute_similarity(S, perm):
+    """Given a sparse similarity (adjacency) matrix S and a permutation, symmetrically permutes
+    the rows and columns of S
+
+    Returns Permuted similarity matrix (scipy-sparse CSR)
+    """
+    S = csr_matrix(S)
+    S = S[perm][:, perm]
+    S.sort_indices()
+    return S
+
+def reorder(S, index_to_id, method="rcm", random_state=None):
+    """Given a sparse similarity (adjacency) matrix S, the index-to-address mapping it was
+    built with, and an ordering method, permutes S and the mapping together, so partitions
+    found on the reordered matrix are written out with the right addresses as-is
+
+    Returns (1) reordered similarity matrix (scipy-sparse CSR); (2) reordered index_to_id
+    (dict); (3) permutation (numpy array of ints)
+    """
+    perm = reorder_permutation(S, method, random_state=random_state)
+    index_to_id = { new_index : index_to_id[old_index]
+        for new_index, old_index in enumerate(perm) }
+    return permute_similarity(S, perm), index_to_id, perm
+
+def bandwidth(S):
+    """Given a sparse matrix S (CSR), finds the largest distance of a nonzero from the diagonal
+
+    Returns Bandwidth (int)
+    """
+    S = S.tocoo()
+    if S.nnz == 0:
+        return 0
+    return int(np.abs(S.row - S.col).max())
+
+def benchmark_orderings(S, methods=ORDERINGS, k=2, repeats=50, random_state=0):
+    """Given a sparse similarity (adjacency) matrix S, the orderings to compare, the number of
+    eigenpairs, and the number of repeated matvecs, times every ordering: the permutation
+    itself, repeated sparse matvecs, and the eigensolve used for the spectral embedding
+    (from the same start vector). Speedups are relative to the first method given
+
+    Returns Timings per method (dict of dicts)
+    """
+    S = csr_matrix(S, dtype=np.float64)
+    rng = np.random.RandomState(random_state)
+    x  = rng.rand(S.shape[0])
+    v0 = rng.rand(S.shape[0])
+
+    results = {}
+    for method in methods:
+        start = time.time()
+        perm = reorder_permutation(S, method, random_state=random_state)
+        permuted = permute_similarity(S, perm)
+        reorder_time = time.time() - start
+
+        px = x[perm]
+        start = time.time()
+        for _ in range(repeats):
+            permuted @ px
+        matvec_time = (time.time() - start) / repeats
+
+        start = time.time()
+        _normalized_eigenpairs(permuted, k, v0=v0[perm])
+        eigensolve_time = time.time() - start
+
+        results[method] = {
+            "bandwidth" : bandwidth(permuted),
+            "reorder"   : reorder_time,
+            "matvec"    : matvec_time,
+            "eigensolve": eigensolve_time
+        }
+
+    baseline = results[methods[0]]
+    print("{:<10} {:>12} {:>10} {:>12} {:>9} {:>12} {:>9}".format("ordering",
+        "bandwidth", "reorder", "matvec", "speedup", "eigensolve", "speedup"))
+    for method in methods:
+        result = results[method]
+        result["matvec_speedup"] = baseline["matvec"] / result["matvec"]
+        result["eigensolve_speedup"] = baseline["eigensolve"] / result["eigensolve"]
+        print("{:<10} {:>12} {:>9.3f}s {:>11.2e}s {:>8.2f}x {:>11.3f}s {:>8.2f}x".format(
+            method, result["bandwidth"], result["reorder"], result["matvec"],
+            result["matvec_speedup"], result["eigensolve"], result["eigensolve_speedup"]))
+    return results
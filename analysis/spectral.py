@@ -9,29 +9,90 @@ import copy
 import numpy as np
 import matplotlib.pyplot as plt
 import networkx as nx
-from sklearn.cluster import KMeans, SpectralClustering
+from multiprocessing import Pool
+from sklearn.cluster import KMeans, MiniBatchKMeans, SpectralClustering, kmeans_plusplus
+from sklearn.metrics import pairwise_distances_argmin_min
+from sklearn.metrics.pairwise import rbf_kernel
+from scipy.sparse import csr_matrix
 from scipy.sparse.linalg import svds
 
-def _partition_graph(G, partition_eigenvector):
-    """Given a graph G and the eigenvector to be used for partitioning, separates
-    the nodes into three separate sets, with the first as those whose components
-    are strictly positive, second equal to 0, and third strictly negative
+from analysis.cache import cached_eigenpairs
+from analysis.operators import LaplacianOperator, laplacian_eigenpairs
+from analysis.randomized import randomized_eigenpairs
+from analysis.splittree import SplitTree
 
-    Returns Partitions (list of NetworkX Subgraphs)
+MINI_BATCH_THRESHOLD = 100000 # embeddings with more rows than this default to mini-batch
+SEED_SAMPLE_SIZE     = 10000  # number of rows k-means++ seeding is run on
+DENSE_THRESHOLD      = 300    # partitions with fewer nodes are solved with batched dense eigh
+DENSE_PAD            = 32     # dense partitions are batched by size, padded to multiples of this
+
+def _split_partition(partition, partition_eigenvector):
+    """Given a partition (array of node indices) and the eigenvector to be used for
+    partitioning, bisects the nodes into those whose components are non-negative and those
+    that are strictly negative. If every component has the same sign (degenerate Fiedler
+    vectors of disconnected partitions), it is instead cut at the largest gap in its values
+
+    Returns (1) first half; (2) second half (numpy arrays of node indices)
+    """
+    negative = partition_eigenvector < 0
+    if negative.all() or not negative.any():
+        order = np.argsort(partition_eigenvector, kind="stable")
+        gap = np.argmax(np.diff(partition_eigenvector[order])) + 1
+        return partition[order[gap:]], partition[order[:gap]]
+    return partition[~negative], partition[negative]
+
+def _dense_fiedler_batch(laplacians):
+    """Given Laplacians of similar size, finds the two smallest eigenpairs of all of them
+    with a single batched dense eigh call. Each Laplacian is padded to a common size with
+    a diagonal value above any of their eigenvalues (twice the largest degree plus one, by
+    Gershgorin), so the padding never shows up among the two smallest eigenpairs
+
+    Returns (eigenvalues, Fiedler vector) for each Laplacian (list of tuples)
+    """
+    sizes = [L.shape[0] for L in laplacians]
+    padded_size = DENSE_PAD * int(np.ceil(max(sizes) / DENSE_PAD))
+    pad_value = 2 * max(L.diagonal().max() for L in laplacians) + 1
+
+    stack = np.zeros((len(laplacians), padded_size, padded_size))
+    for b, (L, size) in enumerate(zip(laplacians, sizes)):
+        stack[b, :size, :size] = L.toarray()
+        padding = np.arange(size, padded_size)
+        stack[b, padding, padding] = pad_value
+
+    eigenvalues, eigenvectors = np.linalg.eigh(stack)
+    return [(eigenvalues[b, :2], eigenvectors[b, :size, 1])
+        for b, size in enumerate(sizes)]
+
+def _solve_partitions(A, partitions, solutions, normalize, laplacian):
+    """Given the adjacency matrix A (CSR), the current partitions, their solutions so far
+    (None where not yet solved), whether the Laplacian is to be normalized, and its name for
+    the cache, fills in the two smallest eigenpairs of every unsolved partition. Partitions
+    below DENSE_THRESHOLD nodes are grouped by padded size into batched dense solves, and
+    only the larger ones go through the sparse iterative solver. Single nodes cannot be
+    split and are marked with an empty tuple
+
+    Returns void
     """
-    partition1, partition2, partition3 = set(), set(), set()
-    for i in range(len(partition_eigenvector)):
-        cur_node = list(G.nodes())[i]
-        if partition_eigenvector[i] > 0:
-            partition1.add(cur_node)
-        elif partition_eigenvector[i] == 0:
-            partition2.add(cur_node)
-        else: partition3.add(cur_node)
+    dense_groups = {}
+    for i, partition in enumerate(partitions):
+        if solutions[i] is not None:
+            continue
+        if len(partition) == 1:
+            solutions[i] = ()
+            continue
 
-    partitions = [partition1, partition2, partition3]
-    nonempty_partitions = [partition for partition in 
-        partitions if len(partition) != 0]
-    return [G.subgraph(partition) for partition in nonempty_partitions]
+        L = LaplacianOperator(A[partition][:, partition], normalize=normalize)
+        if len(partition) < DENSE_THRESHOLD:
+            padded_size = int(np.ceil(len(partition) / DENSE_PAD))
+            dense_groups.setdefault(padded_size, []).append((i, L))
+        else:
+            s, U = cached_eigenpairs(L, 2, laplacian, lambda : _smallest_eigenpairs(L, 2))
+            solutions[i] = (s, U[:, 1])
+
+    for group in dense_groups.values():
+        indices, laplacians = zip(*group)
+        for i, solution in zip(indices, _dense_fiedler_batch(laplacians)):
+            solutions[i] = solution
 
 def _plot_eigenvalues(eigenvalues, fn):
     """Given a list of eigenvalues and filename, plots the eigenvalues 
@@ -58,52 +119,36 @@ def _plot_eigenvector(eigenvector, fn):
     plt.savefig("output/{}".format(fn))
     plt.close()
 
-def spectral_analysis(G, k=None, normalize=True):
+def spectral_analysis(G, k=None, normalize=True, k_max=None, return_tree=False):
     """Given an input graph (G), number of clusters (k), and whether the graph
     Laplacian is to be normalized (True) or not (False) runs spectral clustering
     on the graph Laplacian using hierarchial method. Clusters are returned as a list of sets,
-    where the contents of the first set are the nodes that belong to "cluster 1"
+    where the contents of the first set are the nodes that belong to "cluster 1". The
+    bisections are recorded in a split tree, which is grown up to k_max leaves (default k)
+    so that other numbers of clusters can be cut from it later without new eigensolves
 
-    Returns Partitions (list of sets of ints)
+    Returns Partitions (list of sets of ints); additionally the split tree (SplitTree) and
+    the graph nodes its indices refer to (list) if return_tree is True
     """
     EIGEN_GAP = 0.1
-    
-    if normalize:
-        # get_mat = lambda G : nx.normalized_laplacian_matrix(G).todense()
-        get_mat = lambda G : nx.normalized_laplacian_matrix(G).asfptype()
-    else: 
-        # get_mat = lambda G : nx.laplacian_matrix(G).todense()
-        get_mat = lambda G : nx.laplacian_matrix(G).asfptype()
-    
-    partitions = [G]
+    laplacian = "normalized" if normalize else "combinatorial"
+
+    nodes = list(G.nodes())
+    A = csr_matrix(nx.adjacency_matrix(G), dtype=np.float64)
+    tree = SplitTree(len(nodes))
+
+    # each leaf is only solved once: solutions persist until the leaf is split
+    leaves     = [0]
+    partitions = [tree.members(0)]
+    solutions  = [None]
     while True:
-        second_least_eigenvalues = []
-
-        min_partition_eigenvalue = None
-        best_partition = None
-        partition_eigenvector = None
-
-        for i, partition in enumerate(partitions):
-            if len(partition.nodes) > 1:
-                mat = get_mat(partition)
-                
-                # in the case of having 2 nodes, the 2nd least eigenvalue is the largest eigenvalue
-                if len(partition.nodes) == 2:
-                    U, s, _ = svds(mat, k=1, which='LM', return_singular_vectors="u")
-                    cur_eigenvector = U[:, 0]
-                    partition_eigenvalue = s[0]
-                
-                # else we can just use the smallest two eigenvalues
-                else:
-                    U, s, _ = svds(mat, k=2, which='SM', return_singular_vectors="u")
-                    cur_eigenvector = U[:, 1]
-                    partition_eigenvalue = s[1]
-                
-                # _, s, _ = np.linalg.svd(get_mat(partition))
-                if min_partition_eigenvalue is None or partition_eigenvalue < min_partition_eigenvalue:
-                    best_partition = i
-                    partition_eigenvector = cur_eigenvector
-                    min_partition_eigenvalue = partition_eigenvalue
+        _solve_partitions(A, partitions, solutions, normalize, laplacian)
+        splittable = [i for i, solution in enumerate(solutions) if solution]
+        if len(splittable) == 0:
+            break
+
+        best_partition = min(splittable, key=lambda i : solutions[i][0][1])
+        s, partition_eigenvector = solutions[best_partition]
 
         _plot_eigenvalues(s, "eigen/eigenvalues_{}.png".format(len(partitions)))
         _plot_eigenvector(partition_eigenvector, 
@@ -123,58 +168,332 @@ def spectral_analysis(G, k=None, normalize=True):
                 k = 1
             print("Partitioning into {} clusters".format(k))
 
-        if len(partitions) >= k:
+        if len(partitions) >= max(k, k_max or 0):
             break
 
-        new_partitions = _partition_graph(partitions[best_partition], partition_eigenvector)
-        del partitions[best_partition] 
+        halves = _split_partition(partitions[best_partition], partition_eigenvector)
+        children = tree.split(leaves[best_partition], *halves, s[1])
+        del leaves[best_partition]
+        del partitions[best_partition]
+        del solutions[best_partition]
         
-        if len(partitions + new_partitions) > k:
-            new_partitions = [nx.compose(new_partitions[0], new_partitions[1]), new_partitions[2]]
-        partitions += new_partitions
-    print("Completed partitioning w/ {} partitions".format(k))
-    # return partitions
+        leaves     += children
+        partitions += [tree.members(child) for child in children]
+        solutions  += [None, None]
+    print("Completed partitioning w/ {} partitions".format(min(k, len(partitions))))
 
-    partitions = [set(partition.nodes()) for partition in partitions]
+    partitions = [{ nodes[i] for i in partition } for partition in tree.cut(k)]
+    if return_tree:
+        return partitions, tree, nodes
     return partitions
 
-def kmeans_analysis(G, k):
-    """Given an input graph (G) and number of clusters (k), runs spectral clustering
-    on the graph Laplacian using k-means. Clusters are returned as a list of sets,
-    where the contents of the first set are the nodes that belong to "cluster 1"
+def kmeans_analysis(G, k, processes=None):
+    """Given an input graph (G), number of clusters (k), and the number of worker
+    processes the k-means restarts are spread over, runs spectral clustering on the graph
+    Laplacian using k-means. Clusters are returned as a list of sets, where the contents
+    of the first set are the nodes that belong to "cluster 1"
 
     Returns Partitions (list of sets of ints)
     """
     print("Partitioning w/ k-means on {} clusters".format(k))
     
-    L = nx.laplacian_matrix(G).asfptype()
-    return kmean_spectral(L, k)
+    L = LaplacianOperator(nx.adjacency_matrix(G))
+    return kmean_spectral(L, k, processes=processes)
 
-def kmean_spectral(L, k):
-    """Given an input matrix and number of clusters k, runs spectral clustering
-    on the graph Laplacian using k-means. Clusters are returned as a list of sets,
-    where the contents of the first set are the nodes that belong to "cluster 1"
+def _smallest_eigenpairs(L, k):
+    """Given a (positive semi-definite) Laplacian L and the number of eigenpairs k, finds
+    the k eigenpairs of smallest eigenvalue: matrix-free through the shifted Laplacian for
+    Laplacian operators, and through a truncated SVD for explicit matrices
 
-    Returns Partitions (list of sets of ints)
+    Returns (1) eigenvalues (numpy array); (2) eigenvectors (n x k numpy array)
+    """
+    if isinstance(L, LaplacianOperator):
+        return laplacian_eigenpairs(L, k)
+    U, s, _ = svds(L, k=k, which='SM', return_singular_vectors="u")
+    return s, U
+
+def _solver_eigenpairs(L, k, solver, oversample, n_iter, random_state):
+    """Given a Laplacian L, the number of eigenpairs k, the solver ('arpack' or
+    'randomized'), and the randomized solver's oversampling, power iterations, and seed,
+    finds the k eigenpairs of smallest eigenvalue. The randomized solver prints its
+    largest residual so its quality can be checked against ARPACK
+
+    Returns (1) eigenvalues (numpy array); (2) eigenvectors (n x k numpy array)
     """
-    U, _, _ = svds(L, k=k, which='SM', return_singular_vectors="u")
+    if solver == "arpack":
+        return _smallest_eigenpairs(L, k)
+    elif solver == "randomized":
+        w, U, residuals = randomized_eigenpairs(L, k, oversample=oversample,
+            n_iter=n_iter, random_state=random_state)
+        print("Randomized eigensolve: max residual {:.3e}".format(residuals.max()))
+        return w, U
+    raise ValueError("Unknown eigensolver: {}".format(solver))
+
+def labels_to_partitions(labels, k=None):
+    """Given an array of cluster labels (one per node) and optionally the number of
+    clusters k, converts the labels into partitions. Nodes labelled -1 are skipped
 
-    guesses = KMeans(n_clusters=k, n_jobs=-1).fit_predict(U)
+    Returns Partitions (list of sets of ints)
+    """
+    labels = np.asarray(labels)
+    if k is None:
+        k = int(labels.max()) + 1 if len(labels) > 0 else 0
     partitions = [set() for _ in range(k)]
-    for i, guess in enumerate(guesses):
-        partitions[guess].add(i)
+    for i, guess in enumerate(labels):
+        if guess >= 0:
+            partitions[guess].add(i)
+    return partitions
+
+def normalize_rows(U):
+    """Given an embedding matrix U (n x k), scales each row to unit length, as done
+    in the Ng-Jordan-Weiss formulation of spectral clustering. Rows that are entirely
+    zero are left untouched
+
+    Returns Row-normalized embedding (n x k numpy array)
+    """
+    norms = np.linalg.norm(U, axis=1)
+    norms[norms == 0] = 1.0
+    return U / norms[:, np.newaxis]
+
+_restart_embedding = None # embedding shared by the k-means restarts of a worker process
+
+def _set_restart_embedding(U):
+    """Given an embedding U, stores it for the k-means restarts run in this process. Used as
+    the initializer of the restart pool, so U is sent to each worker once rather than
+    with every restart
+
+    Returns void
+    """
+    global _restart_embedding
+    _restart_embedding = U
+
+def _kmeans_restart(restart, U=None):
+    """Given a tuple of (k, seed, mini_batch, batch_size, sample_size) and an embedding
+    (by default the one set by _set_restart_embedding), runs a single k-means fit seeded
+    with k-means++ on a random subsample of the rows. Defined at module level so it can
+    be dispatched to a process pool
+
+    Returns (1) inertia (float); (2) labels (numpy array); (3) centroids (numpy array)
+    """
+    if U is None:
+        U = _restart_embedding
+    k, seed, mini_batch, batch_size, sample_size = restart
+    rng = np.random.RandomState(seed)
+
+    n = U.shape[0]
+    if n > sample_size:
+        sample = U[rng.choice(n, sample_size, replace=False)]
+    else: sample = U
+    init, _ = kmeans_plusplus(sample, n_clusters=k, random_state=seed)
+
+    if mini_batch:
+        km = MiniBatchKMeans(n_clusters=k, init=init, n_init=1,
+            batch_size=batch_size, random_state=seed)
+    else:
+        km = KMeans(n_clusters=k, init=init, n_init=1, random_state=seed)
+    km.fit(U)
+    return km.inertia_, km.labels_, km.cluster_centers_
+
+def kmeans_stage(U, k, n_init=10, mini_batch=None, batch_size=4096,
+    sample_size=SEED_SAMPLE_SIZE, processes=None, random_state=None):
+    """Given an embedding U (n x d), number of clusters k, the number of independent
+    restarts, whether to use mini-batch k-means (None picks it automatically for
+    embeddings above MINI_BATCH_THRESHOLD rows), the mini-batch size, the number of rows
+    k-means++ seeding is run on, the number of worker processes (None or 1 runs the
+    restarts serially), and a random seed, runs the restarts and keeps the one with
+    the lowest inertia
+
+    Returns (1) labels (numpy array of ints); (2) centroids (k x d numpy array)
+    """
+    U = np.asarray(U, dtype=np.float64)
+    if mini_batch is None:
+        mini_batch = U.shape[0] > MINI_BATCH_THRESHOLD
+
+    seeds = np.random.RandomState(random_state).randint(
+        np.iinfo(np.int32).max, size=n_init)
+    restarts = [(k, seed, mini_batch, batch_size, sample_size) for seed in seeds]
+
+    if processes is None or processes == 1 or n_init == 1:
+        results = [_kmeans_restart(restart, U) for restart in restarts]
+    else:
+        with Pool(processes=min(processes, n_init), initializer=_set_restart_embedding,
+            initargs=(U,)) as pool:
+            results = pool.map(_kmeans_restart, restarts)
+
+    _, labels, centroids = min(results, key=lambda result: result[0])
+    return labels, centroids
+
+def spectral_labels(L, k, normalize=False, n_init=10, mini_batch=None, processes=None,
+    random_state=None, laplacian=None, solver="arpack", oversample=10, n_iter=4):
+    """Given an input matrix and number of clusters k, embeds the nodes using the k
+    eigenvectors of the smallest eigenvalues and clusters the embedding with k-means.
+    If normalize is True, the rows of the embedding are scaled to unit length (NJW)
+    before clustering. The eigenpairs are looked up in the embedding cache under the
+    given Laplacian type (by default that of the operator L) first, and otherwise found
+    with the given solver ('arpack' or 'randomized', the latter controlled by oversample,
+    n_iter, and random_state). The remaining parameters are passed through to kmeans_stage
+
+    Returns Labels (numpy array of ints)
+    """
+    if laplacian is None:
+        laplacian = "normalized" if getattr(L, "normalize", False) else "combinatorial"
+    if solver != "arpack":
+        laplacian = "{}-{}".format(laplacian, solver)
+    _, U = cached_eigenpairs(L, k, laplacian, lambda : _solver_eigenpairs(
+        L, k, solver, oversample, n_iter, random_state))
+    if normalize:
+        U = normalize_rows(U)
+
+    guesses, _ = kmeans_stage(U, k, n_init=n_init, mini_batch=mini_batch,
+        processes=processes, random_state=random_state)
+    return guesses
+
+def kmean_spectral(L, k, normalize=False, n_init=10, mini_batch=None, processes=None,
+    random_state=None, solver="arpack", oversample=10, n_iter=4):
+    """Given an input matrix and number of clusters k, runs spectral clustering
+    on the graph Laplacian using k-means. If normalize is True, the rows of the
+    embedding are scaled to unit length (NJW) before clustering. The remaining
+    parameters are passed through to spectral_labels. Clusters are returned as a list
+    of sets, where the contents of the first set are the nodes that belong to "cluster 1"
+
+    Returns Partitions (list of sets of ints)
+    """
+    guesses = spectral_labels(L, k, normalize=normalize, n_init=n_init,
+        mini_batch=mini_batch, processes=processes, random_state=random_state,
+        solver=solver, oversample=oversample, n_iter=n_iter)
+    partitions = labels_to_partitions(guesses, k)
     print("Completed k-means partitioning")
     return partitions
 
-def spectral_analysis_alt(L, k=None, normalize=True):
+def _add_centroids(U, centroids, k, rng):
+    """Given an embedding U, the current centroids, the number of centroids wanted k, and a
+    random state, picks centroids one at a time with k-means++ weighting (probability
+    proportional to the squared distance to the closest existing centroid) until there are
+    k. The closest distances are found once (in chunks) and then only updated against each
+    new centroid, so no n x k x d temporary is built
+
+    Returns Centroids (k x d numpy array)
+    """
+    _, distances = pairwise_distances_argmin_min(U, centroids)
+    squared = distances ** 2
+    while len(centroids) < k:
+        if squared.sum() == 0:
+            new_centroid = U[rng.randint(U.shape[0])]
+        else:
+            new_centroid = U[rng.choice(U.shape[0], p=squared / squared.sum())]
+        centroids = np.vstack((centroids, new_centroid))
+        squared = np.minimum(squared, ((U - new_centroid) ** 2).sum(axis=1))
+    return centroids
+
+def _warm_start_run(run):
+    """Given a tuple of (embedding, increasing run of ks, random seed), clusters the
+    k-column prefix of the embedding for every k of the run. The first k is seeded with
+    k-means++; each later k starts from the previous solution's clusters, re-centered in
+    the wider prefix, plus one new centroid. Defined at module level so that runs can be
+    dispatched to a process pool
+
+    Returns Labels for each k (list of numpy arrays)
+    """
+    U, ks, seed = run
+    rng = np.random.RandomState(seed)
+
+    run_labels = []
+    labels = None
+    for k in ks:
+        U_k = U[:, :k]
+        if labels is None:
+            labels, _ = kmeans_stage(U_k, k, random_state=seed)
+        else:
+            centroids = np.array([U_k[labels == c].mean(axis=0)
+                for c in range(labels.max() + 1) if np.any(labels == c)])
+            centroids = _add_centroids(U_k, centroids, k, rng)
+            labels = KMeans(n_clusters=k, init=centroids, n_init=1).fit_predict(U_k)
+        run_labels.append(labels)
+    return run_labels
+
+def _graph_eigenpairs(G, k):
+    """Given an input graph (G) and the number of eigenpairs k, finds the k smallest
+    eigenpairs of its combinatorial Laplacian through the embedding cache, so callers
+    that need the same eigenpairs of one graph share a single eigensolve
+
+    Returns (1) eigenvalues (numpy array); (2) eigenvectors (n x k numpy array)
+    """
+    L = LaplacianOperator(nx.adjacency_matrix(G))
+    return cached_eigenpairs(L, k, "combinatorial", lambda : _smallest_eigenpairs(L, k))
+
+def eigengap_k(eigenvalues):
+    """Given the smallest eigenvalues of a Laplacian (sorted increasingly), guesses the
+    number of clusters as the k that maximizes the gap between the kth and (k+1)th
+    eigenvalues
+
+    Returns Number of clusters (int)
+    """
+    return int(np.argmax(np.diff(eigenvalues))) + 1
+
+def guess_k(G, k_max):
+    """Given an input graph (G) and the largest number of clusters k_max, guesses the
+    number of clusters from the eigengap of the k_max smallest Laplacian eigenvalues. The
+    eigenpairs are cached, so a following multi_k_analysis(G, k_max) does not solve again
+
+    Returns Number of clusters (int)
+    """
+    eigenvalues, _ = _graph_eigenpairs(G, k_max)
+    return eigengap_k(eigenvalues)
+
+def multi_k_analysis(G, k_max, ks=None, processes=None, random_state=None):
+    """Given an input graph (G), the largest number of clusters k_max, the numbers of
+    clusters to produce partitions for (all of 2..k_max by default), the number of worker
+    processes, and a random seed, runs spectral clustering with k-means for every k while
+    only solving for the first k_max eigenvectors once: partition k clusters the k-column
+    prefix of that embedding. Consecutive ks are split into runs, one per worker, and
+    within a run each k is warm-started from the centroids of k - 1
+
+    Returns (1) Partitions for each k (dictionary of int -> list of sets of ints);
+    (2) the k_max smallest eigenvalues (numpy array)
+    """
+    if ks is None:
+        ks = range(2, k_max + 1)
+    ks = sorted(set(k for k in ks if k <= k_max))
+
+    eigenvalues, U = _graph_eigenpairs(G, k_max)
+    print("Solved for {} eigenvectors, clustering for {} values of k".format(k_max, len(ks)))
+
+    num_runs = 1 if processes is None else max(1, min(processes, len(ks)))
+    seeds = np.random.RandomState(random_state).randint(
+        np.iinfo(np.int32).max, size=num_runs)
+    runs = [(U, list(run), seed) for run, seed in
+        zip(np.array_split(ks, num_runs), seeds) if len(run) > 0]
+
+    if num_runs == 1:
+        run_labels = [_warm_start_run(run) for run in runs]
+    else:
+        with Pool(processes=num_runs) as pool:
+            run_labels = pool.map(_warm_start_run, runs)
+
+    partitions = {}
+    for (_, run_ks, _), labels in zip(runs, run_labels):
+        for k, k_labels in zip(run_ks, labels):
+            partitions[int(k)] = labels_to_partitions(k_labels, k)
+    return partitions, eigenvalues
+
+def spectral_analysis_alt(L, k=None, normalize=True, solver=None, oversample=10, n_iter=4,
+    random_state=None):
     """Given an input graph (G), number of clusters (k), and whether the graph
     Laplacian is to be normalized (True) or not (False) runs spectral clustering
-    as implemented in scikit-learn (empirically found to be less effective)
+    as implemented in scikit-learn (empirically found to be less effective). If solver
+    is 'randomized', the same RBF affinity is built but its embedding is found with the
+    randomized eigensolver (controlled by oversample, n_iter, and random_state)
 
     Returns Partitions (list of sets of ints)
     """
-    sc = SpectralClustering(k, n_init=10, n_jobs=-1)
-    labels = sc.fit_predict(L)
+    if solver == "randomized":
+        A = rbf_kernel(L)
+        labels = spectral_labels(LaplacianOperator(A, normalize=normalize), k,
+            normalize=normalize, random_state=random_state, solver=solver,
+            oversample=oversample, n_iter=n_iter)
+    else:
+        sc = SpectralClustering(k, n_init=10, n_jobs=-1)
+        labels = sc.fit_predict(L)
     
     partitions = [set() for _ in range(k)]
     for i, guess in enumerate(labels):
@@ -0,0 +1,133 @@
+"""
+__author__ = Yash Patel
+__name__   = splittree.py
+__description__ = Binary split tree recorded by hierarchical spectral clustering. Nodes are
+kept in an order where every subtree is a contiguous index range, so the partitions for any
+number of clusters (or any eigenvalue threshold) are cut from the tree in O(n) without
+solving any further eigenproblems
+"""
+
+import numpy as np
+
+class SplitTree:
+    """Binary tree of the bisections made by hierarchical spectral clustering. Tree node i
+    covers order[start[i]:stop[i]], its children split that range in two, and fiedler[i]
+    and rank[i] are the Fiedler value it was split at and the position of that split in the
+    greedy split sequence (inf and -1 for nodes that were never split). Children are always
+    created after their parent, so tree node IDs are in topological order
+    """
+    def __init__(self, n):
+        self.order   = np.arange(n)
+        self.parent  = [-1]
+        self.left    = [-1]
+        self.right   = [-1]
+        self.start   = [0]
+        self.stop    = [n]
+        self.fiedler = [np.inf]
+        self.rank    = [-1]
+
+    def __len__(self):
+        return len(self.parent)
+
+    def members(self, node):
+        """Given a tree node, finds the graph nodes it covers
+
+        Returns Node indices (numpy array of ints)
+        """
+        return self.order[self.start[node]:self.stop[node]]
+
+    def num_leaves(self):
+        """Finds the number of clusters obtained when every recorded split is applied
+
+        Returns Number of leaves (int)
+        """
+        return (len(self) + 1) // 2
+
+    def split(self, node, left_members, right_members, fiedler):
+        """Given a leaf, the graph nodes going to each side, and the Fiedler value the split
+        was made at, records the split, rearranging the leaf's range so each child covers
+        a contiguous range of its own
+
+        Returns (1) left child; (2) right child (ints)
+        """
+        rank = (len(self) - 1) // 2
+        start, stop = self.start[node], self.stop[node]
+        mid = start + len(left_members)
+        self.order[start:mid] = left_members
+        self.order[mid:stop]  = right_members
+
+        children = []
+        for child_start, child_stop in [(start, mid), (mid, stop)]:
+            children.append(len(self))
+            self.parent.append(node)
+            self.left.append(-1)
+            self.right.append(-1)
+            self.start.append(child_start)
+            self.stop.append(child_stop)
+            self.fiedler.append(np.inf)
+            self.rank.append(-1)
+
+        self.left[node], self.right[node] = children
+        self.fiedler[node] = fiedler
+        self.rank[node] = rank
+        return tuple(children)
+
+    def _leaves(self, is_split):
+        """Given which tree nodes are to be split, walks the tree top-down (a node is only
+        reached if its parent was split) and collects the reached nodes that are not split
+
+        Returns Partitions (list of numpy arrays of node indices)
+        """
+        parent = np.asarray(self.parent)
+        reached = np.zeros(len(self), dtype=bool)
+        reached[0] = True
+        for node in range(1, len(self)):
+            reached[node] = reached[parent[node]] and is_split[parent[node]]
+        leaves = np.flatnonzero(reached & ~is_split)
+        return [self.members(node) for node in leaves]
+
+    def cut(self, k):
+        """Given a number of clusters k, applies the first k - 1 splits made by the greedy
+        hierarchical splitter, which gives the same partitions as running it with that k
+        (at most num_leaves() partitions can be returned)
+
+        Returns Partitions (list of numpy arrays of node indices)
+        """
+        rank = np.asarray(self.rank)
+        return self._leaves((rank >= 0) & (rank < k - 1))
+
+    def cut_threshold(self, threshold):
+        """Given an eigenvalue threshold, applies every split made at a Fiedler value of
+        at most the threshold (i.e. keeps cutting while the cut is cheap enough)
+
+        Returns Partitions (list of numpy arrays of node indices)
+        """
+        rank = np.asarray(self.rank)
+        return self._leaves((rank >= 0) & (np.asarray(self.fiedler) <= threshold))
+
+    def save(self, fn):
+        """Given a filename, saves the tree as a compressed numpy archive
+
+        Returns void
+        """
+        np.savez_compressed(fn, order=self.order,
+            parent=np.asarray(self.parent, dtype=np.int64),
+            left=np.asarray(self.left, dtype=np.int64),
+            right=np.asarray(self.right, dtype=np.int64),
+            start=np.asarray(self.start, dtype=np.int64),
+            stop=np.asarray(self.stop, dtype=np.int64),
+            fiedler=np.asarray(self.fiedler, dtype=np.float64),
+            rank=np.asarray(self.rank, dtype=np.int64))
+
+    @classmethod
+    def load(cls, fn):
+        """Given the filename of a saved tree, loads it back
+
+        Returns Split tree (SplitTree)
+        """
+        with np.load(fn) as saved:
+            tree = cls(len(saved["order"]))
+            tree.order = saved["order"]
+            for field in ["parent", "left", "right", "start", "stop", "fiedler", "rank"]:
+                setattr(tree, field, saved[field].tolist())
+        return tree
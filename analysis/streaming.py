@@ -5,45 +5,262 @@ __description__ = Runs spectral clustering for deanonymization on the BTC networ
 in a streaming fashion (as opposed to batch processing as done in spectral.py). This
 follows the implementation described in full by:
 http://www.shivakasiviswanathan.com/ICDE16a.pdf
+Edges arrive in sparse batches and are folded into random-projection sketches of powers of
+the adjacency matrix, Y_h ~ A^h Omega (Omega is hashed per node, so it is never stored), along
+with the d x d Gram matrix of the last one, from which the embedding basis is read off at
+any time. Streaming k-means steps update the centroids from the nodes each batch touches.
+The sketches hold hops x n x d floats, so memory is linear in the number of nodes (but
+independent of the number of edges, which are read once and never stored)
 """
 
-import math
-import networkx as nx
-import matplotlib.pyplot as plt
 import numpy as np
+import networkx as nx
+from scipy.sparse import issparse, triu
+from sklearn.cluster import kmeans_plusplus
+
+from analysis.spectral import labels_to_partitions, normalize_rows
+from blockchain.read import iter_edge_batches, AddressIndex
 
-def create_stream(G):
-    adj_matrix = nx.adjacency_matrix(G).todense()
-    rows, cols = adj_matrix.shape
-    for i in range(rows):
-        for j in range(cols):
-            yield (i, j, adj_matrix[i, j])
+def create_stream(G, batch_size=10000):
+    """Given an input graph (G, as a NetworkX graph or sparse adjacency matrix) and the number
+    of edges per batch, yields the edges of the graph as sparse batches (each edge once,
+    zeros never materialized)
 
-def streamSC(n, k):
+    Returns void
     """
-    streaming spectral clustering implementation used for clustering each of the
-    n datapoints into k clusters
+    A = triu(G if issparse(G) else nx.adjacency_matrix(G), format="coo")
+    for start in range(0, A.nnz, batch_size):
+        stop = start + batch_size
+        yield A.row[start:stop], A.col[start:stop], A.data[start:stop].astype(np.float64)
+
+def file_stream(fn, address_index, heuristics=None, batch_records=1000000):
+    """Given an input filename of raw edge records, the AddressIndex to number the addresses
+    with (its index_to_id maps the results back), the heuristic values whose edges are
+    kept (None keeps every edge), and the number of records per batch, yields the edges
+    of the file as sparse batches of compact indices with unit weights
+
+    Returns void
     """
-    m = 1 # dimension of feature space : nothing other than a numerical weight for us
-    l = None
+    if heuristics is not None:
+        heuristics = np.asarray(list(heuristics), dtype=np.int8)
 
-    f = 1 / (k * (1 + math.log(n)))
-    s = np.zeros(m)
-    B = np.zeros((m, l))
+    for address1, address2, heuristic in iter_edge_batches(fn, batch_records):
+        index1, index2 = address_index.map(address1, address2)
+        if heuristics is not None:
+            selected = np.isin(heuristic, heuristics)
+            index1, index2 = index1[selected], index2[selected]
+        yield index1, index2, np.ones(len(index1))
 
-def _streamEMB():
+def _hashed_projection(nodes, d, seed):
+    """Given an array of nodes, the sketch dimension d, and a seed, produces the rows of the
+    random sign projection Omega for those nodes by hashing (node, column) with splitmix64,
+    so any node's row can be regenerated without storing Omega
+
+    Returns Projection rows (len(nodes) x d numpy array of +-1 / sqrt(d))
     """
-    helper function for streaming SC used for embedding
+    with np.errstate(over="ignore"):
+        x = (np.asarray(nodes, dtype=np.uint64)[:, np.newaxis] * np.uint64(d) +
+            np.arange(d, dtype=np.uint64) + np.uint64(seed) * np.uint64(0x9E3779B97F4A7C15))
+        x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        x = x ^ (x >> np.uint64(31))
+    signs = np.where(x & np.uint64(1), 1.0, -1.0)
+    return signs / np.sqrt(d)
+
+def _streamEMB(Y, gram, rows, cols, weights, seed):
+    """Given the sketches Y (hops x n x d), the Gram matrix of the last sketch, a batch of
+    edges (rows, cols, weights) and the projection seed, adds the batch to the sketches:
+    each edge (i, j) adds Omega_j to the first sketch of i and the (h-1)-hop sketch of j to
+    the h-hop sketch of i (and vice versa). Walks are thus counted when their last edge
+    arrives, which gives a one-pass estimate of A^h Omega (exact for h = 1) that separates
+    clusters far better than A Omega on sparse graphs, where nodes of the same cluster
+    rarely share direct neighbors. The Gram matrix is updated for the touched rows only
+
+    Returns Touched nodes (numpy array of ints)
     """
-    pass
+    hops, _, d = Y.shape
+    touched = np.unique(np.concatenate((rows, cols)))
+    old = Y[-1, touched]
+
+    # highest hop first, so every hop is extended with the pre-batch lower hop
+    for h in range(hops - 1, -1, -1):
+        if h == 0:
+            to_rows, to_cols = _hashed_projection(cols, d, seed), _hashed_projection(rows, d, seed)
+        else:
+            to_rows, to_cols = Y[h - 1, cols], Y[h - 1, rows]
+        np.add.at(Y[h], rows, weights[:, np.newaxis] * to_rows)
+        np.add.at(Y[h], cols, weights[:, np.newaxis] * to_cols)
 
-def _streamKMstep():
+    new = Y[-1, touched]
+    gram += new.T @ new - old.T @ old
+    return touched
+
+def _embed(Y_rows, basis):
+    """Given rows of the sketch and the current embedding basis (d x k, orthonormal),
+    projects the rows onto the basis, normalizes them (NJW), and expresses them back in
+    sketch coordinates, so centroids stay comparable when the basis rotates between batches
+
+    Returns Embedded rows (numpy array, one row per given row, in sketch coordinates)
     """
-    helper function for streaming SC used for KM clustering
+    return normalize_rows(Y_rows @ basis) @ basis.T
+
+def _streamKMstep(centroids, counts, X):
+    """Given the current centroids, the number of points each has absorbed, and a batch of
+    embedded points, assigns each point to its nearest centroid and moves every centroid
+    towards the mean of its new points with a per-centroid learning rate of
+    (new points) / (all points absorbed), as in mini-batch k-means
+
+    Returns Labels of the batch (numpy array of ints)
     """
-    pass
+    distances = (X ** 2).sum(axis=1)[:, np.newaxis] - 2 * X @ centroids.T + \
+        (centroids ** 2).sum(axis=1)[np.newaxis, :]
+    labels = np.argmin(distances, axis=1)
 
+    k = len(centroids)
+    batch_counts = np.bincount(labels, minlength=k)
+    batch_sums = np.zeros_like(centroids)
+    np.add.at(batch_sums, labels, X)
+
+    counts += batch_counts
+    updated = batch_counts > 0
+    centroids[updated] += (batch_sums[updated] -
+        batch_counts[updated, np.newaxis] * centroids[updated]) / counts[updated, np.newaxis]
+    return labels
+
+def _reseed(centroids, counts, X, rng, ratio):
+    """Given the current centroids, the (decayed) number of points each has absorbed, a batch
+    of embedded points, a random state, and a ratio, moves every centroid that has absorbed
+    less than ratio times the most popular one to a point of the batch, picked with k-means++
+    weighting (probability proportional to the squared distance to the closest live
+    centroid). This keeps centroids seeded on the poor early embeddings from dying out
+
+    Returns void
+    """
+    dead = np.flatnonzero(counts < ratio * counts.max())
+    live = np.setdiff1d(np.arange(len(centroids)), dead)
+    for centroid in dead:
+        squared = ((X[:, np.newaxis, :] - centroids[np.newaxis, live, :]) ** 2).sum(axis=2).min(axis=1)
+        if squared.sum() == 0:
+            break
+        centroids[centroid] = X[rng.choice(len(X), p=squared / squared.sum())]
+        counts[centroid] = 0
+        live = np.append(live, centroid)
 
-def streaming_analysis(stream):
-    for edge in stream:
-        v1, v2, weight = edge
\ No newline at end of file
+class StreamSC:
+    """Single-pass streaming spectral clustering over edge batches. Memory is
+    O(hops * n * d) for the sketches (one d-dimensional row per node and hop, which is what
+    lets any node be embedded at any time), plus a d x d Gram matrix and k centroids: it
+    grows with the nodes seen but not with the edges, since no adjacency matrix is ever
+    kept. Cluster assignments can be read with labels() at any point. Since the embedding
+    of a node keeps improving as more of its walks arrive, the weight of past batches in
+    the centroids is multiplied by decay after every batch, and centroids that stop
+    absorbing points (below reassign_ratio of the largest) are reseeded
+    """
+    def __init__(self, k, sketch_dim=32, hops=3, decay=0.5, reassign_ratio=0.01,
+        random_state=None):
+        self.k              = k
+        self.sketch_dim     = max(sketch_dim, k)
+        self.hops           = hops
+        self.decay          = decay
+        self.reassign_ratio = reassign_ratio
+        self.rng        = np.random.RandomState(random_state)
+        self.seed       = self.rng.randint(np.iinfo(np.int32).max)
+
+        self.n         = 0
+        self.Y         = np.zeros((hops, 1, self.sketch_dim))
+        self.degrees   = np.zeros(1)
+        self.gram      = np.zeros((self.sketch_dim, self.sketch_dim))
+        self.centroids = None
+        self.counts    = np.zeros(k)
+
+    def _grow(self, n):
+        """Given a new number of nodes, extends the sketch and degree arrays, doubling the
+        underlying arrays when they run out of capacity
+
+        Returns void
+        """
+        if n <= self.n:
+            return
+        if n > self.Y.shape[1]:
+            capacity = max(n, 2 * self.Y.shape[1])
+            Y = np.zeros((self.hops, capacity, self.sketch_dim))
+            Y[:, :self.n] = self.Y[:, :self.n]
+            degrees = np.zeros(capacity)
+            degrees[:self.n] = self.degrees[:self.n]
+            self.Y, self.degrees = Y, degrees
+        self.n = n
+
+    def basis(self):
+        """Finds the current embedding basis: the top k right singular vectors of the
+        sketch, i.e. the top k eigenvectors of its Gram matrix
+
+        Returns Basis (d x k numpy array)
+        """
+        _, V = np.linalg.eigh(self.gram)
+        return V[:, ::-1][:, :self.k]
+
+    def partial_fit(self, rows, cols, weights=None):
+        """Given a batch of edges (rows, cols, and optionally weights, by default 1), folds
+        the batch into the sketch and runs a streaming k-means step over the nodes it
+        touched. The centroids are seeded with k-means++ once k nodes have been seen
+
+        Returns self (StreamSC)
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        weights = np.ones(len(rows)) if weights is None else np.asarray(weights, dtype=np.float64)
+        if len(rows) == 0:
+            return self
+
+        self._grow(int(max(rows.max(), cols.max())) + 1)
+        np.add.at(self.degrees, rows, weights)
+        np.add.at(self.degrees, cols, weights)
+        touched = _streamEMB(self.Y, self.gram, rows, cols, weights, self.seed)
+
+        X = _embed(self.Y[-1, touched], self.basis())
+        if self.centroids is None:
+            if len(touched) < self.k:
+                return self
+            self.centroids, _ = kmeans_plusplus(X, n_clusters=self.k,
+                random_state=self.rng.randint(np.iinfo(np.int32).max))
+        self.counts *= self.decay
+        _streamKMstep(self.centroids, self.counts, X)
+        _reseed(self.centroids, self.counts, X, self.rng, self.reassign_ratio)
+        return self
+
+    def labels(self, chunk_size=100000):
+        """Given the number of nodes embedded at a time, assigns every node seen so far to
+        its nearest centroid under the current basis. Nodes without any edge yet (or
+        every node, before the centroids are seeded) are labelled -1
+
+        Returns Labels (numpy array of ints)
+        """
+        labels = np.full(self.n, -1, dtype=np.int64)
+        if self.centroids is None:
+            return labels
+
+        basis = self.basis()
+        for start in range(0, self.n, chunk_size):
+            X = _embed(self.Y[-1, start:min(start + chunk_size, self.n)], basis)
+            distances = (X ** 2).sum(axis=1)[:, np.newaxis] - 2 * X @ self.centroids.T + \
+                (self.centroids ** 2).sum(axis=1)[np.newaxis, :]
+            labels[start:start + chunk_size] = np.argmin(distances, axis=1)
+        labels[self.degrees[:self.n] == 0] = -1
+        return labels
+
+def streaming_analysis(stream, k, sketch_dim=32, hops=3, random_state=None):
+    """Given a stream of edge batches (as produced by create_stream or file_stream), the
+    number of clusters k, the sketch dimension and number of hops, and a random seed,
+    runs streaming spectral
+    clustering in a single pass over the stream. Clusters are returned as a list of sets,
+    where the contents of the first set are the nodes that belong to "cluster 1"
+
+    Returns Partitions (list of sets of ints)
+    """
+    model = StreamSC(k, sketch_dim=sketch_dim, hops=hops, random_state=random_state)
+    num_batches = 0
+    for rows, cols, weights in stream:
+        model.partial_fit(rows, cols, weights)
+        num_batches += 1
+    print("Completed streaming partitioning over {} batches".format(num_batches))
+    return labels_to_partitions(model.labels(), k)
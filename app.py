@@ -12,6 +12,7 @@ import matplotlib.pyplot as plt
 import sklearn.cluster
 
 from collections import defaultdict
+import os
 import pickle
 import time
 import sys, getopt
@@ -20,12 +21,21 @@ from prettytable import PrettyTable
 
 from algorithms import get_algorithms
 from analysis.pca import plot_pca
-from analysis.spectral import spectral_analysis, kmeans_analysis, cluster_analysis
+from analysis.spectral import spectral_analysis, kmeans_analysis, cluster_analysis, labels_to_partitions, \
+    multi_k_analysis, guess_k
 from analysis.deanonymize import write_results, draw_results, calc_accuracy, calc_accuracies
-from analysis.streaming import create_stream, streaming_analysis
-from blockchain.read import get_data
+from analysis.anytime import anytime_analysis
+from analysis.components import component_analysis
+from analysis.embedding import spectral_embedding
+from analysis.features import behavioral_features, contract_rows, get_features, scale_features
+from analysis.landmark import landmark_spectral
+from analysis.reorder import reorder, benchmark_orderings
+from analysis.streaming import create_stream, file_stream, streaming_analysis
+from blockchain.read import AddressIndex, get_data, get_data_fn
 from blockchain.metis import format_metis, run_metis
 from coarsen.contract import contract_edges, contract_edges_matching, reconstruct_contracted
+from coarsen.prune import prune_graph, reattach_partitions
+from coarsen.unionfind import union_find_file, contract_similarity, expand_partitions
 from setup.sbm import create_sbm, create_clusters
 
 DELINEATION = "**********************************************************************"
@@ -44,15 +54,30 @@ def _cmd_graph(argv):
         "run_metis"       : True,
         "run_spectral"    : True,
         "num_clusters"    : 2,
+        "k_max"           : 20,
         "run_test"        : True,
         "weighted"        : False,
         "p"               : 0.75,
         "q"               : 0.25,
 
+        "behavior"        : "none",
+        "cluster_arrays"  : False,
+        "components"      : None,
         "cs"              : None,
         "graph_coarsen"   : None,
+        "landmarks"       : None,
+        "landmark_method" : "kmeans++",
         "lib"             : "matplotlib",
-        "multi_run"       : 1
+        "multi_run"       : 1,
+        "prune"           : None,
+        "prune_core"      : 2,
+        "raw_features"    : False,
+        "reorder"         : "none",
+        "reorder_bench"   : False,
+        "streaming"       : False,
+        "time_budget"     : None,
+        "union_find"      : False,
+        "uf_heuristics"   : None
     }
 
     USAGE_STRING = """eigenvalues.py 
@@ -60,6 +85,7 @@ def _cmd_graph(argv):
             -c <cluster_size>    [(int) size of each cluster (assumed to be same for all)]
             -d <display_bool>    [(y/n) for whether to show PCA projections]
             -g <guess_bool>      [(y/n) to guess the number of clusters vs. take it as known] 
+            -k <k_max>           [(int) largest number of clusters considered when guessing]
             -m <run_metis>       [(y/n) to additionally enable METIS clustering]
             -n <num_cluster>     [(int) number of clusters (distinct people)]
             -p <p_value>         [(0,1) float for in-cluster probability]
@@ -68,12 +94,26 @@ def _cmd_graph(argv):
             -s <run_spectral>    [(y/n) to enable spectral clustering]
             -w <weighted_graph>  [(y/n) for whether to have weights on edges (randomized)]
             
+            --bf <mode>          [('none','only','stack') behavioral features used alone or stacked with the embedding]
+            --ca                 [(y/n) to also save the size, volume, cut and conductance of every cluster with the metrics]
+            --cc <min_size>      [(int) also cluster each connected component separately, taking components below min_size directly as clusters]
             --cs <cluster_sizes> [(int list) size of each cluster (comma delimited)]
             --gc <graph_coarsen> [(int) iterations of matchings found to be coarsened (default 0)]
             --lib                [('matplotlib','plotly') for plotting library]
-            --mr                 [(int) indicates how many trials to be run in testing]"""
-
-    opts, args = getopt.getopt(argv,"hb:c:d:g:m:n:p:q:r:s:w:",['lib=','cs=','gc=','mr='])
+            --lm <landmarks>     [(int) also run landmark-based approximate spectral clustering with this many landmarks]
+            --ls <method>        [('random','kmeans++') how landmarks are selected (default kmeans++)]
+            --mr                 [(int) indicates how many trials to be run in testing]
+            --pk <core>          [(int) core number the graph is peeled down to when pruning (default 2)]
+            --pr <percentile>    [(float) prune hubs above this degree percentile and peel leaves before clustering]
+            --rb                 [(y/n) to benchmark matvec/eigensolve times of every node ordering]
+            --rf                 [(y/n) to cluster raw adjacency rows instead of a spectral embedding]
+            --ro <ordering>      [('none','rcm','degree','bfs','community') node ordering of the data]
+            --st                 [(y/n) to also run single-pass streaming spectral clustering over the edges]
+            --tb <seconds>       [(float) wall-clock budget for anytime k-means spectral clustering]
+            --uf                 [(y/n) to run union-find as a baseline and contract its clusters first]
+            --uh <heuristics>    [(int list) heuristic values union-find merges on (comma delimited)]"""
+
+    opts, args = getopt.getopt(argv,"hb:c:d:g:k:m:n:p:q:r:s:w:",['lib=','bf=','ca=','cc=','cs=','gc=','lm=','ls=','mr=','pk=','pr=','rb=','rf=','ro=','st=','tb=','uf=','uh='])
     for opt, arg in opts:
         if opt in ('-h'):
             print(USAGE_STRING)
@@ -83,6 +123,7 @@ def _cmd_graph(argv):
         elif opt in ("-c"): params["cluster_size"]   = int(arg)
         elif opt in ("-d"): params["pca"]            = (arg == "y")
         elif opt in ("-g"): params["guess_clusters"] = (arg == "y")
+        elif opt in ("-k"): params["k_max"]          = int(arg)
         elif opt in ("-m"): params["run_metis"]      = (arg == "y")
         elif opt in ("-n"): params["num_clusters"]   = int(arg)
         elif opt in ("-r"): params["run_test"]       = (arg == "y")
@@ -92,10 +133,24 @@ def _cmd_graph(argv):
         elif opt in ("-p"): params["p"] = float(arg)
         elif opt in ("-q"): params["q"] = float(arg)
         
+        elif opt in ("--bf"):  params["behavior"] = arg
+        elif opt in ("--ca"):  params["cluster_arrays"] = (arg == "y")
+        elif opt in ("--cc"):  params["components"] = int(arg)
         elif opt in ("--cs"):  params["cs"] = arg
         elif opt in ("--gc"):  params["graph_coarsen"] = int(arg)
         elif opt in ("--lib"): params["lib"] = arg
+        elif opt in ("--lm"):  params["landmarks"] = int(arg)
+        elif opt in ("--ls"):  params["landmark_method"] = arg
         elif opt in ("--mr"):  params["multi_run"] = int(arg)
+        elif opt in ("--pk"):  params["prune_core"] = int(arg)
+        elif opt in ("--pr"):  params["prune"] = float(arg)
+        elif opt in ("--rb"):  params["reorder_bench"] = (arg == "y")
+        elif opt in ("--rf"):  params["raw_features"] = (arg == "y")
+        elif opt in ("--ro"):  params["reorder"] = arg
+        elif opt in ("--st"):  params["streaming"] = (arg == "y")
+        elif opt in ("--tb"):  params["time_budget"] = float(arg)
+        elif opt in ("--uf"):  params["union_find"] = (arg == "y")
+        elif opt in ("--uh"):  params["uf_heuristics"] = [int(h) for h in arg.split(",")]
 
     if params["run_test"]:
         if params["cs"] is not None:
@@ -112,6 +167,79 @@ def _pretty_format(d, header):
        t.add_row([key, d[key]])
     return str(t)
 
+def _features(S, num_clusters, raw_features, behavior="none", F=None):
+    """Given a similarity matrix S, the number of clusters, whether the raw adjacency
+    rows are to be used as features, and how the behavioral features F of the nodes are
+    used ('none', 'only', or 'stack' alongside the embedding), produces the feature matrix
+    handed to each of the clustering algorithms (a spectral embedding of dimension
+    num_clusters by default)
+
+    Returns (1) feature matrix; (2) time spent producing it (float)
+    """
+    if behavior == "only":
+        return scale_features(F), 0.0
+    if raw_features:
+        return S, 0.0
+
+    print("Embedding similarity matrix into {} dimensions...".format(num_clusters))
+    start = time.time()
+    X = spectral_embedding(S, num_clusters)
+    if behavior == "stack":
+        X = np.hstack((X, scale_features(F).toarray()))
+    return X, time.time() - start
+
+def _prune(S, params):
+    """Given a similarity matrix S and the parameters dictionary, prunes hubs and leaves
+    from S if pruning is enabled
+
+    Returns (1) kept nodes (None if pruning is disabled); (2) similarity matrix to cluster;
+    (3) time spent pruning (float)
+    """
+    if params["prune"] is None:
+        return None, S, 0.0
+    kept, S_core, stats = prune_graph(S, hub_percentile=params["prune"],
+        core=params["prune_core"])
+    return kept, S_core, stats["time"]
+
+def _reattach(S, kept, partitions, outliers):
+    """Given the unpruned similarity matrix S, the kept nodes (None if pruning is disabled),
+    and the partitions and outliers found on the pruned graph, maps them back onto S,
+    reattaching the pruned nodes to the partitions
+
+    Returns (1) partitions (list of sets of ints); (2) outliers (set of ints)
+    """
+    if kept is None:
+        return partitions, outliers
+    return reattach_partitions(S, kept, partitions), { kept[i] for i in outliers }
+
+def _stream(S, perm, params):
+    """Given the (reordered) similarity matrix S, the node ordering it was permuted with,
+    and the parameters, runs streaming spectral clustering in a single pass over the raw
+    edge records of the data fraction, or over the edges of S if the raw file is not
+    available. Addresses of the raw records are numbered as in get_data, so they are
+    mapped through the ordering onto the indices of S
+
+    Returns Partitions (list of sets of ints)
+    """
+    fn = get_data_fn(params["byte_percent"])
+    if not os.path.exists(fn):
+        return streaming_analysis(create_stream(S), params["num_clusters"])
+
+    partitions = streaming_analysis(file_stream(fn, AddressIndex()), params["num_clusters"])
+    position = np.empty(len(perm), dtype=np.int64)
+    position[perm] = np.arange(len(perm))
+    return [set(position[list(partition)].tolist()) for partition in partitions]
+
+def _algorithm_input(algorithm, S, X):
+    """Given an algorithm class, the similarity matrix S, and the feature matrix X,
+    picks the input for the algorithm: graph-native algorithms (graph_input) get S
+
+    Returns Input matrix
+    """
+    if getattr(algorithm, "graph_input", False):
+        return S
+    return X
+
 def _update_accuracies(updates, purity, nmi, rand_ind, weighted_rand_ind, alg_name):
     purity[alg_name]            += updates["purity"]
     nmi[alg_name]               += updates["nmi"]
@@ -130,7 +258,7 @@ def main(argv):
     produce_figures = True
 
     # algorithms to be used in the clustering runs (BOTH in testing and full analysis)
-    to_run = set(["DBSCAN"])
+    to_run = set(["DBSCAN", "DBSCAN-kNN", "LabelPropagation", "Louvain", "PIC"])
 
     if params["run_test"]:
         clusters = params["clusters"]
@@ -139,6 +267,17 @@ def main(argv):
         # change the line below if the remote source of the data is updated
         data_src = "https://s3.amazonaws.com/bitcoinclustering/cluster_data.dat"
         S, index_to_id = get_data(data_src, percent_bytes=params["byte_percent"])
+        F = None
+        if params["behavior"] != "none":
+            F, _ = get_features(S, params["byte_percent"])
+
+        if params["reorder_bench"]:
+            benchmark_orderings(S, k=params["num_clusters"])
+        # partitions are written through index_to_id, which is permuted along with S
+        S, index_to_id, perm = reorder(S, index_to_id, method=params["reorder"])
+        S_results = S # the index space every written partition refers to
+        if F is not None:
+            F = F[perm]
 
     if params["run_test"]:
         purity            = defaultdict(lambda: 0.0)
@@ -178,7 +317,8 @@ def main(argv):
                     timeElapsed["ManualHierarchical"] += time.time() - start
 
                     start = time.time()
-                    kmeans_cont_partitions = kmeans_analysis(G, k=num_clusters)
+                    kmeans_cont_partitions = kmeans_analysis(G, k=num_clusters,
+                        processes=os.cpu_count())
                     kmeans_partitions = reconstruct_contracted(identified_nodes, kmeans_cont_partitions)
                     timeElapsed["ManualKmeans"] += time.time() - start
 
@@ -190,17 +330,29 @@ def main(argv):
                             "ManualKmeans_cont_{}.png".format(params_fn), weigh_edges=weigh_edges)
                     
                 else:
-                    # if params["guess_clusters"]:
-                    #     num_clusters = None
-                    # else:
-                    #     num_clusters = len(clusters)
-
                     start = time.time()
-                    hier_partitions = spectral_analysis(G, k=num_clusters)
+                    hier_partitions, split_tree, _ = spectral_analysis(G, k=num_clusters, 
+                        k_max=params["k_max"] if params["guess_clusters"] else None, 
+                        return_tree=True)
                     timeElapsed["ManualHierarchical"] += time.time() - start
+                    split_tree.save("output/ManualHierarchical_tree_{}.npz".format(params_fn))
 
                     start = time.time()
-                    kmeans_partitions = kmeans_analysis(G, k=num_clusters)
+                    if params["guess_clusters"]:
+                        # k is picked by the eigengap first, and only that k is clustered
+                        # (the eigensolve is cached and shared by both steps)
+                        k_max = min(params["k_max"], n - 2)
+                        guessed_k = max(guess_k(G, k_max), 2)
+                        print("Guessed {} clusters (actual: {})".format(guessed_k, num_clusters))
+                        partitions_by_k, _ = multi_k_analysis(G, k_max, ks=[guessed_k],
+                            processes=os.cpu_count())
+                        kmeans_partitions = partitions_by_k[guessed_k]
+                    elif params["time_budget"] is not None:
+                        kmeans_partitions, _ = anytime_analysis(
+                            nx.adjacency_matrix(G), num_clusters, params["time_budget"])
+                    else:
+                        kmeans_partitions = kmeans_analysis(G, k=num_clusters,
+                            processes=os.cpu_count())
                     timeElapsed["ManualKmeans"] += time.time() - start
 
                 _update_accuracies(calc_accuracies(clusters, hier_partitions, n), 
@@ -216,11 +368,25 @@ def main(argv):
                     draw_results(G, spring_pos, kmeans_partitions, 
                         "ManualKmeans_{}.png".format(params_fn), weigh_edges=weigh_edges)
 
-            algorithms = get_algorithms(num_clusters)
+            algorithms = get_algorithms(num_clusters, embedded=not params["raw_features"])
             if params["graph_coarsen"] is not None:
                 S = nx.adjacency_matrix(contracted_G)
             else:
                 S = nx.adjacency_matrix(G)
+            # pruning only applies to the uncoarsened graph
+            S_full = S
+            kept, S, prune_time = _prune(S, params) if params["graph_coarsen"] is None \
+                else (None, S, 0.0)
+            timeElapsed["Pruning"] += prune_time
+            F = None
+            if params["behavior"] != "none":
+                F, _ = behavioral_features(S_full) # SBMs have no heuristics
+                if kept is not None:
+                    F = F[kept]
+            X, embed_time = _features(S, num_clusters, params["raw_features"],
+                params["behavior"], F)
+            print("Embedding took {:.3f}s".format(embed_time))
+            timeElapsed["Embedding"] += embed_time
             
             if params["run_metis"]:
                 metis_fn = "output/test_metis.graph"
@@ -235,6 +401,50 @@ def main(argv):
                     draw_results(G, spring_pos, metis_partitions, 
                         "Metis_{}.png".format(params_fn), weigh_edges=weigh_edges)
 
+            if params["components"] is not None:
+                print(DELINEATION)
+                print("Running connected-component partitioning...")
+                start = time.time()
+                component_partitions = component_analysis(nx.adjacency_matrix(G), num_clusters,
+                    min_size=params["components"], processes=os.cpu_count())
+                timeElapsed["Components"] += time.time() - start
+
+                _update_accuracies(calc_accuracies(clusters, component_partitions, n), 
+                    purity, nmi, rand_ind, weighted_rand_ind, "Components")
+                if produce_figures:
+                    draw_results(G, spring_pos, component_partitions, 
+                        "Components_{}.png".format(params_fn), weigh_edges=weigh_edges)
+                print(DELINEATION)
+
+            if params["landmarks"] is not None:
+                print(DELINEATION)
+                print("Running landmark partitioning...")
+                start = time.time()
+                landmark_partitions = landmark_spectral(nx.adjacency_matrix(G), num_clusters,
+                    p=params["landmarks"], method=params["landmark_method"])
+                timeElapsed["Landmark"] += time.time() - start
+
+                _update_accuracies(calc_accuracies(clusters, landmark_partitions, n), 
+                    purity, nmi, rand_ind, weighted_rand_ind, "Landmark")
+                if produce_figures:
+                    draw_results(G, spring_pos, landmark_partitions, 
+                        "Landmark_{}.png".format(params_fn), weigh_edges=weigh_edges)
+                print(DELINEATION)
+
+            if params["streaming"]:
+                print(DELINEATION)
+                print("Running streaming partitioning...")
+                start = time.time()
+                stream_partitions = streaming_analysis(create_stream(G), num_clusters)
+                timeElapsed["Streaming"] += time.time() - start
+
+                _update_accuracies(calc_accuracies(clusters, stream_partitions, n), 
+                    purity, nmi, rand_ind, weighted_rand_ind, "Streaming")
+                if produce_figures:
+                    draw_results(G, spring_pos, stream_partitions, 
+                        "Streaming_{}.png".format(params_fn), weigh_edges=weigh_edges)
+                print(DELINEATION)
+
             for alg_name in algorithms:
                 if alg_name in to_run:
                     algorithm, args, kwds = algorithms[alg_name]
@@ -244,11 +454,14 @@ def main(argv):
 
                     start = time.time()
                     if params["graph_coarsen"] is not None:
-                        cont_partitions, _ = cluster_analysis(S, algorithm, args, kwds)
+                        cont_partitions, _ = cluster_analysis(
+                            _algorithm_input(algorithm, S, X), algorithm, args, kwds)
                         partitions = reconstruct_contracted(identified_nodes, cont_partitions)
                         outliers   = None # TODO : handles outliers for contracted graphs
                     else:
-                        partitions, outliers = cluster_analysis(S, algorithm, args, kwds)
+                        partitions, outliers = cluster_analysis(
+                            _algorithm_input(algorithm, S, X), algorithm, args, kwds)
+                        partitions, outliers = _reattach(S_full, kept, partitions, outliers)
                     end = time.time()
 
                     if params["graph_coarsen"] is not None:
@@ -266,11 +479,13 @@ def main(argv):
                             weigh_edges=weigh_edges, outliers=outliers)
                     print(DELINEATION)
         
+        # every time (including the shared pruning and embedding stages) is averaged once
+        for stage in timeElapsed.keys():
+            timeElapsed[stage] /= params["multi_run"]
         print(timeElapsed)
         for accuracy_name, accuracies in accuracy_measures:
             for alg_name in accuracies.keys():
                 accuracies[alg_name]  /= params["multi_run"]
-                timeElapsed[alg_name] /= params["multi_run"]
 
             with open("output/{}_{}.txt".format(accuracy_name, params_fn),"w") as f:
                 f.write(_pretty_format(accuracies,  ["algorithm","accuracy"]))
@@ -279,23 +494,72 @@ def main(argv):
 
     else:
         num_clusters = params["num_clusters"]
-        algorithms = get_algorithms(num_clusters)
+        algorithms = get_algorithms(num_clusters, embedded=not params["raw_features"])
         weigh_edges = False
         
         print("Creating NetworkX graph...")
         # G = nx.from_scipy_sparse_matrix(S)
         # spring_pos = nx.spring_layout(G)    
 
+        if params["union_find"]:
+            uf_labels, _ = union_find_file(get_data_fn(params["byte_percent"]),
+                heuristics=params["uf_heuristics"])
+            uf_labels = uf_labels[perm]
+            write_results(labels_to_partitions(uf_labels), index_to_id, "UnionFind_guess",
+                S=S_results, cluster_arrays=params["cluster_arrays"])
+            S = contract_similarity(S, uf_labels)
+            if F is not None:
+                F = contract_rows(F, uf_labels)
+            print("Contracted union-find clusters: {} nodes remaining".format(S.shape[0]))
+        S_full = S
+        kept, S, _ = _prune(S, params)
+        if F is not None and kept is not None:
+            F = F[kept]
+        X, embed_time = _features(S, num_clusters, params["raw_features"],
+            params["behavior"], F)
+        print("Embedding took {:.3f}s".format(embed_time))
+
         for alg_name in algorithms:
             if alg_name in to_run:
                 algorithm, args, kwds = algorithms[alg_name]
                 print("Running {} partitioning...".format(alg_name))
                 
-                partitions = cluster_analysis(S, algorithm, args, kwds)
-                write_results(partitions, index_to_id, "{}_guess".format(alg_name))
+                partitions, outliers = cluster_analysis(
+                    _algorithm_input(algorithm, S, X), algorithm, args, kwds)
+                partitions, _ = _reattach(S_full, kept, partitions, outliers)
+                if params["union_find"]:
+                    partitions = expand_partitions(partitions, uf_labels)
+                write_results(partitions, index_to_id, "{}_guess".format(alg_name),
+                    S=S_results, cluster_arrays=params["cluster_arrays"])
                 # draw_results(G, spring_pos, partitions, 
                 #     "{}_guess.png".format(alg_name), weigh_edges=weigh_edges)
 
+        if params["components"] is not None:
+            print("Running connected-component partitioning...")
+            partitions = component_analysis(S, num_clusters, min_size=params["components"],
+                processes=os.cpu_count())
+            partitions, _ = _reattach(S_full, kept, partitions, set())
+            if params["union_find"]:
+                partitions = expand_partitions(partitions, uf_labels)
+            write_results(partitions, index_to_id, "Components_guess", S=S_results,
+                cluster_arrays=params["cluster_arrays"])
+
+        if params["landmarks"] is not None:
+            print("Running landmark partitioning...")
+            partitions = landmark_spectral(S, num_clusters, p=params["landmarks"],
+                method=params["landmark_method"])
+            partitions, _ = _reattach(S_full, kept, partitions, set())
+            if params["union_find"]:
+                partitions = expand_partitions(partitions, uf_labels)
+            write_results(partitions, index_to_id, "Landmark_guess", S=S_results,
+                cluster_arrays=params["cluster_arrays"])
+
+        if params["streaming"]:
+            # the stream is the raw edges: union-find contraction and pruning do not apply
+            print("Running streaming partitioning...")
+            write_results(_stream(S_results, perm, params), index_to_id, "Streaming_guess",
+                S=S_results, cluster_arrays=params["cluster_arrays"])
+
         if params["run_metis"]:
             metis_fn = "blockchain/data_{0:f}.pickle".format(percent_bytes)
             metis_partitions = metis_from_pickle(metis_fn, num_clusters)
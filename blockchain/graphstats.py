@@ -0,0 +1,233 @@
+"""
+__author__ = Yash Patel
+__name__   = graphstats.py
+__description__ = Profiles the cached similarity matrix of a data fraction before any
+parameters are chosen: degree quantiles, connected component sizes, edge counts per
+heuristic, a sampled clustering coefficient and triangle count, and an approximate
+diameter, each computed with vectorized or sampled algorithms over the CSR and timed.
+Run as "python3 -m blockchain.graphstats" (options in the help menu, run with -h)
+"""
+
+import getopt
+import json
+import os
+import sys
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from blockchain.read import get_data, get_data_fn, iter_edge_batches
+
+QUANTILES = [0.0, 0.25, 0.5, 0.75, 0.9, 0.99, 0.999, 1.0]
+
+def _pattern(S):
+    """Given a sparse similarity (adjacency) matrix S, builds its unweighted pattern without
+    self-loops
+
+    Returns Adjacency pattern (scipy-sparse CSR of ones)
+    """
+    A = csr_matrix(S, dtype=np.float64)
+    A.setdiag(0)
+    A.eliminate_zeros()
+    A.data[:] = 1.0
+    return A
+
+def degree_stats(S, A):
+    """Given a sparse similarity (adjacency) matrix S and its pattern A, finds the quantiles
+    of the number of counterparties and of the weighted degree of the addresses
+
+    Returns Degree statistics (dict)
+    """
+    counts = np.diff(A.indptr)
+    weighted = np.asarray(csr_matrix(S).sum(axis=1)).ravel()
+    return {
+        "quantiles"           : QUANTILES,
+        "counterparties"      : np.quantile(counts, QUANTILES).tolist(),
+        "weighted"            : np.quantile(weighted, QUANTILES).tolist(),
+        "mean_counterparties" : float(counts.mean()),
+        "isolated"            : int((counts == 0).sum())
+    }
+
+def component_stats(A):
+    """Given an adjacency pattern A, finds the connected components and bins their sizes
+    by powers of two
+
+    Returns Component statistics (dict)
+    """
+    num_components, labels = connected_components(A, directed=False)
+    sizes = np.bincount(labels)
+    bins = np.floor(np.log2(sizes)).astype(np.int64)
+    histogram = np.bincount(bins)
+    return {
+        "components"       : int(num_components),
+        "largest"          : int(sizes.max()),
+        "largest_fraction" : float(sizes.max() / float(len(labels))),
+        "size_histogram"   : { "{}-{}".format(2 ** b, 2 ** (b + 1) - 1) : int(count)
+            for b, count in enumerate(histogram) if count > 0 }
+    }
+
+def heuristic_stats(fn, batch_records=1000000):
+    """Given the filename of the raw edge records, counts the edges under each heuristic
+    value (None if the raw file is not available)
+
+    Returns Heuristic statistics (dict)
+    """
+    if not os.path.exists(fn):
+        return None
+    counts = np.zeros(256, dtype=np.int64)
+    for _, _, heuristic in iter_edge_batches(fn, batch_records):
+        counts += np.bincount(heuristic.astype(np.int64) + 128, minlength=256)
+    return { str(value - 128) : int(counts[value]) for value in np.flatnonzero(counts) }
+
+def triangle_stats(A, sample_size=10000, random_state=None):
+    """Given an adjacency pattern A, the number of sampled addresses, and a random seed,
+    counts the triangles through a uniform sample of addresses, as the entries of A^2 on
+    the edges of the sampled rows. The sample gives unbiased estimates of the average
+    clustering coefficient (as NetworkX defines it: 0 below two counterparties) and of
+    the total triangle count, and the latter with the exact wedge count the transitivity
+
+    Returns Triangle statistics (dict)
+    """
+    n = A.shape[0]
+    rng = np.random.RandomState(random_state)
+    sample = rng.choice(n, min(sample_size, n), replace=False)
+
+    rows = A[sample]
+    triangles = np.asarray((rows @ A).multiply(rows).sum(axis=1)).ravel() / 2
+    counts = np.diff(rows.indptr).astype(np.float64)
+    wedges = counts * (counts - 1) / 2
+    clustering = np.divide(triangles, wedges, out=np.zeros(len(sample)), where=wedges > 0)
+
+    all_counts = np.diff(A.indptr).astype(np.float64)
+    total_wedges = float((all_counts * (all_counts - 1) / 2).sum())
+    total_triangles = float(triangles.mean() * n / 3)
+    return {
+        "sample_size"        : len(sample),
+        "average_clustering" : float(clustering.mean()),
+        "triangles"          : total_triangles,
+        "transitivity"       : 3 * total_triangles / total_wedges if total_wedges > 0 else 0.0
+    }
+
+def _bfs_distances(A, source):
+    """Given an adjacency pattern A (CSR) and a source node, runs a level-synchronous BFS,
+    expanding a whole frontier at a time through the CSR rows
+
+    Returns Distances (numpy array of ints, -1 for unreachable nodes)
+    """
+    distances = np.full(A.shape[0], -1, dtype=np.int64)
+    distances[source] = 0
+    frontier, level = np.array([source]), 0
+    while len(frontier) > 0:
+        level += 1
+        neighbors = np.unique(A[frontier].indices)
+        frontier = neighbors[distances[neighbors] < 0]
+        distances[frontier] = level
+    return distances
+
+def diameter_stats(A, num_bfs=4, random_state=None):
+    """Given an adjacency pattern A, the number of BFS runs, and a random seed, estimates the
+    diameter of the largest connected component by repeated double sweeps: each BFS starts
+    from the farthest node found by the previous one (the first from a random node of the
+    component). The largest eccentricity found is a lower bound on the diameter, and twice
+    the smallest an upper bound
+
+    Returns Diameter statistics (dict)
+    """
+    _, labels = connected_components(A, directed=False)
+    largest = np.flatnonzero(labels == np.argmax(np.bincount(labels)))
+    rng = np.random.RandomState(random_state)
+
+    source, eccentricities = rng.choice(largest), []
+    for _ in range(num_bfs):
+        distances = _bfs_distances(A, source)
+        eccentricities.append(int(distances.max()))
+        source = int(np.argmax(distances))
+    return {
+        "bfs_runs"    : num_bfs,
+        "lower_bound" : max(eccentricities),
+        "upper_bound" : 2 * min(eccentricities)
+    }
+
+def profile_graph(S, raw_fn=None, sample_size=10000, num_bfs=4, random_state=0):
+    """Given a sparse similarity (adjacency) matrix S, the filename of its raw edge records
+    (for the heuristic counts), the number of addresses sampled for triangles, the number of
+    BFS runs for the diameter, and a random seed, computes every statistic and times it
+
+    Returns Report (dict of statistic name -> values, each with its time in seconds)
+    """
+    start = time.time()
+    A = _pattern(S)
+    report = { "addresses" : int(A.shape[0]), "edges" : int(A.nnz // 2),
+        "pattern_time" : time.time() - start }
+
+    statistics = [
+        ("degrees",    lambda : degree_stats(S, A)),
+        ("components", lambda : component_stats(A)),
+        ("heuristics", lambda : heuristic_stats(raw_fn) if raw_fn is not None else None),
+        ("triangles",  lambda : triangle_stats(A, sample_size, random_state)),
+        ("diameter",   lambda : diameter_stats(A, num_bfs, random_state))
+    ]
+    for name, statistic in statistics:
+        start = time.time()
+        values = statistic()
+        report[name] = { "values" : values, "time" : time.time() - start }
+        print("Profiled {} in {:.3f}s".format(name, report[name]["time"]))
+    return report
+
+def _cmd_profile(argv):
+    """Parses arguments as specified by argv and returns as a dictionary. Entries
+    are parsed as specified in the help menu (visible by running
+    "python3 -m blockchain.graphstats -h")
+
+    Returns parameters dictionary
+    """
+    params = {
+        "byte_percent" : .01,
+        "num_bfs"      : 4,
+        "output_fn"    : None,
+        "sample_size"  : 10000
+    }
+
+    USAGE_STRING = """blockchain/graphstats.py
+            -b <byte_percent>    [(float) percent of bytes in full data to be profiled]
+            -d <num_bfs>         [(int) BFS runs used to estimate the diameter]
+            -o <output_fn>       [(str) JSON report file (default: output/profile_<byte_percent>.json)]
+            -s <sample_size>     [(int) addresses sampled for the triangle statistics]"""
+
+    opts, args = getopt.getopt(argv,"hb:d:o:s:")
+    for opt, arg in opts:
+        if opt in ('-h'):
+            print(USAGE_STRING)
+            sys.exit()
+
+        elif opt in ("-b"): params["byte_percent"] = float(arg)
+        elif opt in ("-d"): params["num_bfs"]      = int(arg)
+        elif opt in ("-o"): params["output_fn"]    = arg
+        elif opt in ("-s"): params["sample_size"]  = int(arg)
+    return params
+
+def main(argv):
+    """Main profiling method that loads the cached similarity matrix of a data fraction and
+    writes its JSON report. CMD-line arguments are specified in the help menu (run with -h)
+
+    Returns void
+    """
+    params = _cmd_profile(argv)
+
+    # change the line below if the remote source of the data is updated
+    data_src = "https://s3.amazonaws.com/bitcoinclustering/cluster_data.dat"
+    S, _ = get_data(data_src, percent_bytes=params["byte_percent"])
+
+    report = profile_graph(S, raw_fn=get_data_fn(params["byte_percent"]),
+        sample_size=params["sample_size"], num_bfs=params["num_bfs"])
+    output_fn = params["output_fn"]
+    if output_fn is None:
+        output_fn = "output/profile_{0:f}.json".format(params["byte_percent"])
+    with open(output_fn, "w") as f:
+        json.dump(report, f, indent=4)
+    print("Wrote profile to {}".format(output_fn))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
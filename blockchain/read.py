@@ -36,6 +36,58 @@ def _read_in_chunks(file_object, chunk_size=9000):
             break
         yield data
 
+# raw format: address1ID (4 bytes) address2ID (4 bytes) Heuristics(1 byte)
+RECORD_DTYPE = np.dtype([("address1", "<i4"), ("address2", "<i4"), ("heuristic", "i1")])
+
+def iter_edge_batches(fn, batch_records=1000000):
+    """Given an input filename and the number of records per batch, yields the parsed edge
+    columns (address1 IDs, address2 IDs, heuristics) as numpy arrays, decoding each batch
+    of records in a single vectorized call rather than one struct.unpack per record
+
+    Returns void
+    """
+    with open(fn, "rb") as f:
+        while True:
+            data = f.read(batch_records * RECORD_DTYPE.itemsize)
+            if not data:
+                break
+            usable = len(data) - len(data) % RECORD_DTYPE.itemsize
+            records = np.frombuffer(data[:usable], dtype=RECORD_DTYPE)
+            yield records["address1"], records["address2"], records["heuristic"]
+
+class AddressIndex:
+    """Incrementally maps raw address IDs to compact indices in order of first appearance
+    (the same numbering as _map_id_to_index), for use while streaming over edge batches
+    """
+    def __init__(self):
+        self.id_to_index = {}
+        self.index_to_id = []
+
+    def __len__(self):
+        return len(self.index_to_id)
+
+    def map(self, address1, address2):
+        """Given the address1 and address2 ID columns of a batch, assigns indices to any
+        unseen addresses and converts both columns to indices. Only the distinct IDs of
+        the batch are looked up individually
+
+        Returns (1) address1 indices; (2) address2 indices (numpy arrays of ints)
+        """
+        ids = np.column_stack((address1, address2)).ravel()
+        unique_ids, first_seen, inverse = np.unique(ids,
+            return_index=True, return_inverse=True)
+
+        unique_index = np.empty(len(unique_ids), dtype=np.int64)
+        for j in np.argsort(first_seen):
+            address_id = int(unique_ids[j])
+            if address_id not in self.id_to_index:
+                self.id_to_index[address_id] = len(self.index_to_id)
+                self.index_to_id.append(address_id)
+            unique_index[j] = self.id_to_index[address_id]
+
+        indices = unique_index[inverse].reshape(-1, 2)
+        return indices[:, 0], indices[:, 1]
+
 def _plot_multi_graph(G):
     """Given a multigraph G, produces a corresponding visualization
 
@@ -182,8 +234,11 @@ def _create_visual_json(fn):
         json.dump(data, dest)
     print("Produced visualization JSON!")
 
+def get_data_fn(percent_bytes):
+    return "blockchain/data_{0:f}".format(percent_bytes)
+
 def get_data(data_src, percent_bytes=None):
-    fn = "blockchain/data_{0:f}".format(percent_bytes)
+    fn = get_data_fn(percent_bytes)
     pickle_S_fn = "{}.pickle".format(fn)
     pickle_index_to_id_fn = "blockchain/index_to_id_{0:f}.pickle".format(percent_bytes)
 
@@ -0,0 +1,113 @@
+"""
+__author__ = Yash Patel
+__name__   = prune.py
+__description__ = Hub and leaf pruning applied before clustering. Addresses above a degree
+percentile (exchanges, mixers) dominate the spectrum and slow the eigensolver, while chains
+of low-degree addresses make up much of the node count but carry little structure: both are
+removed, the remaining core is clustered, and the pruned addresses are then reattached to
+clusters by a weighted vote of their neighbors
+"""
+
+import time
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from analysis.spectral import labels_to_partitions
+
+def _counterparties(S):
+    """Given a sparse similarity (adjacency) matrix S (CSR), counts the distinct neighbors of
+    every node, excluding itself
+
+    Returns Neighbor counts (numpy array of ints)
+    """
+    counts = np.diff(S.indptr)
+    rows = np.repeat(np.arange(S.shape[0]), counts)
+    return counts - np.bincount(rows[S.indices == rows], minlength=S.shape[0])
+
+def prune_graph(S, hub_percentile=99.9, core=2):
+    """Given a sparse similarity (adjacency) matrix S, the degree percentile above which nodes
+    count as hubs, and the core number, removes the hubs and then peels the rest of the
+    graph down to its k-core (for core=2, every leaf and every tree hanging off the graph).
+    The peeling removes every node with fewer than core remaining neighbors per round,
+    and only the neighbors of the removed nodes are updated, so all rounds together cost
+    O(edges)
+
+    Returns (1) kept nodes (numpy array of ints, increasing); (2) similarity matrix of the
+    core (scipy-sparse CSR); (3) shrinkage stats and time spent pruning (dict)
+    """
+    start = time.time()
+    S = csr_matrix(S, dtype=np.float64)
+    n = S.shape[0]
+    counts = _counterparties(S)
+
+    hubs = counts > np.percentile(counts, hub_percentile) if n > 0 else np.zeros(0, dtype=bool)
+    alive = ~hubs
+    remaining = counts.copy()
+    dropped = hubs
+    while True:
+        neighbors = S[np.flatnonzero(dropped)]
+        remaining -= np.bincount(neighbors.indices, minlength=n)
+        dropped = alive & (remaining < core)
+        if not dropped.any():
+            break
+        alive &= ~dropped
+
+    kept = np.flatnonzero(alive)
+    S_core = S[kept][:, kept]
+    stats = {
+        "nodes"      : n,
+        "edges"      : int(S.nnz // 2),
+        "hubs"       : int(hubs.sum()),
+        "peeled"     : int(n - hubs.sum() - len(kept)),
+        "core_nodes" : len(kept),
+        "core_edges" : int(S_core.nnz // 2),
+        "time"       : time.time() - start
+    }
+    print("Pruned {} hubs and peeled {} nodes: {} -> {} nodes ({:.1%}), {} -> {} edges ({:.1%})".format(
+        stats["hubs"], stats["peeled"], n, len(kept), len(kept) / float(max(n, 1)),
+        stats["edges"], stats["core_edges"], stats["core_edges"] / float(max(stats["edges"], 1))))
+    return kept, S_core, stats
+
+def reattach_labels(S, kept, core_labels):
+    """Given the full sparse similarity (adjacency) matrix S, the kept nodes, and the cluster
+    label of each kept node (-1 for outliers, which are left as they are), labels the pruned
+    nodes in rounds: every pruned node with a labelled neighbor takes the label of largest
+    total edge weight among its labelled neighbors, so peeled trees are labelled from the
+    core outwards. Nodes never connected to a labelled node (components pruned entirely)
+    stay -1
+
+    Returns Labels (numpy array of ints, one per node of S)
+    """
+    S = csr_matrix(S, dtype=np.float64)
+    labels = np.full(S.shape[0], -1, dtype=np.int64)
+    labels[kept] = core_labels
+    pruned = np.ones(S.shape[0], dtype=bool)
+    pruned[kept] = False
+    k = int(labels.max()) + 1
+
+    while k > 0:
+        unlabeled = np.flatnonzero(pruned & (labels < 0))
+        rows = S[unlabeled]
+        row_ids = np.repeat(np.arange(len(unlabeled)), np.diff(rows.indptr))
+        voting = (labels[rows.indices] >= 0) & (rows.data > 0)
+        votes = csr_matrix((rows.data[voting], (row_ids[voting], labels[rows.indices[voting]])),
+            shape=(len(unlabeled), k))
+        attached = np.diff(votes.indptr) > 0
+        if not attached.any():
+            break
+        labels[unlabeled[attached]] = np.asarray(votes[attached].argmax(axis=1)).ravel()
+    return labels
+
+def reattach_partitions(S, kept, partitions):
+    """Given the full sparse similarity (adjacency) matrix S, the kept nodes, and partitions
+    of the core (sets of indices into kept), maps the partitions back onto the nodes of S
+    and reattaches the pruned nodes by neighbor vote. Core nodes in no partition stay out
+
+    Returns Partitions (list of sets of ints)
+    """
+    core_labels = np.full(len(kept), -1, dtype=np.int64)
+    for label, partition in enumerate(partitions):
+        core_labels[list(partition)] = label
+    labels = reattach_labels(S, kept, core_labels)
+    return labels_to_partitions(labels, len(partitions))
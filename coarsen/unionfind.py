@@ -0,0 +1,146 @@
+"""
+__author__ = Yash Patel
+__name__   = unionfind.py
+__description__ = Array-backed union-find over the raw transaction graph edges. Serves as the
+standard deanonymization baseline and as a contraction map applied before spectral clustering
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from blockchain.read import iter_edge_batches, AddressIndex
+
+class UnionFind:
+    """Union-find with path compression and union by rank over int32 arrays. Unions are
+    applied to whole arrays of edges at once: each round links every pair of distinct roots
+    from the lower (rank, index) root to the higher one, which can never form a cycle, and
+    edges whose link lost a write conflict are simply retried in the next round
+    """
+    def __init__(self, n=0):
+        self.n = n
+        self.parent = np.arange(max(n, 1), dtype=np.int32)
+        self.rank   = np.zeros(max(n, 1), dtype=np.int8)
+
+    def grow(self, n):
+        """Given a new number of elements, adds singleton sets up to that size,
+        doubling the underlying arrays when they run out of capacity
+
+        Returns void
+        """
+        if n <= self.n:
+            return
+        if n > len(self.parent):
+            capacity = max(n, 2 * len(self.parent))
+            parent = np.arange(capacity, dtype=np.int32)
+            parent[:self.n] = self.parent[:self.n]
+            rank = np.zeros(capacity, dtype=np.int8)
+            rank[:self.n] = self.rank[:self.n]
+            self.parent, self.rank = parent, rank
+        self.n = n
+
+    def find(self, x):
+        """Given an array of elements, finds their roots and compresses the path of
+        each queried element to point directly at its root
+
+        Returns Roots (numpy array of ints)
+        """
+        x = np.asarray(x, dtype=np.int32)
+        root = self.parent[x]
+        while True:
+            grandparent = self.parent[root]
+            if np.array_equal(grandparent, root):
+                break
+            root = grandparent
+        self.parent[x] = root
+        return root
+
+    def union(self, a, b):
+        """Given two equal-length arrays of elements, merges the sets of each pair (a[i], b[i])
+
+        Returns void
+        """
+        a = np.asarray(a, dtype=np.int32)
+        b = np.asarray(b, dtype=np.int32)
+        while len(a) > 0:
+            root_a, root_b = self.find(a), self.find(b)
+            distinct = root_a != root_b
+            a, b = a[distinct], b[distinct]
+            root_a, root_b = root_a[distinct], root_b[distinct]
+            if len(a) == 0:
+                break
+
+            rank_a, rank_b = self.rank[root_a], self.rank[root_b]
+            b_lower = (rank_b < rank_a) | ((rank_b == rank_a) & (root_b < root_a))
+            child  = np.where(b_lower, root_b, root_a)
+            parent = np.where(b_lower, root_a, root_b)
+            self.parent[child] = parent
+
+            applied = self.parent[child] == parent
+            equal_rank = applied & (self.rank[child] == self.rank[parent])
+            np.maximum.at(self.rank, parent[equal_rank], self.rank[child[equal_rank]] + 1)
+
+    def labels(self):
+        """Finds the set of every element, numbered compactly from 0
+
+        Returns Labels (numpy array of ints)
+        """
+        roots = self.find(np.arange(self.n, dtype=np.int32))
+        _, labels = np.unique(roots, return_inverse=True)
+        return labels
+
+def union_find_file(fn, heuristics=None, batch_records=1000000):
+    """Given an input filename of raw edge records, the heuristic values whose edges are to
+    be merged (None merges along every edge), and the number of records per batch, runs
+    union-find in a single streaming pass over the file. Addresses are indexed in order of
+    first appearance, so the labels line up with index_to_id from get_data
+
+    Returns (1) labels (numpy array of ints); (2) index_to_id (list of address IDs)
+    """
+    print("Running union-find over {}...".format(fn))
+    address_index = AddressIndex()
+    uf = UnionFind()
+
+    if heuristics is not None:
+        heuristics = np.asarray(list(heuristics), dtype=np.int8)
+
+    for address1, address2, heuristic in iter_edge_batches(fn, batch_records):
+        index1, index2 = address_index.map(address1, address2)
+        uf.grow(len(address_index))
+
+        if heuristics is not None:
+            selected = np.isin(heuristic, heuristics)
+            index1, index2 = index1[selected], index2[selected]
+        uf.union(index1, index2)
+
+    labels = uf.labels()
+    print("Union-find produced {} clusters over {} addresses".format(
+        labels.max() + 1 if len(labels) > 0 else 0, len(labels)))
+    return labels, address_index.index_to_id
+
+def contract_similarity(S, labels):
+    """Given a sparse similarity (adjacency) matrix S and a label per node, contracts every
+    labelled group into a single node, summing the weights of the edges between groups and
+    dropping those inside a group
+
+    Returns Contracted similarity matrix (scipy-sparse CSR)
+    """
+    n = S.shape[0]
+    num_groups = labels.max() + 1
+    P = csr_matrix((np.ones(n), (np.arange(n), labels)), shape=(n, num_groups))
+
+    S_contracted = (P.T @ csr_matrix(S) @ P).tocsr()
+    S_contracted.setdiag(0)
+    S_contracted.eliminate_zeros()
+    return S_contracted
+
+def expand_partitions(partitions, labels):
+    """Given partitions of the contracted graph and the label (contracted node) of each
+    original node, maps the partitions back onto the original nodes
+
+    Returns Partitions (list of sets of ints)
+    """
+    members = [[] for _ in range(labels.max() + 1)]
+    for node, label in enumerate(labels):
+        members[label].append(node)
+    return [{ node for group in partition for node in members[group] }
+        for partition in partitions]
@@ -0,0 +1,390 @@
+"""
+__author__ = Yash Patel
+__name__   = service.py
+__description__ = Long-running asyncio service answering cluster queries over a local TCP
+line protocol, while ingesting new raw edge records and periodically re-clustering the
+graph in the background. Queries and edges are described in the help menu (run with -h)
+"""
+
+import asyncio
+import getopt
+import pickle
+import sys
+import time
+import traceback
+from collections import defaultdict
+from functools import partial
+
+import numpy as np
+from scipy.sparse import coo_matrix, csr_matrix
+
+from algorithms import get_algorithms
+from analysis.embedding import spectral_embedding
+from analysis.local import local_cluster
+from blockchain.read import RECORD_DTYPE, AddressIndex, get_data
+
+PROTOCOL = """Commands (one per line, addresses given as their compact integer IDs):
+    CLUSTER <address>          -> cluster ID of the address (NONE if unknown/unclustered)
+    MEMBERS <address> [limit]  -> addresses co-clustered with the address (default limit 100)
+    SIZE <address>             -> number of addresses in the address's cluster
+    LOCAL <address> [limit]    -> conductance, then addresses of the local (personalized
+                                  PageRank) cluster around the address, on the graph as of
+                                  the last re-cluster (default limit 100)
+    STATS                      -> addresses, clusters, pending edges, last re-cluster time
+    EDGES <count>              -> followed by count raw 9-byte edge records, as in the data
+                                  dump; replies OK <count> once they are queued
+    QUIT                       -> closes the connection"""
+
+def _edge_count(arguments):
+    """Given the arguments of an EDGES command, parses the number of records that follow
+
+    Returns Count (int), or None if it is missing, not an integer, or negative
+    """
+    try:
+        count = int(arguments[0])
+    except (IndexError, ValueError):
+        return None
+    return count if count >= 0 else None
+
+class ClusterState:
+    """Snapshot of the clustering served to queries: address -> cluster and cluster ->
+    member addresses. A re-clustering builds a whole new state that replaces the old one
+    in a single assignment, so queries never see a half-updated clustering. Between
+    re-clusterings, addresses that arrive with new edges are placed provisionally
+    """
+    def __init__(self, labels, index_to_id):
+        self.address_to_cluster = {}
+        self.members = defaultdict(list)
+        for index, cluster in enumerate(labels):
+            if cluster >= 0:
+                address = index_to_id[index]
+                self.address_to_cluster[address] = int(cluster)
+                self.members[int(cluster)].append(address)
+        self.next_cluster = max(self.members.keys()) + 1 if self.members else 0
+        self.created = time.time()
+
+    @classmethod
+    def from_partitions(cls, partition_to_nodes, index_to_id):
+        """Given the partitions pickled by write_results (partition ID -> set of addresses)
+        and the index_to_id mapping, builds the state
+
+        Returns Cluster state (ClusterState)
+        """
+        id_to_index = { address : index for index, address in index_to_id.items() }
+        labels = np.full(len(index_to_id), -1, dtype=np.int64)
+        for partition_id, addresses in partition_to_nodes.items():
+            for address in addresses:
+                if address in id_to_index:
+                    labels[id_to_index[address]] = partition_id
+        return cls(labels, index_to_id)
+
+    def place(self, address1, address2):
+        """Given a new edge between two addresses, provisionally clusters any address that
+        has no cluster yet with the other endpoint (or in a new cluster of its own)
+
+        Returns void
+        """
+        cluster1 = self.address_to_cluster.get(address1)
+        cluster2 = self.address_to_cluster.get(address2)
+        if cluster1 is not None and cluster2 is not None:
+            return
+
+        cluster = cluster1 if cluster1 is not None else cluster2
+        if cluster is None:
+            cluster = self.next_cluster
+            self.next_cluster += 1
+        for address in (address1, address2):
+            if address not in self.address_to_cluster:
+                self.address_to_cluster[address] = cluster
+                self.members[cluster].append(address)
+
+class ClusterService:
+    """Serves cluster queries from the current ClusterState while edges are ingested in
+    micro-batches (at most batch_size records, or whatever arrived within flush_interval
+    seconds) and the graph is re-clustered every recluster_interval seconds in a worker
+    thread, without blocking the queries
+    """
+    def __init__(self, S, index_to_id, state, algorithm="Louvain", num_clusters=2,
+        batch_size=10000, flush_interval=0.05, recluster_interval=300.0):
+        self.S = csr_matrix(S, dtype=np.float64)
+        self.total_volume = self.S.data.sum()
+        self.address_index = AddressIndex()
+        self.address_index.index_to_id = [index_to_id[index] for index in range(len(index_to_id))]
+        self.address_index.id_to_index = { address : index for index, address in
+            enumerate(self.address_index.index_to_id) }
+        self.state = state
+
+        self.algorithm          = algorithm
+        self.num_clusters       = num_clusters
+        self.batch_size         = batch_size
+        self.flush_interval     = flush_interval
+        self.recluster_interval = recluster_interval
+
+        self.queue = asyncio.Queue()
+        self.pending_rows = []
+        self.pending_cols = []
+        self.pending_addresses = []
+
+    def _apply_batch(self, records):
+        """Given the raw records of a micro-batch, indexes any new addresses, keeps the edges
+        for the next re-clustering, and provisionally places new addresses
+
+        Returns void
+        """
+        rows, cols = self.address_index.map(records["address1"], records["address2"])
+        self.pending_rows.append(rows)
+        self.pending_cols.append(cols)
+        for address1, address2 in zip(records["address1"].tolist(), records["address2"].tolist()):
+            self.state.place(address1, address2)
+            self.pending_addresses.append((address1, address2))
+
+    async def _ingest(self):
+        """Drains the queue of received records into micro-batches and applies them
+
+        Returns void
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batches = [await self.queue.get()]
+            size, deadline = len(batches[0]), loop.time() + self.flush_interval
+            while size < self.batch_size:
+                try:
+                    batch = await asyncio.wait_for(self.queue.get(),
+                        max(deadline - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                batches.append(batch)
+                size += len(batch)
+            self._apply_batch(np.concatenate(batches))
+
+    def _cluster(self, S):
+        """Given a similarity matrix, clusters it with the configured algorithm (run in a
+        worker thread)
+
+        Returns Labels (numpy array of ints, -1 for unclustered)
+        """
+        algorithm, args, kwds = get_algorithms(self.num_clusters)[self.algorithm]
+        if getattr(algorithm, "graph_input", False):
+            X = S
+        else:
+            X = spectral_embedding(S, self.num_clusters)
+        return algorithm(*args, **kwds).fit_predict(X)
+
+    async def _recluster(self):
+        """Periodically folds the ingested edges into the similarity matrix, re-clusters it in
+        a worker thread, and swaps in the new state. The folded edges stay pending until the
+        swap succeeds, so a failed re-clustering is logged and retried with them on the next
+        interval. Edges that arrive while clustering runs are placed provisionally again on
+        the new state
+
+        Returns void
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.recluster_interval)
+            if len(self.pending_rows) == 0:
+                continue
+            try:
+                await self._recluster_pending(loop)
+            except Exception:
+                print("Re-clustering failed, keeping {} pending edge batches:".format(
+                    len(self.pending_rows)))
+                traceback.print_exc()
+
+    async def _recluster_pending(self, loop):
+        """Given the running event loop, re-clusters the graph with the edges pending so far
+        and swaps in the new state, only then dropping those edges from the pending lists
+
+        Returns void
+        """
+        num_batches, num_addresses = len(self.pending_rows), len(self.pending_addresses)
+        rows = np.concatenate(self.pending_rows[:num_batches])
+        cols = np.concatenate(self.pending_cols[:num_batches])
+
+        n = len(self.address_index)
+        S = self.S.copy()
+        S.resize((n, n))
+        S = S + coo_matrix((np.ones(2 * len(rows)), (np.concatenate((rows, cols)),
+            np.concatenate((cols, rows)))), shape=(n, n)).tocsr()
+        index_to_id = list(self.address_index.index_to_id[:n])
+
+        print("Re-clustering {} addresses...".format(n))
+        start = time.time()
+        labels = await loop.run_in_executor(None, self._cluster, S)
+        state = ClusterState(labels, index_to_id)
+        for address1, address2 in self.pending_addresses[num_addresses:]:
+            state.place(address1, address2)
+
+        self.S, self.total_volume, self.state = S, S.data.sum(), state
+        del self.pending_rows[:num_batches], self.pending_cols[:num_batches]
+        del self.pending_addresses[:num_addresses]
+        print("Re-clustered in {:.3f}s".format(time.time() - start))
+
+    async def _local(self, arguments):
+        """Given the arguments of a LOCAL query, finds the local cluster around the address
+        on the graph as of the last re-cluster. The push runs in a worker thread, so other
+        connections are answered meanwhile
+
+        Returns Reply (string)
+        """
+        S, total_volume = self.S, self.total_volume
+        index = self.address_index.id_to_index.get(int(arguments[0]))
+        limit = int(arguments[1]) if len(arguments) > 1 else 100
+        if index is None or index >= S.shape[0]:
+            return "NONE"
+
+        loop = asyncio.get_running_loop()
+        cluster, conductance = await loop.run_in_executor(None, partial(local_cluster,
+            S, index, total_volume=total_volume))
+        index_to_id = self.address_index.index_to_id
+        return "{:.4f} ".format(conductance) + " ".join(str(index_to_id[member])
+            for member in sorted(cluster)[:limit])
+
+    def _answer(self, command, arguments):
+        """Given a query command and its arguments, answers it from the current state
+
+        Returns Reply (string)
+        """
+        state = self.state
+        if command == "STATS":
+            return "{} {} {} {:.0f}".format(len(state.address_to_cluster), len(state.members),
+                sum(len(rows) for rows in self.pending_rows), state.created)
+
+        if command not in ("CLUSTER", "SIZE", "MEMBERS"):
+            return "ERROR unknown command {}".format(command)
+
+        cluster = state.address_to_cluster.get(int(arguments[0]))
+        if cluster is None:
+            return "NONE"
+        if command == "CLUSTER":
+            return str(cluster)
+        elif command == "SIZE":
+            return str(len(state.members[cluster]))
+        limit = int(arguments[1]) if len(arguments) > 1 else 100
+        return " ".join(str(address) for address in state.members[cluster][:limit])
+
+    async def handle(self, reader, writer):
+        """Given the streams of a client connection, answers its queries line by line and
+        queues the edge records it sends
+
+        Returns void
+        """
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                parts = line.decode().split()
+                if len(parts) == 0:
+                    continue
+                command, arguments = parts[0].upper(), parts[1:]
+
+                if command == "QUIT":
+                    break
+                elif command == "EDGES":
+                    count = _edge_count(arguments)
+                    if count is None:
+                        # the records cannot be skipped without a count, so the stream ends
+                        writer.write(b"ERROR malformed EDGES count\n")
+                        await writer.drain()
+                        break
+                    data = await reader.readexactly(count * RECORD_DTYPE.itemsize)
+                    await self.queue.put(np.frombuffer(data, dtype=RECORD_DTYPE))
+                    reply = "OK {}".format(count)
+                else:
+                    try:
+                        if command == "LOCAL":
+                            reply = await self._local(arguments)
+                        else:
+                            reply = self._answer(command, arguments)
+                    except (IndexError, ValueError):
+                        reply = "ERROR malformed {} query".format(command)
+                writer.write((reply + "\n").encode())
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionResetError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8555):
+        """Given the host and port to listen on, runs the service until cancelled
+
+        Returns void
+        """
+        server = await asyncio.start_server(self.handle, host, port)
+        print("Serving cluster queries on {}:{}".format(host, port))
+        tasks = [asyncio.ensure_future(self._ingest()), asyncio.ensure_future(self._recluster())]
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+def _cmd_service(argv):
+    """Parses arguments as specified by argv and returns as a dictionary. Entries
+    are parsed as specified in the help menu (visible by running "python3 service.py -h")
+
+    Returns parameters dictionary
+    """
+    params = {
+        "byte_percent"       : .01,
+        "algorithm"          : "Louvain",
+        "labels_fn"          : None,
+        "num_clusters"       : 2,
+        "port"               : 8555,
+        "recluster_interval" : 300.0
+    }
+
+    USAGE_STRING = """service.py
+            -a <algorithm>       [(str) algorithm from algorithms.py used when re-clustering]
+            -b <byte_percent>    [(float) percent of bytes in full data to be loaded]
+            -i <interval>        [(float) seconds between background re-clusterings]
+            -l <labels_fn>       [(str) pickle from write_results to serve (default: cluster on start)]
+            -n <num_cluster>     [(int) number of clusters for algorithms that need it]
+            -p <port>            [(int) local TCP port to listen on]
+
+""" + PROTOCOL
+
+    opts, args = getopt.getopt(argv,"ha:b:i:l:n:p:")
+    for opt, arg in opts:
+        if opt in ('-h'):
+            print(USAGE_STRING)
+            sys.exit()
+
+        elif opt in ("-a"): params["algorithm"]          = arg
+        elif opt in ("-b"): params["byte_percent"]       = float(arg)
+        elif opt in ("-i"): params["recluster_interval"] = float(arg)
+        elif opt in ("-l"): params["labels_fn"]          = arg
+        elif opt in ("-n"): params["num_clusters"]       = int(arg)
+        elif opt in ("-p"): params["port"]               = int(arg)
+    return params
+
+def main(argv):
+    """Main service method that loads the cached graph and labels once and serves
+    cluster queries until interrupted. CMD-line arguments are specified in the help
+    menu (run with -h)
+
+    Returns void
+    """
+    params = _cmd_service(argv)
+
+    # change the line below if the remote source of the data is updated
+    data_src = "https://s3.amazonaws.com/bitcoinclustering/cluster_data.dat"
+    S, index_to_id = get_data(data_src, percent_bytes=params["byte_percent"])
+
+    service = ClusterService(S, index_to_id, None, algorithm=params["algorithm"],
+        num_clusters=params["num_clusters"], recluster_interval=params["recluster_interval"])
+    if params["labels_fn"] is not None:
+        partition_to_nodes = pickle.load(open(params["labels_fn"], "rb"))
+        service.state = ClusterState.from_partitions(partition_to_nodes, index_to_id)
+    else:
+        service.state = ClusterState(service._cluster(service.S), index_to_id)
+
+    try:
+        asyncio.run(service.serve(port=params["port"]))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,75 @@
+"""
+__author__ = Yash Patel
+__name__   = test_distributed.py
+__description__ = Regression tests of block Lanczos and the row-distributed adjacency against
+dense computations on small graphs
+"""
+
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from analysis.distributed import DistributedAdjacency, block_lanczos, serve_worker
+from analysis.operators import LaplacianOperator
+
+def _adjacency(G):
+    return csr_matrix(nx.adjacency_matrix(G), dtype=np.float64)
+
+def _assert_matches_dense(L, w, U):
+    """Given a Laplacian operator and the eigenpairs found for it, checks them against a
+    dense eigensolve: the eigenvalues, that the vectors are orthonormal eigenvectors, and
+    their span if it is unique (the kth eigenvalue does not repeat beyond k)
+
+    Returns void
+    """
+    dense = L.toarray()
+    ref_w, ref_U = np.linalg.eigh(dense)
+    k = len(w)
+    assert np.allclose(w, ref_w[:k], atol=1e-8)
+    assert np.allclose(U.T @ U, np.eye(k), atol=1e-8)
+    assert np.allclose(dense @ U, U * w, atol=1e-6)
+    if ref_w[k] - ref_w[k - 1] > 1e-6:
+        assert np.linalg.norm(U @ U.T - ref_U[:, :k] @ ref_U[:, :k].T) < 1e-6
+
+@pytest.mark.parametrize("normalize", [False, True])
+def test_block_lanczos_matches_dense(normalize):
+    L = LaplacianOperator(_adjacency(nx.connected_caveman_graph(5, 8)), normalize=normalize)
+    w, U = block_lanczos(L, 5, num_blocks=6, random_state=0)
+    _assert_matches_dense(L, w, U)
+
+def test_block_lanczos_deflation():
+    # six components: the null space has more dimensions than a block, so images of
+    # converged eigenvectors deflate and have to be replaced
+    G = nx.disjoint_union_all([nx.complete_graph(size) for size in (6, 7, 8, 9, 10, 11)])
+    L = LaplacianOperator(_adjacency(G))
+    w, U = block_lanczos(L, 8, block_size=4, num_blocks=6, random_state=1)
+    _assert_matches_dense(L, w, U)
+
+def test_block_lanczos_small_graph():
+    L = LaplacianOperator(_adjacency(nx.path_graph(7)))
+    w, U = block_lanczos(L, 3, random_state=2)
+    _assert_matches_dense(L, w, U)
+
+def test_block_lanczos_warns_without_convergence():
+    L = LaplacianOperator(_adjacency(nx.connected_caveman_graph(6, 8)))
+    with pytest.warns(RuntimeWarning):
+        block_lanczos(L, 4, num_blocks=2, max_restarts=1, tol=1e-14, random_state=3)
+
+def test_distributed_adjacency_matches_local():
+    S = _adjacency(nx.connected_caveman_graph(5, 8))
+    X = np.random.RandomState(4).randn(S.shape[0], 3)
+    with DistributedAdjacency.from_matrix(S, num_workers=3) as A:
+        assert np.allclose(A @ X, S @ X)
+        assert np.allclose(A @ X[:, 0], S @ X[:, 0])
+        assert np.allclose(A.degrees, np.asarray(S.sum(axis=1)).ravel())
+
+        L = A.laplacian()
+        w, U = block_lanczos(L, 5, num_blocks=6, random_state=5)
+        _assert_matches_dense(LaplacianOperator(S), w, U)
+
+def test_authkey_required():
+    with pytest.raises(ValueError):
+        serve_worker("127.0.0.1", 0, None)
+    with pytest.raises(ValueError):
+        DistributedAdjacency([], addresses=[("127.0.0.1", 0)])
@@ -0,0 +1,101 @@
+"""
+__author__ = Yash Patel
+__name__   = test_incremental.py
+__description__ = Regression tests of incremental spectral clustering: every Rayleigh-Ritz
+update is checked against a dense Rayleigh-Ritz solve of the new Laplacian on span(U, E_T)
+"""
+
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, lil_matrix
+
+from analysis import incremental
+from analysis.incremental import IncrementalSpectral
+
+def _laplacian(model):
+    A = model.A.toarray()
+    return np.diag(A.sum(axis=1)) - A
+
+def _dense_rayleigh_ritz(L, U, touched, k):
+    """Given a dense Laplacian, the eigenvectors before an update, the touched nodes, and
+    the number of eigenpairs k, solves the Rayleigh-Ritz problem of L on span(U, E_T)
+
+    Returns (1) Ritz values (numpy array); (2) orthonormal basis of the span (numpy array)
+    """
+    E_T = np.zeros((L.shape[0], len(touched)))
+    E_T[touched, np.arange(len(touched))] = 1.0
+    V, s, _ = np.linalg.svd(np.hstack((U, E_T)), full_matrices=False)
+    basis = V[:, s > 1e-8]
+    return np.linalg.eigvalsh(basis.T @ L @ basis)[:k], basis
+
+def _check_update(model, rows, cols, weights=None):
+    """Given a fitted model and a batch of edges, applies the batch and checks the new
+    eigenpairs against a dense Rayleigh-Ritz solve, along with the L U rows the model
+    keeps track of
+
+    Returns void
+    """
+    k = model.k
+    n = max(model.n, int(max(max(rows), max(cols))) + 1)
+    _, U_old = model.eigenpairs()
+    U_old = np.vstack((U_old, np.zeros((n - len(U_old), k))))
+    touched = np.unique(np.concatenate((rows, cols)))
+
+    model.update(rows, cols, weights)
+    L = _laplacian(model)
+    w, U = model.eigenpairs()
+    ref_w, basis = _dense_rayleigh_ritz(L, U_old, touched, k)
+
+    assert np.allclose(w, ref_w, atol=1e-8)
+    assert np.allclose(U.T @ U, np.eye(k), atol=1e-8)
+    # U lies in the span, and its residuals are orthogonal to it (Galerkin conditions)
+    assert np.allclose(basis @ (basis.T @ U), U, atol=1e-8)
+    assert np.allclose(basis.T @ (L @ U - U * w), 0, atol=1e-8)
+    assert np.allclose(model._materialize(model.W0, model.CW), L @ U, atol=1e-8)
+
+def _caveman_model(consolidate=0.1):
+    S = csr_matrix(nx.adjacency_matrix(nx.connected_caveman_graph(6, 8)), dtype=np.float64)
+    return IncrementalSpectral(4, consolidate=consolidate, random_state=0).fit(S)
+
+@pytest.mark.parametrize("consolidate", [0.1, 1.0])
+def test_updates_match_dense_rayleigh_ritz(consolidate):
+    model = _caveman_model(consolidate)
+    rng = np.random.RandomState(0)
+    for _ in range(30):
+        rows, cols = rng.randint(0, model.n, 3), rng.randint(0, model.n, 3)
+        _check_update(model, rows, cols, rng.uniform(0.5, 2.0, 3))
+
+def test_ill_conditioned_frame_is_applied(monkeypatch):
+    # the correction frame is applied to the rows after every update instead of lazily
+    monkeypatch.setattr(incremental, "MAX_COND", 1.0)
+    model = _caveman_model(consolidate=1.0)
+    rng = np.random.RandomState(1)
+    for _ in range(10):
+        _check_update(model, rng.randint(0, model.n, 2), rng.randint(0, model.n, 2))
+
+def test_new_nodes():
+    model = _caveman_model()
+    _check_update(model, [3, 50], [49, 51])
+    _check_update(model, [10, 52], [52, 0])
+    assert model.n == 53 and np.all(model.labels_[[49, 50, 51, 52]] >= 0)
+
+def test_touched_directions_inside_span():
+    # a path on 46 of 50 nodes: the isolated nodes' indicators are eigenvectors, so E_T
+    # contains directions already in span(U) once they are all touched
+    A = lil_matrix((50, 50))
+    for i in range(45):
+        A[i, i + 1] = A[i + 1, i] = 1
+    model = IncrementalSpectral(6, random_state=0).fit(csr_matrix(A))
+    for rows, cols in [([47], [48]), ([46], [49]), ([46, 47], [47, 49]), ([0, 10], [30, 40])]:
+        _check_update(model, rows, cols)
+
+def test_large_batch_refresh():
+    S = csr_matrix(nx.adjacency_matrix(nx.connected_caveman_graph(2, 7)), dtype=np.float64)
+    model = IncrementalSpectral(3, max_subspace=2, random_state=0).fit(S)
+    model.update([0, 1, 2], [7, 8, 9])
+
+    L = _laplacian(model)
+    w, U = model.eigenpairs()
+    assert np.allclose(w, np.linalg.eigvalsh(L)[:3], atol=1e-8)
+    assert np.allclose(L @ U, U * w, atol=1e-8)
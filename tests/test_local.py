@@ -0,0 +1,89 @@
+"""
+__author__ = Yash Patel
+__name__   = test_local.py
+__description__ = Regression tests of the push approximation of personalized PageRank and
+the sweep cut against dense computations on small graphs
+"""
+
+import networkx as nx
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from analysis.local import approximate_ppr, local_cluster, sweep_cut
+
+def _weighted_graph(seed=0):
+    rng = np.random.RandomState(seed)
+    G = nx.connected_caveman_graph(5, 8)
+    for u, v in G.edges:
+        G[u][v]["weight"] = rng.uniform(0.5, 2.0)
+    G.add_edge(3, 3, weight=1.5)
+    return csr_matrix(nx.adjacency_matrix(G), dtype=np.float64)
+
+def _dense_ppr(S, seed, alpha):
+    """Given a sparse similarity (adjacency) matrix S, a seed node, and the teleport
+    probability, solves for personalized PageRank on the lazy random walk
+    W = (I + D^-1 A) / 2, i.e. p = alpha chi_seed + (1 - alpha) p W
+
+    Returns PageRank (numpy array)
+    """
+    A = S.toarray()
+    n = A.shape[0]
+    W = (np.eye(n) + A / A.sum(axis=1)[:, np.newaxis]) / 2
+    chi = np.zeros(n)
+    chi[seed] = 1.0
+    return alpha * np.linalg.solve((np.eye(n) - (1 - alpha) * W).T, chi)
+
+def _dense(p, n):
+    dense = np.zeros(n)
+    dense[list(p.keys())] = list(p.values())
+    return dense
+
+@pytest.mark.parametrize("seed,alpha,eps", [(0, 0.15, 1e-3), (3, 0.05, 1e-4), (17, 0.01, 1e-5)])
+def test_ppr_within_push_tolerance(seed, alpha, eps):
+    S = _weighted_graph()
+    degrees = np.asarray(S.sum(axis=1)).ravel()
+    p, reached_degrees = approximate_ppr(S, seed, alpha=alpha, eps=eps)
+
+    # the push leaves a residual below eps * degree at every node, and the PageRank it
+    # still owes is at most the PageRank of that residual, which is at most eps * degrees
+    missing = _dense_ppr(S, seed, alpha) - _dense(p, S.shape[0])
+    assert np.all(missing >= -1e-12)
+    assert np.all(missing <= eps * degrees + 1e-12)
+    assert all(reached_degrees[u] == pytest.approx(degrees[u]) for u in p)
+
+def test_ppr_converges():
+    S = _weighted_graph(1)
+    p, _ = approximate_ppr(S, 5, alpha=0.1, eps=1e-10)
+    assert np.allclose(_dense(p, S.shape[0]), _dense_ppr(S, 5, 0.1), atol=1e-8)
+
+def test_sweep_cut_matches_dense_conductance():
+    S = _weighted_graph(2)
+    A = S.toarray()
+    degrees = A.sum(axis=1)
+    p, reached_degrees = approximate_ppr(S, 9, alpha=0.05, eps=1e-5)
+    cluster, conductance = sweep_cut(S, p, reached_degrees, total_volume=degrees.sum())
+
+    order = sorted(p.keys(), key=lambda u : p[u] / degrees[u], reverse=True)
+    best = np.inf
+    for size in range(1, len(order)):
+        inside = np.zeros(S.shape[0], dtype=bool)
+        inside[order[:size]] = True
+        cut = A[inside][:, ~inside].sum()
+        best = min(best, cut / min(degrees[inside].sum(), degrees[~inside].sum()))
+    assert conductance == pytest.approx(best)
+
+def test_local_cluster_finds_caves():
+    S = csr_matrix(nx.adjacency_matrix(nx.connected_caveman_graph(6, 10)), dtype=np.float64)
+    A = S.toarray()
+    cluster, conductance = local_cluster(S, 25, alpha=0.05, eps=1e-5,
+        total_volume=S.sum())
+
+    # the caves are only joined by single edges, so the cluster is made of whole caves
+    caves = { node // 10 for node in cluster }
+    assert 2 in caves and cluster == { node for cave in caves for node in
+        range(10 * cave, 10 * cave + 10) }
+    inside = np.zeros(S.shape[0], dtype=bool)
+    inside[list(cluster)] = True
+    assert conductance == pytest.approx(A[inside][:, ~inside].sum() /
+        min(A[inside].sum(), A[~inside].sum()))
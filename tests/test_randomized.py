@@ -0,0 +1,57 @@
+"""
+__author__ = Yash Patel
+__name__   = test_randomized.py
+__description__ = Regression tests of the randomized eigensolver against a dense eigensolve
+on small graphs
+"""
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from analysis.operators import LaplacianOperator
+from analysis.randomized import randomized_eigenpairs
+
+def _caveman(num_caves=4, cave_size=8):
+    return csr_matrix(nx.adjacency_matrix(nx.connected_caveman_graph(num_caves, cave_size)),
+        dtype=np.float64)
+
+def _assert_matches_dense(L, w, U, tol=1e-6):
+    """Given a Laplacian and the eigenpairs found for it, checks them against a dense
+    eigensolve: eigenvalues up to tol times the spectral radius (the power iterations run
+    on a shifted matrix of about that size) and the eigenvectors up to their span
+
+    Returns void
+    """
+    ref_w, ref_U = np.linalg.eigh(L)
+    k = len(w)
+    assert np.allclose(np.sort(w), ref_w[:k], atol=tol * ref_w[-1])
+    assert np.linalg.norm(U @ U.T - ref_U[:, :k] @ ref_U[:, :k].T) < 1e-3
+
+def test_matches_dense_combinatorial():
+    L = LaplacianOperator(_caveman()).toarray()
+    w, U, _ = randomized_eigenpairs(csr_matrix(L), 4, oversample=10, n_iter=16, random_state=0)
+    _assert_matches_dense(L, w, U)
+
+def test_matches_dense_operator():
+    L = LaplacianOperator(_caveman(num_caves=5, cave_size=6))
+    w, U, _ = randomized_eigenpairs(L, 5, oversample=10, n_iter=16, random_state=1)
+    _assert_matches_dense(L.toarray(), w, U)
+
+def test_matches_dense_normalized():
+    L = LaplacianOperator(_caveman(), normalize=True)
+    w, U, _ = randomized_eigenpairs(L, 4, oversample=10, n_iter=16, random_state=2)
+    _assert_matches_dense(L.toarray(), w, U)
+
+def test_residuals_are_reported():
+    S = _caveman()
+    L = LaplacianOperator(S)
+    w, U, residuals = randomized_eigenpairs(L, 3, oversample=2, n_iter=0, random_state=3)
+    assert np.allclose(residuals, np.linalg.norm(L.toarray() @ U - U * w, axis=0))
+
+def test_power_iterations_improve_accuracy():
+    L = LaplacianOperator(_caveman())
+    ref_w = np.linalg.eigvalsh(L.toarray())[:4]
+    errors = [np.abs(np.sort(randomized_eigenpairs(L, 4, oversample=10, n_iter=n_iter,
+        random_state=4)[0]) - ref_w).max() for n_iter in (2, 8, 16)]
+    assert errors[0] > errors[1] > errors[2]
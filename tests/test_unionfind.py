@@ -0,0 +1,62 @@
+"""
+__author__ = Yash Patel
+__name__   = test_unionfind.py
+__description__ = Regression tests of the array-backed union-find against the connected
+components of the same edges
+"""
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+from coarsen.unionfind import UnionFind
+
+def _components(n, a, b):
+    S = coo_matrix((np.ones(len(a)), (a, b)), shape=(n, n))
+    return connected_components(S, directed=False)[1]
+
+def _assert_same_partition(labels, reference):
+    """Given two labellings of the same nodes, checks that they induce the same partition,
+    i.e. that the label pairs are in one-to-one correspondence
+
+    Returns void
+    """
+    pairs = np.unique(np.stack((labels, reference)), axis=1)
+    assert pairs.shape[1] == len(np.unique(labels)) == len(np.unique(reference))
+
+def test_matches_connected_components():
+    rng = np.random.RandomState(0)
+    n = 500
+    a, b = rng.randint(0, n, 400), rng.randint(0, n, 400)
+
+    uf = UnionFind(n)
+    uf.union(a, b)
+    _assert_same_partition(uf.labels(), _components(n, a, b))
+
+def test_batches_and_growth():
+    rng = np.random.RandomState(1)
+    n = 2000
+    a, b = rng.randint(0, n, 1500), rng.randint(0, n, 1500)
+
+    uf = UnionFind()
+    for batch in np.array_split(np.arange(len(a)), 7):
+        uf.grow(int(max(a[batch].max(), b[batch].max())) + 1)
+        uf.union(a[batch], b[batch])
+    uf.grow(n)
+    _assert_same_partition(uf.labels(), _components(n, a, b))
+
+def test_conflicting_links():
+    # every edge of a star links to the same root in the first round, so all but one of
+    # the writes lose and have to be retried
+    n = 100
+    uf = UnionFind(n)
+    uf.union(np.zeros(n - 1, dtype=int), np.arange(1, n))
+    uf.union(np.arange(1, n), np.roll(np.arange(1, n), 1))
+    assert len(np.unique(uf.labels())) == 1
+
+def test_labels_are_compact():
+    uf = UnionFind(6)
+    uf.union([0, 4], [5, 2])
+    labels = uf.labels()
+    assert sorted(set(labels)) == list(range(4))
+    assert labels[0] == labels[5] and labels[2] == labels[4]